@@ -0,0 +1,403 @@
+"""
+对局基准测试
+用进程内的假 OneBot 客户端和假 Context 驱动完整对局（创建房间 → 加入 → 开始游戏 → 夜晚/白天命令 → 胜负），
+统计每个命令处理函数耗时的 p50/p99、每个阶段的平台 API 调用次数和每个已开局房间占用的内存。
+
+需要在装有 AstrBot 的环境中运行（与插件加载时的依赖相同），在插件目录下：
+    python benchmarks/bench_game.py --games 50 --players 9 --api-latency 5
+    python benchmarks/bench_game.py --json bench.json                # 保存结果
+    python benchmarks/bench_game.py --baseline bench.json            # 与保存的结果比较，退化时返回非零
+"""
+import argparse
+import asyncio
+import importlib
+import json
+import logging
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import Counter, defaultdict
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+from unittest import mock
+
+PLUGIN_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(PLUGIN_DIR))
+plugin_main = importlib.import_module(f"{os.path.basename(PLUGIN_DIR)}.main")
+
+from astrbot.api import logger  # noqa: E402
+from astrbot.api.star import StarTools  # noqa: E402
+from astrbot.core.message.components import Plain  # noqa: E402
+
+GamePhase = plugin_main.GamePhase
+PRESET_CONFIGS = plugin_main.PRESET_CONFIGS
+
+GROUP_BASE = 900000     # 假群号起点，每局一个群
+MAX_STEPS = 2000        # 单局最多驱动的步数，超过视为卡死
+PHASE_WAIT = 5.0        # 等待已死角色阶段自动跳过的最长时间（秒）
+AFTER_GAME = "结算"     # 房间移除后的调用（解禁、恢复群昵称等）归入的阶段
+
+# 基准测试的默认配置：关闭限速和AI复盘，超时足够长（已死角色的阶段立即跳过），结束时回滚所有房间
+BENCH_CONFIG = {
+    "enable_ai_review": False,
+    "resume_games_on_restart": False,
+    "rate_limit_global": 0,
+    "rate_limit_group": 0,
+    "rate_limit_user": 0,
+    "timeout_wolf": 3600,
+    "timeout_seer": 3600,
+    "timeout_witch": 3600,
+    "timeout_hunter": 3600,
+    "timeout_speaking": 3600,
+    "timeout_vote": 3600,
+    "timeout_dead_min": 0,
+    "timeout_dead_max": 0,
+}
+
+
+def percentile(samples: List[float], q: float) -> float:
+    """最近秩法分位数"""
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(q * len(ordered)) - 1))]
+
+
+class Recorder:
+    """记录命令耗时和平台 API 调用；调用按发生时房间所处的阶段归类"""
+
+    def __init__(self):
+        self.latency: Dict[str, List[float]] = defaultdict(list)  # 处理函数名 -> 耗时（秒）
+        self.api_calls: Counter = Counter()                        # (阶段, 调用名) -> 次数
+        self.enabled = True
+        self.plugin = None
+
+    def phase_of(self, group_id: Any = None, user_id: Any = None) -> str:
+        if group_id is None and user_id is not None:
+            group_id = self.plugin.player_rooms.get(str(user_id))
+        room = self.plugin.game_rooms.get(str(group_id)) if group_id is not None else None
+        return room.phase.value if room else AFTER_GAME
+
+    def api_call(self, action: str, group_id: Any = None, user_id: Any = None):
+        if self.enabled:
+            self.api_calls[(self.phase_of(group_id, user_id), action)] += 1
+
+
+class FakeBot:
+    """假 OneBot 客户端：记录每次调用（set_group_ban、send_private_msg 等），按配置的延迟返回"""
+
+    def __init__(self, recorder: Recorder, latency: float):
+        self.recorder = recorder
+        self.latency = latency
+
+    def __getattr__(self, action: str):
+        if action.startswith("_"):
+            raise AttributeError(action)
+
+        async def call(**params):
+            self.recorder.api_call(action, params.get("group_id"), params.get("user_id"))
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            return {}
+
+        return call
+
+
+class FakeContext:
+    """假 Context：群消息发送计入 send_message，平台适配器返回同一个假客户端"""
+
+    def __init__(self, recorder: Recorder, bot: FakeBot):
+        self.recorder = recorder
+        self.bot = bot
+
+    async def send_message(self, origin: str, chain):
+        self.recorder.api_call("send_message", group_id=origin.rsplit(":", 1)[-1])
+        if self.bot.latency:
+            await asyncio.sleep(self.bot.latency)
+
+    def get_platform(self, name: str):
+        return SimpleNamespace(get_client=lambda: self.bot)
+
+    def get_using_provider(self):
+        return None
+
+    def get_provider_by_id(self, provider_id: str):
+        return None
+
+
+class FakeEvent:
+    """假消息事件：只实现插件用到的接口"""
+
+    def __init__(self, bot: FakeBot, sender: str, text: str, group_id: Optional[str] = None):
+        self.bot = bot
+        self.message_str = text
+        self.sender = {"nickname": f"玩家{sender[-2:]}"}
+        self.unified_msg_origin = f"bench:GroupMessage:{group_id}" if group_id else f"bench:FriendMessage:{sender}"
+        self._sender_id = sender
+        self._group_id = group_id
+
+    def get_group_id(self) -> Optional[str]:
+        return self._group_id
+
+    def get_sender_id(self) -> str:
+        return self._sender_id
+
+    def is_private_chat(self) -> bool:
+        return self._group_id is None
+
+    def is_admin(self) -> bool:
+        return False
+
+    def get_messages(self) -> list:
+        return [Plain(self.message_str)]
+
+    def get_message_outline(self) -> str:
+        return self.message_str
+
+    def plain_result(self, text: str) -> str:
+        return text
+
+
+class Bench:
+    """按简单的随机策略驱动对局，每条命令都经过插件的处理函数"""
+
+    def __init__(self, plugin, bot: FakeBot, recorder: Recorder, seed: int):
+        self.plugin = plugin
+        self.bot = bot
+        self.recorder = recorder
+        self.rng = random.Random(seed)
+
+    async def command(self, handler: str, sender: str, text: str, group_id: Optional[str] = None, *args):
+        event = FakeEvent(self.bot, sender, text, group_id)
+        started = time.perf_counter()
+        result = getattr(self.plugin, handler)(event, *args)
+        if hasattr(result, "__aiter__"):
+            async for _ in result:
+                pass
+        else:
+            await result
+        if self.recorder.enabled:
+            self.recorder.latency[handler].append(time.perf_counter() - started)
+        await asyncio.sleep(0)  # 让出站队列和后台调用跑一轮
+
+    async def open_room(self, group_id: str, players: int):
+        ids = [f"{group_id}{i:02d}" for i in range(1, players + 1)]
+        await self.command("create_room", ids[0], "/创建房间", group_id, players)
+        for player in ids:
+            await self.command("join_room", player, "/加入房间", group_id)
+        await self.command("start_game", ids[0], "/开始游戏", group_id)
+
+    async def play(self, group_id: str, players: int):
+        await self.open_room(group_id, players)
+        for _ in range(MAX_STEPS):
+            room = self.plugin.game_rooms.get(group_id)
+            if room is None:
+                return
+            await self.step(group_id, room)
+        raise RuntimeError(f"群 {group_id} 的对局在 {MAX_STEPS} 步内没有结束")
+
+    async def wait_phase(self, group_id: str, room):
+        """已死角色的阶段由定时器跳过，等到阶段变化"""
+        phase = room.phase
+        deadline = time.monotonic() + PHASE_WAIT
+        while self.plugin.game_rooms.get(group_id) is room and room.phase == phase and not room.pending_hunter_shot:
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"群 {group_id} 卡在{phase.value}")
+            await asyncio.sleep(0.001)
+
+    async def step(self, group_id: str, room):
+        rng = self.rng
+        number = room.number_of
+        alive = sorted(room.alive, key=number)
+
+        if room.pending_hunter_shot:
+            hunter = room.pending_hunter_shot
+            target = rng.choice([p for p in alive if p != hunter])
+            await self.command("hunter_shoot", hunter, f"/开枪 {number(target)}")
+            return
+
+        phase = room.phase
+        if phase == GamePhase.NIGHT_WOLF:
+            wolves = [p for p in alive if room.role_of(p) == "werewolf"]
+            target = rng.choice([p for p in alive if room.role_of(p) != "werewolf"])
+            await self.command("werewolf_chat", wolves[0], f"/密谋 今晚刀{number(target)}号")
+            for wolf in wolves:
+                await self.command("werewolf_kill", wolf, f"/办掉 {number(target)}")
+        elif phase == GamePhase.NIGHT_SEER:
+            seer = next((p for p in room.members("seer") if p in room.alive), None)
+            if seer is None:
+                await self.wait_phase(group_id, room)
+            else:
+                target = rng.choice([p for p in alive if p != seer])
+                await self.command("seer_check", seer, f"/验人 {number(target)}")
+        elif phase == GamePhase.NIGHT_WITCH:
+            witch = next(iter(room.members("witch")), None)
+            if witch is None or (witch not in room.alive and room.last_killed != witch):
+                await self.wait_phase(group_id, room)
+                return
+            choice = rng.random()
+            if choice < 0.3 and room.last_killed and not room.witch_antidote_used:
+                await self.command("witch_save", witch, "/救人")
+            elif choice < 0.5 and not room.witch_poison_used:
+                target = rng.choice([p for p in alive if p != witch])
+                await self.command("witch_poison", witch, f"/毒人 {number(target)}")
+            else:
+                await self.command("witch_pass", witch, "/不操作")
+        elif phase == GamePhase.LAST_WORDS:
+            speaker = room.last_killed
+            await self.command("capture_speech", speaker, "我是好人，大家看清楚", group_id)
+            await self.command("finish_last_words", speaker, "/遗言完毕", group_id)
+        elif phase in (GamePhase.DAY_SPEAKING, GamePhase.DAY_PK):
+            speaker = room.current_speaker
+            await self.command("capture_speech", speaker, f"{number(speaker)}号发言：过", group_id)
+            await self.command("finish_speaking", speaker, "/发言完毕", group_id)
+        elif phase == GamePhase.DAY_VOTE:
+            pool = room.pk_players if room.is_pk_vote else alive
+            for voter in alive:
+                if self.plugin.game_rooms.get(group_id) is not room or room.phase != GamePhase.DAY_VOTE:
+                    break
+                choice = rng.random()
+                target = "0" if choice < 0.1 else str(number(rng.choice(pool[:2] if choice < 0.6 else pool)))
+                await self.command("day_vote", voter, f"/投票 {target}", group_id)
+        else:
+            await self.wait_phase(group_id, room)
+
+    async def room_memory(self, rooms: int, players: int) -> float:
+        """同时开 rooms 个房间，返回每个已开局房间新增的内存（字节）"""
+        tracemalloc.start()
+        try:
+            before = tracemalloc.get_traced_memory()[0]
+            for index in range(rooms):
+                await self.open_room(str(GROUP_BASE + 50000 + index), players)
+            await self.plugin.outbox.flush()
+            after = tracemalloc.get_traced_memory()[0]
+        finally:
+            tracemalloc.stop()
+        return (after - before) / rooms
+
+
+async def run(args, config: Dict[str, Any]) -> Dict[str, Any]:
+    with tempfile.TemporaryDirectory() as data_dir, \
+            mock.patch.object(StarTools, "get_data_dir", return_value=Path(data_dir)):
+        recorder = Recorder()
+        bot = FakeBot(recorder, args.api_latency / 1000)
+        plugin = plugin_main.WerewolfPlugin(FakeContext(recorder, bot), config)
+        recorder.plugin = plugin
+        await plugin.initialize()
+        bench = Bench(plugin, bot, recorder, args.seed)
+
+        started = time.perf_counter()
+        for index in range(args.games):
+            await bench.play(str(GROUP_BASE + index), args.players)
+        await plugin.outbox.flush()
+        elapsed = time.perf_counter() - started
+
+        recorder.enabled = False
+        memory = await bench.room_memory(args.rooms, args.players) if args.rooms > 0 else 0.0
+        await plugin.terminate()
+
+    api_calls: Dict[str, Dict[str, float]] = defaultdict(dict)
+    for (phase, action), count in sorted(recorder.api_calls.items()):
+        api_calls[phase][action] = count / args.games
+    return {
+        "params": {"games": args.games, "players": args.players, "api_latency_ms": args.api_latency, "seed": args.seed},
+        "elapsed": elapsed,
+        "latency_ms": {
+            handler: {
+                "count": len(samples),
+                "p50": percentile(samples, 0.5) * 1000,
+                "p99": percentile(samples, 0.99) * 1000,
+                "max": max(samples) * 1000,
+            }
+            for handler, samples in sorted(recorder.latency.items())
+        },
+        "api_calls_per_game": dict(api_calls),
+        "room_memory_bytes": memory,
+    }
+
+
+def format_report(result: Dict[str, Any]) -> str:
+    params = result["params"]
+    lines = [
+        f"{params['games']} 局 {params['players']} 人局，API 延迟 {params['api_latency_ms']} 毫秒，"
+        f"种子 {params['seed']}，耗时 {result['elapsed']:.1f} 秒",
+        "",
+        "命令处理耗时（毫秒）",
+        f"{'处理函数':<20} {'次数':>7} {'p50':>9} {'p99':>9} {'最大':>9}",
+    ]
+    for handler, stats in result["latency_ms"].items():
+        lines.append(f"{handler:<24} {stats['count']:>7} {stats['p50']:>9.3f} {stats['p99']:>9.3f} {stats['max']:>9.3f}")
+    lines += ["", "每局平台 API 调用（按阶段）", f"{'阶段':<16} {'调用':<24} {'每局次数':>8}"]
+    for phase, calls in result["api_calls_per_game"].items():
+        for action, count in calls.items():
+            lines.append(f"{phase:<18} {action:<24} {count:>12.2f}")
+    if result["room_memory_bytes"]:
+        lines += ["", f"每个已开局房间内存：{result['room_memory_bytes'] / 1024:.1f} KB"]
+    return "\n".join(lines)
+
+
+def compare(result: Dict[str, Any], baseline: Dict[str, Any], tolerance: float, floor_ms: float) -> List[str]:
+    """与基线比较，返回退化项：p99 变慢、每局 API 调用变多、房间内存变大"""
+    regressions = []
+    for handler, stats in result["latency_ms"].items():
+        old = baseline.get("latency_ms", {}).get(handler)
+        if old and stats["p99"] > old["p99"] * (1 + tolerance) and stats["p99"] - old["p99"] > floor_ms:
+            regressions.append(f"{handler} p99 {old['p99']:.3f} → {stats['p99']:.3f} 毫秒")
+    for phase, calls in result["api_calls_per_game"].items():
+        for action, count in calls.items():
+            old = baseline.get("api_calls_per_game", {}).get(phase, {}).get(action, 0.0)
+            if count > old * (1 + tolerance) + 0.01:
+                regressions.append(f"{phase} {action} 每局 {old:.2f} → {count:.2f} 次")
+    old_memory = baseline.get("room_memory_bytes") or 0
+    if old_memory and result["room_memory_bytes"] > old_memory * (1 + tolerance):
+        regressions.append(f"房间内存 {old_memory / 1024:.1f} → {result['room_memory_bytes'] / 1024:.1f} KB")
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="狼人杀插件对局基准测试")
+    parser.add_argument("--games", type=int, default=20, help="依次驱动的完整对局数")
+    parser.add_argument("--players", type=int, choices=sorted(PRESET_CONFIGS), default=9, help="每局人数")
+    parser.add_argument("--api-latency", type=float, default=0.0, help="假客户端每次调用的延迟（毫秒）")
+    parser.add_argument("--rooms", type=int, default=20, help="测内存时同时开局的房间数（0 为不测）")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子")
+    parser.add_argument("--config", action="append", default=[], metavar="KEY=VALUE",
+                        help="覆盖插件配置，VALUE 按 JSON 解析（可重复）")
+    parser.add_argument("--json", help="把结果写入 JSON 文件")
+    parser.add_argument("--baseline", help="与之前 --json 保存的结果比较")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="允许的相对退化（默认 20%%）")
+    parser.add_argument("--floor", type=float, default=1.0, help="p99 至少变慢这么多毫秒才算退化")
+    args = parser.parse_args(argv)
+
+    config = dict(BENCH_CONFIG)
+    for item in args.config:
+        key, _, value = item.partition("=")
+        try:
+            config[key] = json.loads(value)
+        except ValueError:
+            config[key] = value
+
+    logger.setLevel(logging.WARNING)
+    random.seed(args.seed)  # 插件内部的随机（身份分配、发言顺序）
+    result = asyncio.run(run(args, config))
+    print(format_report(result))
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(result, json.load(f), args.tolerance, args.floor)
+        if regressions:
+            print("\n性能退化：")
+            print("\n".join(f"  {line}" for line in regressions))
+            return 1
+        print("\n与基线相比没有退化")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
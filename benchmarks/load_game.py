@@ -0,0 +1,332 @@
+"""
+多群并发压测
+一个插件实例同时服务大量群：每个群有自己的玩家，按对数正态分布的思考时间发命令，偶尔挂机让超时推进，
+一局结束后接着开下一局。压测期间统计事件循环延迟、定时器相对配置 timeout_* 的漂移、出站调用速率、
+命令处理耗时和内存增长，输出报告，可保存为 JSON 与其他版本比较。
+
+复用 bench_game.py 的假客户端和假 Context，同样需要在装有 AstrBot 的环境中运行，在插件目录下：
+    python benchmarks/load_game.py --groups 500 --duration 300 --json load.json
+    python benchmarks/load_game.py --groups 500 --duration 300 --baseline load.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import math
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+from unittest import mock
+
+from bench_game import Bench, FakeBot, FakeContext, Recorder, StarTools, logger, percentile, plugin_main
+
+GROUP_BASE = 700000
+THINK_SIGMA = 0.8   # 思考时间对数正态分布的 σ（中位数由 --think 指定）
+POLL = 0.05         # 挂机或等待已死角色阶段时检查状态的间隔（秒）
+LAG_INTERVAL = 0.05 # 事件循环延迟的采样间隔（秒）
+
+# 压测默认配置：限速等其余配置保持插件默认值，超时缩短以便在压测时长内多走几轮
+LOAD_CONFIG = {
+    "enable_ai_review": False,
+    "resume_games_on_restart": False,
+    "timeout_wolf": 30,
+    "timeout_seer": 30,
+    "timeout_witch": 30,
+    "timeout_hunter": 30,
+    "timeout_speaking": 30,
+    "timeout_vote": 45,
+    "timeout_dead_min": 3,
+    "timeout_dead_max": 5,
+}
+
+
+def rss_bytes() -> int:
+    """当前进程的常驻内存；没有 /proc 时退回峰值"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    """毫秒为单位的 p50/p99/最大值"""
+    if not samples:
+        return {"count": 0, "p50": 0.0, "p99": 0.0, "max": 0.0}
+    return {
+        "count": len(samples),
+        "p50": percentile(samples, 0.5) * 1000,
+        "p99": percentile(samples, 0.99) * 1000,
+        "max": max(samples) * 1000,
+    }
+
+
+class LoadRecorder(Recorder):
+    """在按阶段计数之外，按秒统计出站调用"""
+
+    def __init__(self):
+        super().__init__()
+        self.started = time.monotonic()
+        self.per_second: Counter = Counter()  # 压测开始后的第几秒 -> 调用次数
+        self.by_action: Counter = Counter()
+
+    def api_call(self, action: str, group_id: Any = None, user_id: Any = None):
+        if self.enabled:
+            self.per_second[int(time.monotonic() - self.started)] += 1
+            self.by_action[action] += 1
+        super().api_call(action, group_id, user_id)
+
+
+class LoadBench(Bench):
+    """每个群一个协程：命令前有思考时间，每个阶段有一定概率挂机，靠超时推进"""
+
+    def __init__(self, plugin, bot: FakeBot, recorder: LoadRecorder, seed: int,
+                 think: float, afk: float, players: int):
+        super().__init__(plugin, bot, recorder, seed)
+        self.think = think
+        self.afk = afk
+        self.players = players
+        self.stopping = False
+        self.games_started = 0
+        self.games_finished = 0
+
+    def think_time(self) -> float:
+        return self.rng.lognormvariate(math.log(self.think), THINK_SIGMA)
+
+    async def command(self, handler: str, sender: str, text: str, group_id: Optional[str] = None, *args):
+        await asyncio.sleep(self.think_time())
+        if not self.stopping:
+            await super().command(handler, sender, text, group_id, *args)
+
+    @staticmethod
+    def state_of(room) -> tuple:
+        return room.phase, room.current_speaker, room.pending_hunter_shot, room.is_pk_vote, room.current_round
+
+    async def wait_phase(self, group_id: str, room):
+        """等到房间状态变化（超时推进、其他玩家操作或房间被清理）"""
+        state = self.state_of(room)
+        while (not self.stopping and self.plugin.game_rooms.get(group_id) is room
+               and self.state_of(room) == state):
+            await asyncio.sleep(POLL)
+
+    async def step(self, group_id: str, room):
+        if self.rng.random() < self.afk:
+            await self.wait_phase(group_id, room)
+        else:
+            await super().step(group_id, room)
+
+    async def run_group(self, group_id: str, delay: float):
+        await asyncio.sleep(delay)
+        while not self.stopping:
+            await self.open_room(group_id, self.players)
+            room = self.plugin.game_rooms.get(group_id)
+            if room is None or room.phase == plugin_main.GamePhase.WAITING:
+                return  # 开局失败（被压测停止打断）
+            self.games_started += 1
+            while not self.stopping:
+                room = self.plugin.game_rooms.get(group_id)
+                if room is None:
+                    self.games_finished += 1
+                    break
+                await self.step(group_id, room)
+
+
+def watch_timers(plugin, drift: Dict[str, List[float]]):
+    """串接共享调度器的 on_fire：回调开始执行时记录相对截止时间的延迟，按定时器标签分组"""
+    on_fire = plugin.timers._on_fire
+
+    def record(handle, late: float):
+        drift[handle.label or "未命名"].append(late)
+        if on_fire:
+            on_fire(handle, late)
+
+    plugin.timers._on_fire = record
+
+
+async def sample_loop(bench: LoadBench, recorder: LoadRecorder, lags: List[float], timeline: List[dict]):
+    """采样事件循环延迟，每秒记录一次房间数、定时器数、调用数和内存"""
+    loop = asyncio.get_running_loop()
+    window: List[float] = []
+    next_sample = loop.time() + 1
+    while not bench.stopping:
+        before = loop.time()
+        await asyncio.sleep(LAG_INTERVAL)
+        lag = max(0.0, loop.time() - before - LAG_INTERVAL)
+        lags.append(lag)
+        window.append(lag)
+        if loop.time() >= next_sample:
+            second = int(time.monotonic() - recorder.started)
+            timeline.append({
+                "t": second,
+                "rooms": len(bench.plugin.game_rooms),
+                "timers": len(bench.plugin.timers),
+                "calls": recorder.per_second.get(second - 1, 0),
+                "rss": rss_bytes(),
+                "lag_max_ms": max(window) * 1000,
+            })
+            window.clear()
+            next_sample += 1
+
+
+async def run(args, config: Dict[str, Any]) -> Dict[str, Any]:
+    with tempfile.TemporaryDirectory() as data_dir, \
+            mock.patch.object(StarTools, "get_data_dir", return_value=Path(data_dir)):
+        recorder = LoadRecorder()
+        bot = FakeBot(recorder, args.api_latency / 1000)
+        plugin = plugin_main.WerewolfPlugin(FakeContext(recorder, bot), config)
+        recorder.plugin = plugin
+        await plugin.initialize()
+        drift: Dict[str, List[float]] = defaultdict(list)
+        watch_timers(plugin, drift)
+
+        bench = LoadBench(plugin, bot, recorder, args.seed, args.think, args.afk, args.players)
+        lags: List[float] = []
+        timeline: List[dict] = []
+        rss_start = rss_bytes()
+        recorder.started = time.monotonic()
+        sampler = asyncio.create_task(sample_loop(bench, recorder, lags, timeline))
+        groups = [
+            asyncio.create_task(bench.run_group(str(GROUP_BASE + index), random.uniform(0, args.ramp)))
+            for index in range(args.groups)
+        ]
+        failures = Counter()
+        await asyncio.sleep(args.duration)
+        bench.stopping = True
+        for outcome in await asyncio.gather(*groups, return_exceptions=True):
+            if isinstance(outcome, Exception):
+                failures[f"{type(outcome).__name__}: {outcome}"] += 1
+        await sampler
+        elapsed = time.monotonic() - recorder.started
+        rss_end = rss_bytes()
+        recorder.enabled = False
+        await plugin.terminate()
+
+    seconds = [recorder.per_second.get(second, 0) for second in range(max(1, int(elapsed)))]
+    return {
+        "params": {
+            "groups": args.groups, "players": args.players, "duration": args.duration, "think": args.think,
+            "afk": args.afk, "api_latency_ms": args.api_latency, "seed": args.seed,
+            "timeouts": {key: value for key, value in sorted(config.items()) if key.startswith("timeout_")},
+        },
+        "games": {"started": bench.games_started, "finished": bench.games_finished},
+        "failures": dict(failures),
+        "loop_lag_ms": summarize(lags),
+        "timer_drift_ms": {label: summarize(samples) for label, samples in sorted(drift.items())},
+        "outbound": {
+            "total": sum(recorder.by_action.values()),
+            "mean_per_second": sum(seconds) / len(seconds),
+            "peak_per_second": max(seconds),
+            "by_action": dict(recorder.by_action.most_common()),
+        },
+        "latency_ms": {handler: summarize(samples) for handler, samples in sorted(recorder.latency.items())},
+        "memory": {
+            "rss_start": rss_start,
+            "rss_peak": max([rss_start, rss_end] + [point["rss"] for point in timeline]),
+            "rss_end": rss_end,
+        },
+        "timeline": timeline,
+    }
+
+
+def format_report(result: Dict[str, Any]) -> str:
+    params, games, memory = result["params"], result["games"], result["memory"]
+    mb = 1024 * 1024
+    lag = result["loop_lag_ms"]
+    outbound = result["outbound"]
+    lines = [
+        f"{params['groups']} 个群 × {params['players']} 人，压测 {params['duration']} 秒，思考时间中位数 {params['think']} 秒，"
+        f"挂机概率 {params['afk']:.0%}，API 延迟 {params['api_latency_ms']} 毫秒",
+        f"开局 {games['started']}，结束 {games['finished']}",
+        "",
+        f"事件循环延迟：p50 {lag['p50']:.2f} / p99 {lag['p99']:.2f} / 最大 {lag['max']:.2f} 毫秒",
+        f"出站调用：共 {outbound['total']} 次，平均 {outbound['mean_per_second']:.1f} 次/秒，峰值 {outbound['peak_per_second']} 次/秒",
+        "  " + "，".join(f"{action} {count}" for action, count in outbound["by_action"].items()),
+        f"内存（RSS）：开始 {memory['rss_start'] / mb:.1f} MB，峰值 {memory['rss_peak'] / mb:.1f} MB，"
+        f"结束 {memory['rss_end'] / mb:.1f} MB，增长 {(memory['rss_end'] - memory['rss_start']) / mb:+.1f} MB",
+        "",
+        "定时器漂移（实际触发 - 截止时间，毫秒）",
+        f"{'定时器':<16} {'次数':>7} {'p50':>9} {'p99':>9} {'最大':>9}",
+    ]
+    for label, stats in result["timer_drift_ms"].items():
+        lines.append(f"{label:<18} {stats['count']:>7} {stats['p50']:>9.2f} {stats['p99']:>9.2f} {stats['max']:>9.2f}")
+    lines += ["", "命令处理耗时（毫秒）", f"{'处理函数':<20} {'次数':>7} {'p50':>9} {'p99':>9} {'最大':>9}"]
+    for handler, stats in result["latency_ms"].items():
+        lines.append(f"{handler:<24} {stats['count']:>7} {stats['p50']:>9.3f} {stats['p99']:>9.3f} {stats['max']:>9.3f}")
+    if result["failures"]:
+        lines += ["", "群协程异常："] + [f"  {count} × {error}" for error, count in result["failures"].items()]
+    return "\n".join(lines)
+
+
+def headline(result: Dict[str, Any]) -> Dict[str, float]:
+    """用于版本间比较的关键指标"""
+    drift = [stats["p99"] for stats in result["timer_drift_ms"].values()]
+    latency = [stats["p99"] for stats in result["latency_ms"].values()]
+    memory = result["memory"]
+    return {
+        "结束局数": result["games"]["finished"],
+        "事件循环延迟 p99（毫秒）": result["loop_lag_ms"]["p99"],
+        "事件循环延迟最大（毫秒）": result["loop_lag_ms"]["max"],
+        "定时器漂移 p99 最大值（毫秒）": max(drift, default=0.0),
+        "命令耗时 p99 最大值（毫秒）": max(latency, default=0.0),
+        "平均出站调用（次/秒）": result["outbound"]["mean_per_second"],
+        "峰值出站调用（次/秒）": result["outbound"]["peak_per_second"],
+        "内存增长（MB）": (memory["rss_end"] - memory["rss_start"]) / (1024 * 1024),
+    }
+
+
+def format_comparison(result: Dict[str, Any], baseline: Dict[str, Any]) -> str:
+    lines = [f"{'指标':<24} {'基线':>10} {'本次':>10} {'变化':>8}"]
+    old = headline(baseline)
+    for name, value in headline(result).items():
+        before = old.get(name, 0.0)
+        change = f"{(value - before) / before:+.0%}" if before else "-"
+        lines.append(f"{name:<26} {before:>10.2f} {value:>10.2f} {change:>8}")
+    return "\n".join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="狼人杀插件多群并发压测")
+    parser.add_argument("--groups", type=int, default=500, help="同时进行游戏的群数")
+    parser.add_argument("--players", type=int, choices=sorted(plugin_main.PRESET_CONFIGS), default=9, help="每局人数")
+    parser.add_argument("--duration", type=float, default=300, help="压测时长（秒）")
+    parser.add_argument("--ramp", type=float, default=30, help="各群在这段时间内随机陆续开局（秒）")
+    parser.add_argument("--think", type=float, default=3.0, help="玩家思考时间的中位数（秒）")
+    parser.add_argument("--afk", type=float, default=0.05, help="每个阶段挂机不操作的概率")
+    parser.add_argument("--api-latency", type=float, default=20.0, help="假客户端每次调用的延迟（毫秒）")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子")
+    parser.add_argument("--config", action="append", default=[], metavar="KEY=VALUE",
+                        help="覆盖插件配置，VALUE 按 JSON 解析（可重复）")
+    parser.add_argument("--json", help="把结果写入 JSON 文件")
+    parser.add_argument("--baseline", help="与之前 --json 保存的结果并列比较关键指标")
+    args = parser.parse_args(argv)
+
+    config = dict(LOAD_CONFIG)
+    for item in args.config:
+        key, _, value = item.partition("=")
+        try:
+            config[key] = json.loads(value)
+        except ValueError:
+            config[key] = value
+
+    logger.setLevel(logging.WARNING)
+    random.seed(args.seed)
+    result = asyncio.run(run(args, config))
+    print(format_report(result))
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            print("\n" + format_comparison(result, json.load(f)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,10 @@
+"""狼人杀游戏核心模块（不依赖 AstrBot，可单独导入）"""
+from .engine import GameEngine, RuleViolation, check_victory
+from .events import Action, Event, EventLog
+from .phases import GamePhase
+from .room import GameRecord, Player, Room, RoomConfig, RoleDelivery, SpeechBuffer
+
+__all__ = [
+    "Action", "Event", "EventLog", "GameEngine", "GamePhase", "GameRecord",
+    "Player", "Room", "RoomConfig", "RoleDelivery", "RuleViolation", "SpeechBuffer", "check_victory",
+]
@@ -0,0 +1,108 @@
+"""
+AI 复盘缓存
+按内容寻址：键是 (模型, 提示词, 规范化后的游戏数据) 的哈希，同一局游戏重复请求复盘时直接返回，
+不再调用模型。每条缓存是缓存目录下的一个文本文件，命中时刷新修改时间，
+总大小超过上限时从最久未使用的开始删除。
+"""
+import hashlib
+import os
+import re
+from collections import OrderedDict
+from typing import Optional
+
+_BLANK_LINES = re.compile(r"\n{3,}")
+
+
+def normalize_text(text: str) -> str:
+    """去掉行尾空白、合并连续空行，避免排版差异导致缓存不命中"""
+    text = "\n".join(line.rstrip() for line in text.strip().splitlines())
+    return _BLANK_LINES.sub("\n\n", text)
+
+
+def cache_key(*parts: str) -> str:
+    """把若干段文本规范化后拼接求 SHA-256"""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(normalize_text(part or "").encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class ReviewCache:
+    """磁盘 LRU 缓存（每条一个文件，总大小不超过 max_bytes，<= 0 表示不缓存）"""
+
+    SUFFIX = ".txt"
+
+    def __init__(self, cache_dir: str, max_bytes: int):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._sizes: "OrderedDict[str, int]" = OrderedDict()  # 键 -> 文件大小，按最近使用排序
+        self._total = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def __len__(self) -> int:
+        return len(self._sizes)
+
+    def load(self):
+        """扫描缓存目录，按修改时间恢复使用顺序，并按当前上限淘汰"""
+        if not self.enabled:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        entries = []
+        with os.scandir(self.cache_dir) as it:
+            for entry in it:
+                if entry.is_file() and entry.name.endswith(self.SUFFIX):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, entry.name[:-len(self.SUFFIX)], stat.st_size))
+        for _, key, size in sorted(entries):
+            self._sizes[key] = size
+            self._total += size
+        self._evict()
+
+    def get(self, key: str) -> Optional[str]:
+        """读取缓存，命中时标记为最近使用"""
+        if key not in self._sizes:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                text = f.read()
+            os.utime(path)
+        except OSError:
+            self._total -= self._sizes.pop(key)
+            return None
+        self._sizes.move_to_end(key)
+        return text
+
+    def put(self, key: str, text: str):
+        """写入缓存（先写临时文件再原子替换），然后淘汰超出上限的旧条目"""
+        if not self.enabled or not text:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._path(key)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+
+        self._total -= self._sizes.pop(key, 0)
+        size = os.path.getsize(path)
+        self._sizes[key] = size
+        self._total += size
+        self._evict()
+
+    def _evict(self):
+        # 至少保留刚写入的一条，即使它本身超过上限
+        while self._total > self.max_bytes and len(self._sizes) > 1:
+            key, size = self._sizes.popitem(last=False)
+            self._total -= size
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key + self.SUFFIX)
@@ -0,0 +1,598 @@
+"""
+规则引擎
+纯同步、不做任何 I/O：每个方法接收一个玩家动作（或阶段超时），修改 Room 状态，
+返回需要对外执行的效果列表（发群消息、禁言、开始某人的发言、启动下一阶段的计时……）。
+插件只负责把聊天命令翻译成引擎调用，再把效果翻译成平台调用；
+离线模拟直接循环调用引擎即可，不需要任何聊天平台。
+
+不合规则的动作抛出 RuleViolation，消息可以直接回复给玩家。
+"""
+import random
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from .events import Action
+from .phases import GamePhase
+from .room import Room
+
+ABSTAIN = "ABSTAIN"  # day_votes 中表示弃票
+
+
+class RuleViolation(Exception):
+    """玩家动作不符合规则"""
+
+
+# ========== 效果 ==========
+
+class NightFell(NamedTuple):
+    """入夜，轮到狼人行动（reason 为本轮无人出局的原因）"""
+    reason: Optional[str]
+
+
+class WolvesDone(NamedTuple):
+    """狼人行动结束，轮到预言家"""
+    acted: bool       # 是否选出了目标
+    timed_out: bool
+    seer_alive: bool
+
+
+class SeerResult(NamedTuple):
+    """预言家验人结果"""
+    seer: str
+    target: str
+    is_werewolf: bool
+
+
+class SeerTimedOut(NamedTuple):
+    seer_alive: bool
+
+
+class WitchTurn(NamedTuple):
+    """轮到女巫"""
+    witch: str
+    killed: Optional[str]  # 今晚被刀的玩家
+    active: bool           # 女巫存活或今晚被刀（可以救自己），需要完整的行动时间
+
+
+class WitchTimedOut(NamedTuple):
+    witch_alive: bool
+
+
+class Dawn(NamedTuple):
+    """天亮公布夜晚死讯"""
+    killed: Optional[str]
+    poisoned: Optional[str]
+    last_words: Optional[str]  # 留遗言的玩家（只有第一晚被刀才有）
+
+
+class Silenced(NamedTuple):
+    """玩家出局且不会再发言，需要禁言"""
+    player: str
+
+
+class HunterTurn(NamedTuple):
+    """猎人可以开枪"""
+    hunter: str
+    cause: str  # "wolf" / "vote"
+
+
+class HunterShot(NamedTuple):
+    hunter: str
+    target: str
+
+
+class HunterTimedOut(NamedTuple):
+    hunter: str
+
+
+class SpeakerTurn(NamedTuple):
+    """轮到某人发言（遗言、白天发言或 PK 发言）"""
+    player: str
+    phase: GamePhase
+    index: int
+    total: int
+
+
+class SpeakerDone(NamedTuple):
+    """某人发言结束"""
+    player: str
+    phase: GamePhase
+    timed_out: bool
+
+
+class TieBreak(NamedTuple):
+    """投票平票，进入 PK 发言"""
+    players: Tuple[str, ...]
+
+
+class VoteOpened(NamedTuple):
+    """开始投票（candidates 为空表示可以投任何存活玩家）"""
+    candidates: Tuple[str, ...]
+
+
+class VoteTimedOut(NamedTuple):
+    voted: int
+    alive: int
+
+
+class Exiled(NamedTuple):
+    player: str
+    pk: bool
+
+
+class GameOver(NamedTuple):
+    winning_faction: str  # "werewolf" / "villager"
+    message: str
+
+
+Effects = List[NamedTuple]
+
+
+def check_victory(room: Room) -> Tuple[str, Optional[str]]:
+    """检查胜利条件，返回 (胜利消息, 胜利阵营)，未分出胜负时返回 ("", None)"""
+    alive_werewolves = room.alive_wolf_count
+    alive_goods = len(room.alive) - alive_werewolves
+
+    if alive_werewolves == 0:
+        return ("好人胜利！所有狼人已被放逐！", "villager")
+    elif alive_goods <= alive_werewolves:
+        return ("狼人胜利！好人数量不足！", "werewolf")
+    elif room.alive_god_count == 0:
+        return ("狼人胜利！所有神职人员已出局！", "werewolf")
+    return ("", None)
+
+
+# 夜晚行动身份 -> (行动阶段, 阶段不对的提示, 身份不对的提示)
+_NIGHT_ACTORS = {
+    "werewolf": (GamePhase.NIGHT_WOLF, "⚠️ 现在不是狼人行动阶段！", "❌ 你不是狼人！"),
+    "seer": (GamePhase.NIGHT_SEER, "⚠️ 现在不是预言家验人阶段！", "❌ 你不是预言家！"),
+    "witch": (GamePhase.NIGHT_WITCH, "⚠️ 现在不是女巫行动阶段！", "❌ 你不是女巫！"),
+}
+
+
+class GameEngine:
+    """狼人杀规则
+
+    分配身份和狼人平票时使用 rng（默认为 random 模块的全局随机数），模拟时传入带种子的 Random 即可复现
+    """
+
+    def __init__(self, rng: Optional[random.Random] = None):
+        self.rng = rng or random
+
+    # ========== 开局 ==========
+
+    def start(self, room: Room):
+        """按加入顺序分配编号、随机分配身份，进入第一晚（开局公告和狼人计时由调用方处理）"""
+        for number, player in enumerate(room.players.values(), start=1):
+            player.number = number
+            room.number_to_player[number] = player.id
+
+        roles_pool = room.config.roles_pool()
+        self.rng.shuffle(roles_pool)
+        for player, role in zip(room.players.values(), roles_pool):
+            player.role = role
+
+        room.build_role_index()
+        room.seer_checked = False
+        room.is_first_night = True
+        room.phase = GamePhase.NIGHT_WOLF
+        room.current_round = 1
+        room.log(Action.NIGHT_START)
+
+    # ========== 行动者校验 ==========
+
+    def check_actor(self, room: Room, player: str, role: str):
+        """校验 player 现在能否以 role 的身份行动（阶段、身份、存活、本轮是否已行动）
+
+        动作方法自己会先调用；插件在解析目标之前也调用一次，这样非本身份、已出局或不在阶段内的玩家
+        先看到身份/阶段错误，而不是目标格式提示
+        """
+        if role == "hunter":
+            # 猎人在死亡后开枪，不校验阶段和存活
+            if room.role_of(player) != "hunter":
+                raise RuleViolation("❌ 你不是猎人！")
+            if room.pending_hunter_shot != player:
+                if room.hunter_death_type == "poison" and player not in room.alive:
+                    raise RuleViolation("❌ 你被女巫毒死，不能开枪！")
+                raise RuleViolation("❌ 当前不能开枪！")
+            return
+
+        phase, phase_error, role_error = _NIGHT_ACTORS[role]
+        if room.phase != phase:
+            raise RuleViolation(phase_error)
+        if room.role_of(player) != role:
+            raise RuleViolation(role_error)
+        if player not in room.alive:
+            # 今晚被刀的女巫在天亮前仍算存活，可以救自己
+            raise RuleViolation("❌ 你已经出局了！")
+        if role == "seer" and room.seer_checked:
+            raise RuleViolation("❌ 你今晚已经验过人了！")
+        if role == "witch" and room.witch_acted:
+            raise RuleViolation("❌ 你今晚已经行动过了！")
+
+    # ========== 夜晚 ==========
+
+    def wolf_vote(self, room: Room, wolf: str, target: str) -> Effects:
+        """狼人投刀（可以刀任何存活玩家，包括队友和自己），全部狼人投完后结算"""
+        self.check_actor(room, wolf, "werewolf")
+        if target not in room.alive:
+            raise RuleViolation("❌ 目标玩家已经出局！")
+
+        room.night_votes[wolf] = target
+        room.log(Action.WOLF_VOTE, wolf, target)
+        if len(room.night_votes) >= room.alive_wolf_count:
+            return self._resolve_wolves(room, timed_out=False)
+        return []
+
+    def wolf_timeout(self, room: Room) -> Effects:
+        """狼人行动超时：按已有的票结算"""
+        if room.phase != GamePhase.NIGHT_WOLF:
+            return []
+        return self._resolve_wolves(room, timed_out=True)
+
+    def _resolve_wolves(self, room: Room, timed_out: bool) -> Effects:
+        # 被刀的玩家要等女巫行动后才确定死亡，这里只记下来
+        if room.night_votes:
+            vote_counts: Dict[str, int] = {}
+            for target in room.night_votes.values():
+                vote_counts[target] = vote_counts.get(target, 0) + 1
+            max_votes = max(vote_counts.values())
+            room.last_killed = self.rng.choice([pid for pid, count in vote_counts.items() if count == max_votes])
+            room.log(Action.WOLF_KILL, target=room.last_killed)
+        else:
+            room.last_killed = None
+            room.log(Action.WOLF_TIMEOUT if timed_out else Action.WOLF_IDLE)
+        room.night_votes = {}
+
+        # 不管预言家是否存活都进入验人阶段，避免泄露身份
+        room.phase = GamePhase.NIGHT_SEER
+        room.seer_checked = False
+        return [WolvesDone(room.last_killed is not None, timed_out, bool(room.alive_members("seer")))]
+
+    def seer_check(self, room: Room, seer: str, target: str) -> Effects:
+        """预言家验人，随后轮到女巫"""
+        self.check_actor(room, seer, "seer")
+        if target == seer:
+            raise RuleViolation("❌ 不能验证自己！")
+
+        room.seer_checked = True
+        is_werewolf = room.role_of(target) == "werewolf"
+        room.log(Action.SEER_WOLF if is_werewolf else Action.SEER_GOOD, seer, target)
+        return [SeerResult(seer, target, is_werewolf)] + self._enter_witch(room)
+
+    def seer_timeout(self, room: Room) -> Effects:
+        if room.phase != GamePhase.NIGHT_SEER:
+            return []
+        room.seer_checked = True
+        return [SeerTimedOut(bool(room.alive_members("seer")))] + self._enter_witch(room)
+
+    def _enter_witch(self, room: Room) -> Effects:
+        # 女巫不管是否存活都要轮到（避免泄露身份）；没有女巫的配置直接天亮
+        witch = next(iter(room.members("witch")), None)
+        if witch is None:
+            return self._dawn(room)
+        room.phase = GamePhase.NIGHT_WITCH
+        room.witch_acted = False
+        room.witch_saved = None
+        room.witch_poisoned = None
+        active = witch in room.alive or room.last_killed == witch
+        return [WitchTurn(witch, room.last_killed, active)]
+
+    def witch_save(self, room: Room, witch: str) -> Effects:
+        """女巫使用解药救今晚被刀的玩家"""
+        self.check_actor(room, witch, "witch")
+        if room.witch_antidote_used:
+            raise RuleViolation("❌ 解药已经用过了！")
+        if not room.last_killed:
+            raise RuleViolation("❌ 今晚没有人被杀，无法使用解药！")
+
+        room.witch_saved = room.last_killed
+        room.witch_antidote_used = True
+        room.witch_acted = True
+        room.log(Action.WITCH_SAVE, witch, room.last_killed)
+        return self._dawn(room)
+
+    def witch_poison(self, room: Room, witch: str, target: str) -> Effects:
+        """女巫使用毒药"""
+        self.check_actor(room, witch, "witch")
+        if room.witch_poison_used:
+            raise RuleViolation("❌ 毒药已经用过了！")
+        if target not in room.alive:
+            raise RuleViolation("❌ 目标玩家已经出局！")
+        if target == witch:
+            raise RuleViolation("❌ 不能毒自己！")
+
+        room.witch_poisoned = target
+        room.witch_poison_used = True
+        room.witch_acted = True
+        room.log(Action.WITCH_POISON, witch, target)
+        return self._dawn(room)
+
+    def witch_pass(self, room: Room, witch: str) -> Effects:
+        """女巫不操作"""
+        self.check_actor(room, witch, "witch")
+        room.witch_acted = True
+        room.log(Action.WITCH_PASS, witch)
+        return self._dawn(room)
+
+    def witch_timeout(self, room: Room) -> Effects:
+        if room.phase != GamePhase.NIGHT_WITCH:
+            return []
+        room.witch_acted = True
+        witch = next(iter(room.members("witch")), None)
+        return [WitchTimedOut(witch in room.alive)] + self._dawn(room)
+
+    def _dawn(self, room: Room) -> Effects:
+        """结算夜晚死亡：被刀（未被救）和被毒的玩家出局"""
+        killed = None if room.witch_saved else room.last_killed
+        poisoned = room.witch_poisoned
+        room.last_killed = killed
+        for player_id in (killed, poisoned):
+            if player_id:
+                room.kill(player_id)
+
+        # 被毒的猎人不能开枪；只被刀的猎人可以
+        if poisoned and room.role_of(poisoned) == "hunter":
+            room.hunter_death_type = "poison"
+        elif killed and room.role_of(killed) == "hunter":
+            room.pending_hunter_shot = killed
+            room.hunter_death_type = "wolf"
+
+        last_words = killed if room.is_first_night else None
+        effects: Effects = [Dawn(killed, poisoned, last_words)]
+        if poisoned:
+            effects.append(Silenced(poisoned))  # 被毒没有遗言
+
+        game_over = self._check_game_over(room)
+        if game_over:
+            return effects + game_over
+        if room.pending_hunter_shot:
+            room.phase = GamePhase.HUNTER_SHOT
+            return effects + [HunterTurn(room.pending_hunter_shot, "wolf")]
+        return effects + self._after_night(room)
+
+    def _after_night(self, room: Room) -> Effects:
+        # 第一晚被刀有遗言，之后的夜晚没有
+        if room.is_first_night and room.last_killed:
+            return self._start_last_words(room, room.last_killed, from_vote=False)
+        effects: Effects = [Silenced(room.last_killed)] if room.last_killed else []
+        return effects + self._start_speaking(room)
+
+    # ========== 猎人 ==========
+
+    def hunter_shoot(self, room: Room, hunter: str, target: str) -> Effects:
+        """猎人开枪带走一名存活玩家"""
+        self.check_actor(room, hunter, "hunter")
+        if target not in room.alive:
+            raise RuleViolation(f"❌ {room.display_name(target)} 已经出局！")
+        if target == hunter:
+            raise RuleViolation("❌ 不能开枪带走自己！")
+
+        room.kill(target)
+        room.hunter_shot = True
+        room.pending_hunter_shot = None
+        room.log(Action.HUNTER_SHOT, hunter, target)
+        return [HunterShot(hunter, target), Silenced(target)] + self._after_hunter(room)
+
+    def hunter_timeout(self, room: Room) -> Effects:
+        """猎人开枪超时，放弃开枪"""
+        hunter = room.pending_hunter_shot
+        if not hunter:
+            return []
+        room.pending_hunter_shot = None
+        room.hunter_shot = True
+        room.log(Action.HUNTER_TIMEOUT, hunter)
+        return [HunterTimedOut(hunter)] + self._after_hunter(room)
+
+    def _after_hunter(self, room: Room) -> Effects:
+        game_over = self._check_game_over(room)
+        if game_over:
+            return game_over
+        if room.hunter_death_type == "vote":
+            return self._start_last_words(room, room.last_killed, from_vote=True)
+        return self._after_night(room)
+
+    # ========== 遗言与发言 ==========
+
+    def _start_last_words(self, room: Room, player: str, from_vote: bool) -> Effects:
+        room.phase = GamePhase.LAST_WORDS
+        room.last_killed = player
+        room.last_words_from_vote = from_vote
+        room.current_speech.clear()
+        return [SpeakerTurn(player, GamePhase.LAST_WORDS, 0, 1)]
+
+    def finish_last_words(self, room: Room, player: str) -> Effects:
+        """遗言完毕（记录捕获到的遗言）"""
+        if room.phase != GamePhase.LAST_WORDS:
+            raise RuleViolation("⚠️ 现在不是遗言阶段！")
+        if room.last_killed != player:
+            raise RuleViolation("⚠️ 只有被杀的玩家才能使用此命令！")
+        self._log_speech(room, Action.LAST_WORDS, player)
+        return [SpeakerDone(player, GamePhase.LAST_WORDS, False)] + self._end_last_words(room)
+
+    def last_words_timeout(self, room: Room) -> Effects:
+        if room.phase != GamePhase.LAST_WORDS:
+            return []
+        self._log_speech(room, Action.LAST_WORDS, room.last_killed)
+        return [SpeakerDone(room.last_killed, GamePhase.LAST_WORDS, True)] + self._end_last_words(room)
+
+    def _end_last_words(self, room: Room) -> Effects:
+        effects: Effects = [Silenced(room.last_killed)]
+        if room.last_words_from_vote:
+            return effects + self._enter_night(room)
+        return effects + self._start_speaking(room)
+
+    def _start_speaking(self, room: Room) -> Effects:
+        """白天按编号顺序发言"""
+        room.is_first_night = False
+        room.last_killed = None
+        room.phase = GamePhase.DAY_SPEAKING
+        room.speaking_order = sorted(room.alive, key=lambda pid: room.number_of(pid, 999))
+        room.current_speaker_index = 0
+        return self._next_speaker(room)
+
+    def _next_speaker(self, room: Room) -> Effects:
+        order = room.pk_players if room.phase == GamePhase.DAY_PK else room.speaking_order
+        if room.current_speaker_index >= len(order):
+            return self._open_vote(room)
+        room.current_speaker = order[room.current_speaker_index]
+        room.current_speech.clear()
+        return [SpeakerTurn(room.current_speaker, room.phase, room.current_speaker_index, len(order))]
+
+    def finish_speech(self, room: Room, player: str) -> Effects:
+        """当前发言者（或 PK 发言者）发言完毕"""
+        if room.phase not in (GamePhase.DAY_SPEAKING, GamePhase.DAY_PK):
+            raise RuleViolation("⚠️ 现在不是发言阶段！")
+        if room.current_speaker != player:
+            raise RuleViolation("⚠️ 现在不是你的发言时间！")
+        phase = room.phase
+        self._log_current_speech(room)
+        room.current_speaker_index += 1
+        return [SpeakerDone(player, phase, False)] + self._next_speaker(room)
+
+    def speech_timeout(self, room: Room) -> Effects:
+        if room.phase not in (GamePhase.DAY_SPEAKING, GamePhase.DAY_PK):
+            return []
+        self._log_current_speech(room)
+        effects: Effects = [SpeakerDone(room.current_speaker, room.phase, True)]
+        room.current_speaker_index += 1
+        return effects + self._next_speaker(room)
+
+    def skip_to_vote(self, room: Room) -> Effects:
+        """跳过剩余发言直接投票（发言阶段进入普通投票，PK 发言阶段进入 PK 投票）"""
+        if room.phase not in (GamePhase.DAY_SPEAKING, GamePhase.DAY_PK):
+            raise RuleViolation("⚠️ 现在不是发言阶段！")
+        effects: Effects = []
+        if room.current_speaker:
+            self._log_current_speech(room)
+            effects.append(SpeakerDone(room.current_speaker, room.phase, False))
+        return effects + self._open_vote(room)
+
+    def _log_current_speech(self, room: Room):
+        action = Action.PK_SPEECH if room.phase == GamePhase.DAY_PK else Action.SPEECH
+        self._log_speech(room, action, room.current_speaker)
+
+    def _log_speech(self, room: Room, action: Action, player: str):
+        # 发言结束（完毕、超时或被跳过）时把这一轮写入事件日志；没有捕获到文字（例如纯表情）也记录一条
+        room.log(action, player, text=room.current_speech.text())
+        room.current_speech.clear()
+
+    # ========== 投票 ==========
+
+    def _open_vote(self, room: Room) -> Effects:
+        room.is_pk_vote = room.phase == GamePhase.DAY_PK
+        room.phase = GamePhase.DAY_VOTE
+        room.day_votes = {}
+        room.current_speaker = None
+        return [VoteOpened(tuple(room.pk_players) if room.is_pk_vote else ())]
+
+    def day_vote(self, room: Room, voter: str, target: Optional[str]) -> Effects:
+        """白天投票（target 为 None 表示弃票），所有存活玩家投完后结算"""
+        if room.phase != GamePhase.DAY_VOTE:
+            raise RuleViolation("⚠️ 现在不是投票阶段！使用 /开始投票 进入投票")
+        if voter not in room.players:
+            raise RuleViolation("❌ 你不在游戏中！")
+        if voter not in room.alive:
+            raise RuleViolation("❌ 你已经出局了！")
+        if target is not None:
+            if target not in room.alive:
+                raise RuleViolation("❌ 目标玩家已经出局！")
+            if room.is_pk_vote and target not in room.pk_players:
+                raise RuleViolation(
+                    "❌ PK投票只能投给平票玩家！(或输入 0 弃票)\n\n"
+                    "可投票对象：\n" + "\n".join(f"  • {room.display_name(pid)}" for pid in room.pk_players)
+                )
+
+        if target is None:
+            room.day_votes[voter] = ABSTAIN
+            room.log(Action.PK_ABSTAIN if room.is_pk_vote else Action.ABSTAIN, voter)
+        else:
+            room.day_votes[voter] = target
+            room.log(Action.PK_VOTE if room.is_pk_vote else Action.VOTE, voter, target)
+
+        if len(room.day_votes) >= len(room.alive):
+            return self._resolve_vote(room)
+        return []
+
+    def vote_timeout(self, room: Room) -> Effects:
+        """投票超时：按已有的票结算，没有人投票则直接入夜"""
+        if room.phase != GamePhase.DAY_VOTE:
+            return []
+        effects: Effects = [VoteTimedOut(len(room.day_votes), len(room.alive))]
+        if room.day_votes:
+            return effects + self._resolve_vote(room)
+        room.log(Action.VOTE_TIMEOUT)
+        return effects + self._enter_night(room, "无人投票")
+
+    def _resolve_vote(self, room: Room) -> Effects:
+        pk = room.is_pk_vote
+        valid_votes = [target for target in room.day_votes.values() if target != ABSTAIN]
+        if not valid_votes:
+            return self._no_exile(room, f"{len(room.day_votes)}人弃票")
+
+        vote_counts: Dict[str, int] = {}
+        for target in valid_votes:
+            vote_counts[target] = vote_counts.get(target, 0) + 1
+        max_votes = max(vote_counts.values())
+        targets = sorted(
+            (pid for pid, count in vote_counts.items() if count == max_votes),
+            key=lambda pid: room.number_of(pid, 999),
+        )
+
+        if len(targets) > 1:
+            if pk:
+                return self._no_exile(room, "PK再次平票")
+            # 第一次投票平票：平票玩家依次 PK 发言后再投一次
+            room.pk_players = targets
+            room.phase = GamePhase.DAY_PK
+            room.day_votes = {}
+            room.current_speaker_index = 0
+            return [TieBreak(tuple(targets))] + self._next_speaker(room)
+
+        exiled = targets[0]
+        room.is_pk_vote = False
+        room.pk_players = []
+        room.day_votes = {}
+        room.kill(exiled)
+        room.last_killed = exiled
+        room.log(Action.PK_EXILE if pk else Action.EXILE, target=exiled)
+        effects: Effects = [Exiled(exiled, pk)]
+
+        if room.role_of(exiled) == "hunter":
+            room.pending_hunter_shot = exiled
+            room.hunter_death_type = "vote"
+            room.phase = GamePhase.HUNTER_SHOT
+            return effects + [HunterTurn(exiled, "vote")]
+
+        game_over = self._check_game_over(room)
+        if game_over:
+            return effects + game_over
+        return effects + self._start_last_words(room, exiled, from_vote=True)
+
+    def _no_exile(self, room: Room, reason: str) -> Effects:
+        room.log(Action.NO_EXILE, text=reason)
+        return self._enter_night(room, reason)
+
+    # ========== 阶段流转 ==========
+
+    def _enter_night(self, room: Room, reason: Optional[str] = None) -> Effects:
+        room.phase = GamePhase.NIGHT_WOLF
+        room.current_round += 1
+        room.is_first_night = False
+        room.seer_checked = False
+        room.night_votes = {}
+        room.last_killed = None
+        room.witch_saved = None
+        room.witch_poisoned = None
+        room.last_words_from_vote = False
+        room.is_pk_vote = False
+        room.pk_players = []
+        room.day_votes = {}
+        room.log(Action.NIGHT_START)
+        return [NightFell(reason)]
+
+    def _check_game_over(self, room: Room) -> Effects:
+        message, winning_faction = check_victory(room)
+        if not message:
+            return []
+        room.phase = GamePhase.FINISHED
+        return [GameOver(winning_faction, message)]
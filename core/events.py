@@ -0,0 +1,199 @@
+"""
+对局事件日志
+每个事件是一条定长记录：(轮次, 阶段, 行动者编号, 动作, 目标编号, 文本引用)，
+按列存放在几个 array 里；只有密谋、发言这类自由文本才单独保存字符串。
+记录时不做任何格式化，需要给 AI 复盘或导出时才渲染成文字。
+"""
+from array import array
+from enum import IntEnum
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from .phases import GamePhase
+
+LOG_SEPARATOR = "=" * 30  # 渲染时每晚开头的分隔线
+NO_TEXT_PLACEHOLDER = "[未捕获到文字内容]"
+
+_PHASES = list(GamePhase)
+_PHASE_CODES = {phase: code for code, phase in enumerate(_PHASES)}
+
+
+class Action(IntEnum):
+    """事件动作"""
+    NIGHT_START = 0      # 入夜（轮次）
+    WOLF_VOTE = 1        # 狼人投刀
+    WOLF_CHAT = 2        # 狼人密谋
+    WOLF_KILL = 3        # 狼人最终决定刀
+    WOLF_IDLE = 4        # 狼人未采取行动
+    WOLF_TIMEOUT = 5     # 狼人超时未投票
+    SEER_WOLF = 6        # 预言家验出狼人
+    SEER_GOOD = 7        # 预言家验出好人
+    WITCH_SAVE = 8       # 女巫救人
+    WITCH_POISON = 9     # 女巫毒人
+    WITCH_PASS = 10      # 女巫不操作
+    LAST_WORDS = 11      # 遗言
+    SPEECH = 12          # 白天发言
+    PK_SPEECH = 13       # PK 发言
+    VOTE = 14            # 白天投票
+    ABSTAIN = 15         # 白天弃票
+    PK_VOTE = 16         # PK 投票
+    PK_ABSTAIN = 17      # PK 弃票
+    EXILE = 18           # 投票放逐
+    PK_EXILE = 19        # PK 投票放逐
+    NO_EXILE = 20        # 本轮无人出局（文本为原因）
+    VOTE_TIMEOUT = 21    # 投票超时无人投票
+    HUNTER_SHOT = 22     # 猎人开枪
+    HUNTER_TIMEOUT = 23  # 猎人超时未开枪
+
+
+# 渲染模板：{actor}/{target} 为「编号号.昵称」，{text} 为附带文本
+TEMPLATES: Dict[Action, str] = {
+    Action.WOLF_VOTE: "🐺 {actor}（狼人）选择刀 {target}",
+    Action.WOLF_CHAT: "💬 {actor}（狼人）密谋：{text}",
+    Action.WOLF_KILL: "🌙 狼人最终决定刀 {target}",
+    Action.WOLF_IDLE: "🌙 狼人未采取行动",
+    Action.WOLF_TIMEOUT: "🐺 狼人超时：未投票，今晚无人被刀",
+    Action.SEER_WOLF: "🔮 {actor}（预言家）验 {target}：狼人",
+    Action.SEER_GOOD: "🔮 {actor}（预言家）验 {target}：好人",
+    Action.WITCH_SAVE: "💊 {actor}（女巫）使用解药救了 {target}",
+    Action.WITCH_POISON: "💊 {actor}（女巫）使用毒药毒了 {target}",
+    Action.WITCH_PASS: "💊 {actor}（女巫）选择不操作",
+    Action.LAST_WORDS: "💀遗言：{actor} - {text}",
+    Action.SPEECH: "💬发言：{actor} - {text}",
+    Action.PK_SPEECH: "💬PK发言：{actor} - {text}",
+    Action.VOTE: "🗳️ {actor} 投票给 {target}",
+    Action.ABSTAIN: "🗳️ {actor} 弃票",
+    Action.PK_VOTE: "🗳️ PK投票：{actor} 投给 {target}",
+    Action.PK_ABSTAIN: "🗳️ PK投票：{actor} 弃票",
+    Action.EXILE: "📊 投票结果：{target} 被放逐",
+    Action.PK_EXILE: "📊 PK投票结果：{target} 被放逐",
+    Action.NO_EXILE: "📊 结果：{text}，本轮无人出局",
+    Action.VOTE_TIMEOUT: "📊 投票超时：无人投票，本轮无人出局",
+    Action.HUNTER_SHOT: "🔫 {actor}（猎人）开枪带走 {target}",
+    Action.HUNTER_TIMEOUT: "🔫 {actor}（猎人）超时未开枪",
+}
+
+
+class Event(NamedTuple):
+    """一条事件（读取时才组装）"""
+    round: int
+    phase: GamePhase
+    actor: Optional[int]   # 行动者编号
+    action: Action
+    target: Optional[int]  # 目标编号
+    text: Optional[str]
+
+
+def render_event(event: Event, name_of: Callable[[Optional[int]], str]) -> str:
+    """把一条事件渲染成一行文字（入夜事件除外）"""
+    return TEMPLATES[event.action].format(
+        actor=name_of(event.actor),
+        target=name_of(event.target),
+        text=NO_TEXT_PLACEHOLDER if event.text is None else event.text,
+    )
+
+
+class EventLog:
+    """按列存储的只追加事件日志"""
+    __slots__ = ("_rounds", "_phases", "_actors", "_actions", "_targets", "_text_refs", "_texts")
+
+    def __init__(self):
+        self._rounds = array("H")
+        self._phases = array("B")
+        self._actors = array("b")     # -1 表示无
+        self._actions = array("B")
+        self._targets = array("b")    # -1 表示无
+        self._text_refs = array("i")  # 指向 _texts 的下标，-1 表示无
+        self._texts: List[str] = []
+
+    def __len__(self) -> int:
+        return len(self._actions)
+
+    def append(self, round_no: int, phase: GamePhase, action: Action,
+               actor: Optional[int] = None, target: Optional[int] = None, text: Optional[str] = None):
+        """追加一条事件（actor/target 为玩家编号）"""
+        self._rounds.append(round_no)
+        self._phases.append(_PHASE_CODES[phase])
+        self._actors.append(-1 if actor is None else actor)
+        self._actions.append(action)
+        self._targets.append(-1 if target is None else target)
+        if text is None:
+            self._text_refs.append(-1)
+        else:
+            self._text_refs.append(len(self._texts))
+            self._texts.append(text)
+
+    def event(self, index: int) -> Event:
+        actor, target, ref = self._actors[index], self._targets[index], self._text_refs[index]
+        return Event(
+            round=self._rounds[index],
+            phase=_PHASES[self._phases[index]],
+            actor=None if actor < 0 else actor,
+            action=Action(self._actions[index]),
+            target=None if target < 0 else target,
+            text=None if ref < 0 else self._texts[ref],
+        )
+
+    def __iter__(self) -> Iterator[Event]:
+        for index in range(len(self)):
+            yield self.event(index)
+
+    def select(self, *actions: Action, round_no: Optional[int] = None) -> Iterator[Event]:
+        """按动作（和轮次）筛选事件，只组装命中的记录"""
+        codes = {int(action) for action in actions}
+        for index, code in enumerate(self._actions):
+            if code in codes and (round_no is None or self._rounds[index] == round_no):
+                yield self.event(index)
+
+    def copy(self) -> "EventLog":
+        clone = EventLog()
+        for name in ("_rounds", "_phases", "_actors", "_actions", "_targets", "_text_refs"):
+            setattr(clone, name, array(getattr(self, name).typecode, getattr(self, name)))
+        clone._texts = list(self._texts)
+        return clone
+
+    def render(self, name_of: Callable[[Optional[int]], str]) -> List[str]:
+        """渲染成文字日志，name_of(编号) 返回玩家显示名"""
+        lines = []
+        for event in self:
+            if event.action == Action.NIGHT_START:
+                lines.extend((LOG_SEPARATOR, f"第{event.round}晚", LOG_SEPARATOR))
+            else:
+                lines.append(render_event(event, name_of))
+        return lines
+
+    def mark(self) -> Tuple[int, int]:
+        """当前位置（事件数, 文本数），配合 to_dict(since=...) 只导出之后追加的部分"""
+        return len(self._actions), len(self._texts)
+
+    @staticmethod
+    def mark_of(data: Dict[str, list]) -> Tuple[int, int]:
+        """存档对应的位置"""
+        return len(data["actions"]), len(data["texts"])
+
+    def to_dict(self, since: Tuple[int, int] = (0, 0)) -> Dict[str, list]:
+        """导出为可 JSON 序列化的存档；since 为之前导出时的 mark()，只导出之后追加的事件
+
+        文本下标是全局的，增量部分按列追加到旧存档末尾即可拼成完整存档
+        """
+        start, text_start = since
+        return {
+            "rounds": self._rounds[start:].tolist(),
+            "phases": self._phases[start:].tolist(),
+            "actors": self._actors[start:].tolist(),
+            "actions": self._actions[start:].tolist(),
+            "targets": self._targets[start:].tolist(),
+            "text_refs": self._text_refs[start:].tolist(),
+            "texts": self._texts[text_start:],
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, list]) -> "EventLog":
+        log = cls()
+        log._rounds.extend(data["rounds"])
+        log._phases.extend(data["phases"])
+        log._actors.extend(data["actors"])
+        log._actions.extend(data["actions"])
+        log._targets.extend(data["targets"])
+        log._text_refs.extend(data["text_refs"])
+        log._texts = list(data["texts"])
+        return log
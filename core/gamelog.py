@@ -0,0 +1,59 @@
+"""
+对局日志
+对局中逐事件的高频日志（禁言、改群昵称、设管理员、私聊通知、定时器、捕获发言等）统一经过这里：
+- 按配置的级别过滤，未启用的级别直接返回，不拼接消息，可调用的字段值也不会被求值
+- 按房间抽样：只有一部分群的逐事件日志会输出（按群号哈希，同一个群始终在或不在样本里），警告和错误不抽样
+- 输出为「[狼人杀] 群 群号 事件 键=值 ...」的结构化格式，便于 grep 和日志系统解析
+"""
+import logging
+import zlib
+from typing import Any, Optional
+
+LEVELS = {
+    "debug": logging.DEBUG,
+    "info": logging.INFO,
+    "warning": logging.WARNING,
+    "error": logging.ERROR,
+    "off": logging.CRITICAL + 10,
+}
+
+
+class GameLogger:
+    """带级别过滤、惰性求值和按房间抽样的结构化日志"""
+
+    def __init__(self, logger: logging.Logger, level: str = "info", sample_rate: float = 1.0,
+                 prefix: str = "[狼人杀]"):
+        self._logger = logger
+        self._level = LEVELS.get(str(level).lower(), logging.INFO)
+        self._prefix = prefix
+        # 群号的 CRC32 小于这个阈值的群在样本里
+        self._sample_below = int(min(1.0, max(0.0, sample_rate)) * 2 ** 32)
+
+    def enabled(self, level: int, group_id: Optional[str] = None) -> bool:
+        """该级别、该群的日志是否会输出"""
+        if level < self._level or not self._logger.isEnabledFor(level):
+            return False
+        if group_id is None or level >= logging.WARNING or self._sample_below >= 2 ** 32:
+            return True
+        return zlib.crc32(str(group_id).encode()) < self._sample_below
+
+    def log(self, level: int, event: str, group_id: Optional[str] = None, **fields: Any):
+        """记录一个事件；字段值可以是无参函数，只在真正输出时调用"""
+        if not self.enabled(level, group_id):
+            return
+        parts = [self._prefix]
+        if group_id is not None:
+            parts.append(f"群 {group_id}")
+        parts.append(event)
+        for key, value in fields.items():
+            parts.append(f"{key}={value() if callable(value) else value}")
+        self._logger.log(level, " ".join(parts))
+
+    def debug(self, event: str, group_id: Optional[str] = None, **fields: Any):
+        self.log(logging.DEBUG, event, group_id, **fields)
+
+    def info(self, event: str, group_id: Optional[str] = None, **fields: Any):
+        self.log(logging.INFO, event, group_id, **fields)
+
+    def warning(self, event: str, group_id: Optional[str] = None, **fields: Any):
+        self.log(logging.WARNING, event, group_id, **fields)
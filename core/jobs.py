@@ -0,0 +1,63 @@
+"""
+后台任务队列
+固定数量的 worker 从有界队列里依次取任务处理，用于 AI 复盘这类耗时但不影响游戏流程的工作：
+提交方立即返回，同时结束的游戏再多，同一时间也只有 workers 个任务在执行。
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, List, Optional
+
+
+class JobQueue:
+    """有界队列 + 固定 worker 池"""
+
+    def __init__(self, handler: Callable[[Any], Awaitable], workers: int, maxsize: int = 0,
+                 on_error: Optional[Callable[[Any, Exception], Any]] = None):
+        self._handler = handler
+        self._worker_count = max(1, workers)
+        self._maxsize = maxsize
+        self._on_error = on_error
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+
+    def __len__(self) -> int:
+        """等待处理的任务数"""
+        return self._queue.qsize() if self._queue else 0
+
+    def submit(self, job: Any) -> bool:
+        """提交任务，队列已满时返回 False"""
+        if self._queue is None:
+            # 队列在第一次提交时创建，确保绑定到运行中的事件循环
+            self._queue = asyncio.Queue(self._maxsize)
+            loop = asyncio.get_running_loop()
+            self._workers = [loop.create_task(self._work()) for _ in range(self._worker_count)]
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            return False
+        return True
+
+    async def join(self):
+        """等待已提交的任务全部处理完"""
+        if self._queue:
+            await self._queue.join()
+
+    async def close(self):
+        """停止 worker，丢弃未处理的任务"""
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._queue = None
+
+    async def _work(self):
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._handler(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if self._on_error:
+                    self._on_error(job, e)
+            finally:
+                self._queue.task_done()
@@ -0,0 +1,66 @@
+"""
+群管理副作用台账
+插件对群做的每一项修改（禁言、全员禁言、临时管理员、改群昵称）在调用成功后登记，
+撤销成功后注销。进程意外退出或撤销调用失败时，台账里剩下的就是需要补救的副作用，
+加载和终止时据此批量撤销。
+"""
+from typing import Iterable, List, Optional
+
+from .persistence import Journal
+
+# 副作用类型
+BAN = "ban"              # 单人禁言
+WHOLE_BAN = "whole_ban"  # 全员禁言（target 为空）
+ADMIN = "admin"          # 临时管理员
+CARD = "card"            # 群昵称被改为编号（undo 为原始昵称）
+
+
+class SideEffect:
+    """一条未撤销的副作用"""
+    __slots__ = ("group_id", "kind", "target", "undo")
+
+    def __init__(self, group_id: str, kind: str, target: str = "", undo: Optional[str] = None):
+        self.group_id = group_id
+        self.kind = kind
+        self.target = target
+        self.undo = undo  # 撤销所需的数据（目前只有群昵称用到）
+
+    @property
+    def key(self) -> str:
+        return f"{self.group_id}:{self.kind}:{self.target}"
+
+
+class SideEffectLedger:
+    """基于 Journal 的副作用台账"""
+
+    def __init__(self, journal: Journal):
+        self.journal = journal
+
+    def load(self) -> List[SideEffect]:
+        """读取台账，返回全部未撤销的副作用"""
+        self.journal.load()
+        return self.outstanding()
+
+    def record(self, group_id: str, kind: str, target: str = "", undo: Optional[str] = None):
+        """登记一项已生效的副作用"""
+        effect = SideEffect(group_id, kind, target, undo)
+        if self.journal.get(effect.key) is not None:
+            # 已登记过（例如同一玩家的群昵称被重复修改），保留最早的撤销数据
+            return
+        self.journal.put(effect.key, {"group": group_id, "kind": kind, "target": target, "undo": undo})
+
+    def resolve(self, group_id: str, kind: str, target: str = ""):
+        """副作用已撤销"""
+        self.journal.delete(SideEffect(group_id, kind, target).key)
+
+    def outstanding(self, exclude_groups: Iterable[str] = ()) -> List[SideEffect]:
+        """全部未撤销的副作用（可排除仍在进行游戏的群）"""
+        excluded = set(exclude_groups)
+        return [
+            SideEffect(data["group"], data["kind"], data["target"], data["undo"])
+            for data in self.journal.records.values()
+            if data["group"] not in excluded
+        ]
+
+    def close(self):
+        self.journal.close()
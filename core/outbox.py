@@ -0,0 +1,73 @@
+"""
+按群合并的出站消息队列
+同一个群连续发出的多条消息先进入队列，由该群唯一的发送任务按顺序取出：
+同一轮事件循环里（或上一批还在发送时）积累的消息合并成一批，一次平台调用发出，
+每批的总长度不超过上限，超过时拆成多批依次发送。
+"""
+import asyncio
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+
+
+class Outbox:
+    """每个群一个 FIFO 队列 + 一个发送任务"""
+
+    def __init__(self, send: Callable[[Any, List[Any]], Awaitable],
+                 size: Callable[[Any], int], max_size: int,
+                 on_error: Optional[Callable[[Any, Exception], Any]] = None):
+        """
+        send(目标, 消息列表)：把一批消息合并后实际发送
+        size(消息)：消息长度，用于计算每批的总长度
+        """
+        self._send = send
+        self._size = size
+        self.max_size = max_size
+        self._on_error = on_error
+        self._queues: Dict[Any, Deque[Any]] = {}
+        self._senders: Dict[Any, asyncio.Task] = {}
+
+    def post(self, target: Any, message: Any):
+        """消息入队后立即返回；发送任务在下一轮事件循环开始取消息"""
+        self._queues.setdefault(target, deque()).append(message)
+        sender = self._senders.get(target)
+        if sender is None or sender.done():
+            self._senders[target] = asyncio.get_running_loop().create_task(self._drain(target))
+
+    async def flush(self):
+        """等待所有已入队的消息发送完毕"""
+        while self._senders:
+            await asyncio.gather(*self._senders.values(), return_exceptions=True)
+
+    async def close(self):
+        """发送剩余消息后停止"""
+        await self.flush()
+        self._queues.clear()
+
+    def _next_batch(self, queue: Deque[Any]) -> List[Any]:
+        """按顺序取出不超过长度上限的一批消息（单条超长的消息单独成批）"""
+        batch = [queue.popleft()]
+        total = self._size(batch[0])
+        while queue and total + self._size(queue[0]) <= self.max_size:
+            total += self._size(queue[0])
+            batch.append(queue.popleft())
+        return batch
+
+    async def _drain(self, target: Any):
+        queue = self._queues[target]
+        try:
+            # 先让出一轮事件循环，收集调用方紧接着发出的消息
+            await asyncio.sleep(0)
+            while queue:
+                batch = self._next_batch(queue)
+                try:
+                    await self._send(target, batch)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    if self._on_error:
+                        self._on_error(target, e)
+        finally:
+            if self._senders.get(target) is asyncio.current_task():
+                del self._senders[target]
+            if not queue:
+                self._queues.pop(target, None)
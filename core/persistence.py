@@ -0,0 +1,189 @@
+"""
+持久化存档
+以「键 -> JSON 记录」的形式保存状态：每次修改追加写入日志文件（JSON Lines，一行一条记录），
+日志积累到一定条数后压缩成一个完整的快照文件并清空日志。
+启动时先读快照、再按顺序重放日志，得到进程退出前每个键的最后状态。
+房间存档（rooms）和群管理副作用台账（effects）各用一个实例。
+
+日志记录带递增序号，快照记下压缩时的序号；压缩时先把当前日志改名为 .old 再开新日志，
+在事件循环里运行时快照的写入和 fsync 放到线程里完成，写完再删除 .old。
+进程在这之间退出也没关系：加载时依次重放 .old 和当前日志，跳过快照已包含的序号。
+"""
+import asyncio
+import json
+import os
+from typing import Callable, Dict, Optional
+
+
+
+class Journal:
+    """快照日志（追加写 + 定期压缩）
+
+    文件：{name}.snapshot.json、{name}.journal.jsonl（压缩过程中还有 {name}.journal.jsonl.old）
+    """
+
+    def __init__(self, data_dir: str, name: str, compact_every: int = 200,
+                 on_error: Optional[Callable[[Exception], None]] = None):
+        os.makedirs(data_dir, exist_ok=True)
+        self.snapshot_path = os.path.join(data_dir, f"{name}.snapshot.json")
+        self.journal_path = os.path.join(data_dir, f"{name}.journal.jsonl")
+        self.rotated_path = self.journal_path + ".old"
+        self.compact_every = compact_every
+        self._on_error = on_error  # 后台压缩失败时回调
+        self._state: Dict[str, dict] = {}  # 键 -> 最新记录（压缩时整体写出）
+        self._seq = 0                      # 最近一条日志记录的序号
+        self._records = 0
+        self._fp = None
+        self._compacting: Optional[asyncio.Future] = None  # 后台压缩任务
+
+    def load(self) -> Dict[str, dict]:
+        """读取快照并重放日志，返回 {键: 记录}，随后立即压缩"""
+        state: Dict[str, dict] = {}
+        snapshot_seq = 0
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, "r", encoding="utf-8") as f:
+                snapshot = json.load(f)
+            if set(snapshot) == {"seq", "state"}:
+                snapshot_seq, state = snapshot["seq"], snapshot["state"]
+            else:
+                state = snapshot  # 旧格式：整个文件就是状态
+
+        self._seq = snapshot_seq
+        for path in (self.rotated_path, self.journal_path):
+            if not os.path.exists(path):
+                continue
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # 进程在写最后一行时退出，之后不会再有完整记录
+                        break
+                    seq = record.get("seq")
+                    if seq is not None:
+                        if seq <= snapshot_seq:
+                            continue  # 快照已包含
+                        self._seq = max(self._seq, seq)
+                    self._apply(state, record)
+
+        self._state = state
+        self.compact()
+        return dict(state)
+
+    @staticmethod
+    def _apply(state: Dict[str, dict], record: dict):
+        key = record["key"]
+        if record["op"] == "put":
+            state[key] = record["data"]
+        elif record["op"] == "update":
+            current = state.get(key)
+            if current is None:
+                return
+            current.update(record["data"])
+            for field, columns in record.get("extend", {}).items():
+                for column, values in columns.items():
+                    current[field][column].extend(values)
+        else:
+            state.pop(key, None)
+
+    def put(self, key: str, data: dict):
+        """记录某个键的最新状态"""
+        self._state[key] = data
+        self._append({"op": "put", "key": key, "data": data})
+
+    def update(self, key: str, changes: dict, extend: Optional[Dict[str, Dict[str, list]]] = None):
+        """只记录某个键变化的字段（浅合并）；extend 为 {字段: {列: 新增的值}}，追加到按列存储的字段末尾
+
+        键不存在时不写日志，调用方应先 put 完整记录
+        """
+        current = self._state.get(key)
+        if current is None:
+            return
+        extend = {field: columns for field, columns in (extend or {}).items()
+                  if any(columns.values())}
+        if not changes and not extend:
+            return
+        record = {"op": "update", "key": key, "data": changes}
+        if extend:
+            record["extend"] = extend
+        self._apply(self._state, record)
+        self._append(record)
+
+    def delete(self, key: str):
+        """删除某个键（不存在时不写日志）"""
+        if self._state.pop(key, None) is not None:
+            self._append({"op": "del", "key": key})
+
+    def compact(self):
+        """把当前全部状态写成快照（先写临时文件再原子替换），然后清空日志"""
+        self._write_snapshot(self._rotate())
+
+    def close(self):
+        if self._fp:
+            self._fp.close()
+            self._fp = None
+
+    def _rotate(self) -> str:
+        """序列化当前状态，把当前日志改名为 .old 并开始新日志，返回快照内容"""
+        text = json.dumps({"seq": self._seq, "state": self._state}, ensure_ascii=False, separators=(",", ":"))
+        if self._fp:
+            self._fp.close()
+        if os.path.exists(self.journal_path):
+            if os.path.exists(self.rotated_path):
+                # 上一次压缩没有完成（进程退出或写入失败），.old 里的记录先并入当前日志
+                with open(self.rotated_path, "r", encoding="utf-8") as old, \
+                        open(self.journal_path, "r", encoding="utf-8") as new:
+                    merged = old.read() + new.read()
+                with open(self.journal_path, "w", encoding="utf-8") as f:
+                    f.write(merged)
+            os.replace(self.journal_path, self.rotated_path)
+        self._fp = open(self.journal_path, "w", encoding="utf-8")
+        self._records = 0
+        return text
+
+    def _write_snapshot(self, text: str):
+        tmp_path = self.snapshot_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+        if os.path.exists(self.rotated_path):
+            os.remove(self.rotated_path)
+
+    def _compact_in_background(self):
+        """在事件循环中运行时，快照的写入和 fsync 放到线程里；同一时间只有一个压缩任务"""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.compact()
+            return
+        if self._compacting is not None and not self._compacting.done():
+            return  # 上一次压缩还没写完，日志继续增长，写完后再压缩
+        # run_in_executor 而不是 asyncio.to_thread：后者需要 Python 3.9
+        self._compacting = loop.run_in_executor(None, self._write_snapshot, self._rotate())
+        self._compacting.add_done_callback(self._compaction_done)
+
+    def _compaction_done(self, task: asyncio.Future):
+        # 写入失败时 .old 保留，下次压缩或加载时再并入，不丢记录
+        if not task.cancelled() and task.exception() is not None and self._on_error:
+            self._on_error(task.exception())
+
+    def _append(self, record: dict):
+        if self._fp is None:
+            self._fp = open(self.journal_path, "a", encoding="utf-8")
+        self._seq += 1
+        record["seq"] = self._seq
+        self._fp.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n")
+        self._fp.flush()
+        self._records += 1
+        if self._records >= self.compact_every:
+            self._compact_in_background()
+
+    @property
+    def records(self) -> Dict[str, dict]:
+        """当前全部记录（只读）"""
+        return self._state
+
+    def get(self, key: str) -> Optional[dict]:
+        return self._state.get(key)
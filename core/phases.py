@@ -0,0 +1,18 @@
+"""
+游戏阶段
+"""
+from enum import Enum
+
+
+class GamePhase(Enum):
+    """游戏阶段"""
+    WAITING = "等待中"
+    NIGHT_WOLF = "夜晚-狼人行动"
+    NIGHT_SEER = "夜晚-预言家验人"
+    NIGHT_WITCH = "夜晚-女巫行动"
+    LAST_WORDS = "遗言阶段"
+    DAY_SPEAKING = "白天发言"
+    DAY_VOTE = "白天投票"
+    DAY_PK = "PK发言"  # 平票时PK发言
+    FINISHED = "已结束"
+    HUNTER_SHOT = "猎人开枪"  # 等待猎人开枪（新增的阶段放在最后，事件日志按序号保存阶段）
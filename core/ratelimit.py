@@ -0,0 +1,208 @@
+"""
+出站调用限速
+所有发往平台的调用（群消息、私聊、禁言、改群昵称等）先在这里排队领取令牌：
+全局、每个群、每个用户各有一个令牌桶，三个桶都有令牌时才放行。
+排队的调用分为三个优先级通道，令牌紧张时优先放行时效性强的调用（私聊提示），
+改群昵称这类外观操作排在最后。
+"""
+import asyncio
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+# 优先级通道（数值越小越优先）
+HIGH = 0    # 私聊提示：身份、女巫/猎人通知
+NORMAL = 1  # 群消息、禁言、管理员
+LOW = 2     # 改群昵称
+
+# 各平台调用默认所在的通道，未列出的为 NORMAL
+ACTION_PRIORITY = {
+    "send_private_msg": HIGH,
+    "set_group_card": LOW,
+}
+
+
+class TokenBucket:
+    """令牌桶：每秒补充 rate 个令牌，最多积攒 capacity 个"""
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: float, now: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+
+    def refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self) -> float:
+        """还要等多少秒才有一个令牌（调用前先 refill）"""
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    @property
+    def full(self) -> bool:
+        return self.tokens >= self.capacity
+
+
+class RateLimiter:
+    """全局 / 每群 / 每用户三级令牌桶 + 优先级排队"""
+
+    def __init__(self, global_rate: float, group_rate: float, user_rate: float, burst: float = 2.0):
+        """rate 为每秒放行次数，<= 0 表示该级不限速；burst 为桶容量相对 rate 的倍数"""
+        self.global_rate = global_rate
+        self.group_rate = group_rate
+        self.user_rate = user_rate
+        self.burst = burst
+        self._global: Optional[TokenBucket] = None
+        self._groups: Dict[str, TokenBucket] = {}
+        self._users: Dict[str, TokenBucket] = {}
+        self._lanes: List[Deque[Tuple[asyncio.Future, Optional[str], Optional[str]]]] = [
+            deque() for _ in (HIGH, NORMAL, LOW)
+        ]
+        self._wakeup: Optional[asyncio.Event] = None
+        self._runner: Optional[asyncio.Task] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.global_rate > 0 or self.group_rate > 0 or self.user_rate > 0
+
+    def pending(self) -> int:
+        """排队中的调用数"""
+        return sum(len(lane) for lane in self._lanes)
+
+    async def acquire(self, group: Any = None, user: Any = None, priority: int = NORMAL):
+        """排队直到可以发起一次调用"""
+        if not self.enabled:
+            return
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._lanes[priority].append((
+            future,
+            str(group) if group is not None else None,
+            str(user) if user is not None else None,
+        ))
+        if self._runner is None or self._runner.done():
+            self._wakeup = asyncio.Event()
+            self._runner = loop.create_task(self._run())
+        else:
+            self._wakeup.set()
+        await future
+
+    async def close(self):
+        """停止放行，取消仍在排队的调用"""
+        if self._runner:
+            self._runner.cancel()
+            await asyncio.gather(self._runner, return_exceptions=True)
+            self._runner = None
+        for lane in self._lanes:
+            for future, _, _ in lane:
+                future.cancel()
+            lane.clear()
+
+    def _bucket(self, buckets: Dict[str, TokenBucket], key: Optional[str], rate: float,
+                now: float) -> Optional[TokenBucket]:
+        if key is None or rate <= 0:
+            return None
+        bucket = buckets.get(key)
+        if bucket is None:
+            bucket = buckets[key] = TokenBucket(rate, max(1.0, rate * self.burst), now)
+        else:
+            bucket.refill(now)
+        return bucket
+
+    def _dispatch(self, now: float) -> Optional[float]:
+        """放行所有能放行的调用，返回下一次需要检查的等待时间（没有排队时返回 None）"""
+        if self.global_rate > 0:
+            if self._global is None:
+                self._global = TokenBucket(self.global_rate, max(1.0, self.global_rate * self.burst), now)
+            else:
+                self._global.refill(now)
+
+        delay: Optional[float] = None
+        for lane in self._lanes:
+            waiting = deque()
+            while lane:
+                future, group, user = lane.popleft()
+                if future.done():  # 调用方已取消
+                    continue
+                buckets = [b for b in (
+                    self._global,
+                    self._bucket(self._groups, group, self.group_rate, now),
+                    self._bucket(self._users, user, self.user_rate, now),
+                ) if b is not None]
+                wait = max((b.wait_time() for b in buckets), default=0.0)
+                if wait > 0:
+                    waiting.append((future, group, user))
+                    delay = wait if delay is None else min(delay, wait)
+                    continue
+                for bucket in buckets:
+                    bucket.tokens -= 1
+                future.set_result(None)
+            lane.extend(waiting)
+        return delay
+
+    def _prune(self):
+        """队列清空后丢弃已经回满的桶，避免按群/用户无限增长"""
+        for buckets in (self._groups, self._users):
+            for key in [key for key, bucket in buckets.items() if bucket.full]:
+                del buckets[key]
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            self._wakeup.clear()
+            delay = self._dispatch(loop.time())
+            if delay is None:
+                break
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+        now = loop.time()
+        for buckets in (self._groups, self._users):
+            for bucket in buckets.values():
+                bucket.refill(now)
+        self._prune()
+
+
+class RateLimitedBot:
+    """平台客户端包装：每次调用 bot.xxx(**params) 前先在限速器排队
+
+    按参数中的 group_id / user_id 选择令牌桶，按调用名选择优先级通道；
+    on_call(调用名, 耗时秒数, 异常或 None) 在每次调用结束后执行，耗时不含排队时间
+    """
+    __slots__ = ("_bot", "_limiter", "_on_call")
+
+    def __init__(self, bot: Any, limiter: RateLimiter,
+                 on_call: Optional[Callable[[str, float, Optional[Exception]], Any]] = None):
+        self._bot = bot
+        self._limiter = limiter
+        self._on_call = on_call
+
+    @property
+    def raw(self) -> Any:
+        """被包装的原始客户端"""
+        return self._bot
+
+    def __getattr__(self, action: str):
+        method = getattr(self._bot, action)
+
+        async def call(**params):
+            await self._limiter.acquire(
+                group=params.get("group_id"),
+                user=params.get("user_id"),
+                priority=ACTION_PRIORITY.get(action, NORMAL),
+            )
+            if self._on_call is None:
+                return await method(**params)
+            started = time.perf_counter()
+            try:
+                result = await method(**params)
+            except Exception as e:
+                self._on_call(action, time.perf_counter() - started, e)
+                raise
+            self._on_call(action, time.perf_counter() - started, None)
+            return result
+
+        return call
@@ -0,0 +1,139 @@
+"""
+AI 复盘辅助工具
+"""
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .events import Action, EventLog, render_event
+
+# 投票类事件按 (轮次, 类别) 汇总成一行票型
+_VOTE_KINDS = {
+    Action.WOLF_VOTE: "wolf",
+    Action.VOTE: "day",
+    Action.ABSTAIN: "day",
+    Action.PK_VOTE: "pk",
+    Action.PK_ABSTAIN: "pk",
+}
+_TALLY_TITLES = {"wolf": "🐺 狼人刀人意向", "day": "🗳️ 投票票型", "pk": "🗳️ PK投票票型"}
+# 超出预算时可以截短或省略的自由文本事件；其余关键事件（刀人、救人、毒人、放逐、开枪、验人等）始终保留
+_OPTIONAL = frozenset({Action.WOLF_CHAT, Action.SPEECH, Action.PK_SPEECH, Action.LAST_WORDS})
+_TRUNCATE_TO = 60  # 超出预算时自由文本每行保留的字数
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算 token 数：中日韩字符按 1 个计，其余字符每 4 个计 1 个"""
+    wide = sum(1 for ch in text if ord(ch) >= 0x2E80)
+    return wide + (len(text) - wide + 3) // 4
+
+
+def _tally(kind: str, votes: Dict[int, Optional[int]], name_of: Callable[[Optional[int]], str]) -> str:
+    """把一组投票（投票者编号 -> 目标编号，None 为弃票）汇总成一行"""
+    by_target: Dict[int, List[int]] = {}
+    abstain = []
+    for voter, target in votes.items():
+        if target is None:
+            abstain.append(voter)
+        else:
+            by_target.setdefault(target, []).append(voter)
+    parts = [
+        f"{name_of(target)} {len(voters)}票（{'、'.join(f'{v}号' for v in voters)}）"
+        for target, voters in sorted(by_target.items(), key=lambda item: -len(item[1]))
+    ]
+    if abstain:
+        parts.append(f"弃票：{'、'.join(f'{v}号' for v in abstain)}")
+    return f"{_TALLY_TITLES[kind]}：{'；'.join(parts)}"
+
+
+def compact_game_log(events: EventLog, name_of: Callable[[Optional[int]], str],
+                     token_budget: int = 0) -> List[str]:
+    """把事件日志压缩成给 AI 复盘用的文字
+
+    1. 每轮的狼人投刀、白天投票、PK 投票各汇总成一行票型，同一人重复投票只算最后一次
+    2. token_budget > 0 且超出预算时，先截短发言/密谋/遗言，仍超出再从最早的开始省略；
+       关键事件始终保留
+    """
+    entries: List[Tuple[bool, str]] = []  # (是否可省略, 文字)
+    tallies: Dict[Tuple[int, str], Tuple[int, Dict[int, Optional[int]]]] = {}
+    for event in events:
+        kind = _VOTE_KINDS.get(event.action)
+        if kind:
+            key = (event.round, kind)
+            if key not in tallies:
+                tallies[key] = (len(entries), {})
+                entries.append((False, ""))  # 票型占位，在第一次投票的位置输出
+            votes = tallies[key][1]
+            votes.pop(event.actor, None)  # 重复投票：保留最后一次
+            votes[event.actor] = event.target
+        elif event.action == Action.NIGHT_START:
+            entries.append((False, f"【第{event.round}晚】"))
+        else:
+            entries.append((event.action in _OPTIONAL, render_event(event, name_of)))
+    for (_, kind), (index, votes) in tallies.items():
+        entries[index] = (False, _tally(kind, votes, name_of))
+
+    if token_budget <= 0:
+        return [line for _, line in entries]
+
+    total = sum(estimate_tokens(line) for _, line in entries)
+    if total > token_budget:
+        for i, (optional, line) in enumerate(entries):
+            if optional and len(line) > _TRUNCATE_TO:
+                shortened = line[:_TRUNCATE_TO] + "…"
+                total -= estimate_tokens(line) - estimate_tokens(shortened)
+                entries[i] = (True, shortened)
+
+    dropped = 0
+    for i, (optional, line) in enumerate(entries):
+        if total <= token_budget:
+            break
+        if optional:
+            total -= estimate_tokens(line)
+            entries[i] = (True, "")
+            dropped += 1
+
+    lines = [line for _, line in entries if line]
+    if dropped:
+        lines.append(f"（为控制长度省略了 {dropped} 条较早的发言/密谋/遗言）")
+    return lines
+
+
+class ParagraphChunker:
+    """把流式输出的文本片段切成段落大小的块，边生成边发送
+
+    在至少 min_size 个字之后遇到空行就切一块；一直没有空行时，
+    超过 max_size 个字就在最后一个换行或句号处切开
+    """
+
+    def __init__(self, min_size: int = 80, max_size: int = 600):
+        self.min_size = min_size
+        self.max_size = max_size
+        self._buffer = ""
+
+    def feed(self, delta: str) -> List[str]:
+        """追加一段新生成的文本，返回已经完整的块"""
+        self._buffer += delta
+        chunks = []
+        while True:
+            cut = self._find_cut()
+            if cut is None:
+                break
+            chunk = self._buffer[:cut].strip()
+            self._buffer = self._buffer[cut:].lstrip("\n")
+            if chunk:
+                chunks.append(chunk)
+        return chunks
+
+    def finish(self) -> str:
+        """生成结束，返回剩余的文本"""
+        rest = self._buffer.strip()
+        self._buffer = ""
+        return rest
+
+    def _find_cut(self):
+        index = self._buffer.find("\n\n", self.min_size)
+        if index != -1:
+            return index
+        if len(self._buffer) >= self.max_size:
+            index = max(self._buffer.rfind("\n", 0, self.max_size),
+                        self._buffer.rfind("。", 0, self.max_size) + 1)
+            return index if index > 0 else self.max_size
+        return None
@@ -0,0 +1,371 @@
+"""
+房间状态模型
+每个群一个 Room，所有字段都用 __slots__ 声明，访问拼错会直接报 AttributeError
+"""
+from typing import AbstractSet, Any, Dict, List, NamedTuple, Optional, Set, Tuple
+
+from .events import Action, EventLog
+from .phases import GamePhase
+
+GOD_ROLES = ("seer", "witch", "hunter")  # 神职
+SPEECH_MAX_CHARS = 200     # 每轮发言记录的总字数上限
+SPEECH_MAX_MESSAGES = 20   # 每轮发言记录的消息条数上限（重复的消息只算一条）
+_NO_PLAYERS: AbstractSet[str] = frozenset()
+
+# 各人数的预置角色配置
+PRESET_CONFIGS: Dict[int, Dict[str, int]] = {
+    5:  {"werewolf": 2, "seer": 1, "witch": 0, "hunter": 1, "villager": 1},
+    6:  {"werewolf": 2, "seer": 1, "witch": 1, "hunter": 1, "villager": 1},
+    7:  {"werewolf": 2, "seer": 1, "witch": 1, "hunter": 1, "villager": 2},
+    8:  {"werewolf": 3, "seer": 1, "witch": 1, "hunter": 1, "villager": 2},
+    9:  {"werewolf": 3, "seer": 1, "witch": 1, "hunter": 1, "villager": 3},  # 标准局
+    10: {"werewolf": 3, "seer": 1, "witch": 1, "hunter": 1, "villager": 4},
+}
+
+
+class RoomConfig:
+    """房间角色配置（各角色人数）"""
+    __slots__ = ("total", "werewolf", "seer", "witch", "hunter", "villager")
+
+    def __init__(self, total: int, werewolf: int, seer: int, witch: int, hunter: int, villager: int):
+        self.total = total
+        self.werewolf = werewolf
+        self.seer = seer
+        self.witch = witch
+        self.hunter = hunter
+        self.villager = villager
+
+    @classmethod
+    def from_preset(cls, total: int, preset: Dict[str, int]) -> "RoomConfig":
+        """从预置配置字典创建"""
+        return cls(
+            total=total,
+            werewolf=preset["werewolf"],
+            seer=preset["seer"],
+            witch=preset["witch"],
+            hunter=preset["hunter"],
+            villager=preset["villager"],
+        )
+
+    @property
+    def god_count(self) -> int:
+        """神职总数"""
+        return self.seer + self.witch + self.hunter
+
+    def roles_pool(self) -> List[str]:
+        """获取角色池"""
+        return (
+            ["werewolf"] * self.werewolf +
+            ["seer"] * self.seer +
+            ["witch"] * self.witch +
+            ["hunter"] * self.hunter +
+            ["villager"] * self.villager
+        )
+
+
+class Player:
+    """玩家记录：ID、昵称、编号、角色"""
+    __slots__ = ("id", "name", "number", "role")
+
+    def __init__(self, player_id: str, name: str):
+        self.id = player_id
+        self.name = name
+        self.number: Optional[int] = None  # 开局时分配
+        self.role: Optional[str] = None    # 开局时分配
+
+
+class RoleDelivery:
+    """身份私聊的送达记录"""
+    __slots__ = ("ok", "latency")
+
+    def __init__(self, ok: bool, latency: float):
+        self.ok = ok
+        self.latency = latency
+
+
+class SpeechBuffer:
+    """当前发言人这一轮的发言记录
+
+    总字数和消息条数都有上限，超出的部分截断或丢弃并在文本末尾标注；
+    同一轮里重复发送的相同消息（刷屏）只保留一条并记下次数
+    """
+    __slots__ = ("max_chars", "max_messages", "_messages", "_counts", "_index", "_chars", "_dropped", "_cut")
+
+    def __init__(self, max_chars: int = SPEECH_MAX_CHARS, max_messages: int = SPEECH_MAX_MESSAGES):
+        self.max_chars = max(1, max_chars)
+        self.max_messages = max(1, max_messages)
+        self._messages: List[str] = []
+        self._counts: List[int] = []
+        self._index: Dict[str, int] = {}   # 消息 -> 在 _messages 中的下标（用于去重）
+        self._chars = 0
+        self._dropped = 0                  # 超出上限未记录的消息数
+        self._cut = False                  # 最后一条消息是否被截断
+
+    def __len__(self) -> int:
+        return len(self._messages)
+
+    def __bool__(self) -> bool:
+        return bool(self._messages)
+
+    def append(self, message: str) -> bool:
+        """记录一条消息，返回是否写入了缓冲（空消息、超出上限时为 False，重复消息计数后为 True）"""
+        message = message.strip()
+        if not message:
+            return False
+        index = self._index.get(message)
+        if index is not None:
+            self._counts[index] += 1
+            return True
+        if self._cut or len(self._messages) >= self.max_messages or self._chars >= self.max_chars:
+            self._dropped += 1
+            return False
+        room = self.max_chars - self._chars
+        if len(message) > room:
+            self._cut = True
+            self._index[message] = len(self._messages)
+            message = message[:room]
+        else:
+            self._index[message] = len(self._messages)
+        self._messages.append(message)
+        self._counts.append(1)
+        self._chars += len(message)
+        return True
+
+    def text(self) -> Optional[str]:
+        """合并成一条记录，没有捕获到文字时为 None"""
+        if not self._messages:
+            return None
+        parts = [m if n == 1 else f"{m}（×{n}）" for m, n in zip(self._messages, self._counts)]
+        if self._cut:
+            parts[-1] += "..."
+        text = " ".join(parts)
+        if self._dropped:
+            text += f"（另有 {self._dropped} 条未记录）"
+        return text
+
+    def clear(self):
+        self._messages.clear()
+        self._counts.clear()
+        self._index.clear()
+        self._chars = 0
+        self._dropped = 0
+        self._cut = False
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "max_chars": self.max_chars,
+            "max_messages": self.max_messages,
+            "messages": [[m, n] for m, n in zip(self._messages, self._counts)],
+            "dropped": self._dropped,
+            "cut": self._cut,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Any) -> "SpeechBuffer":
+        if isinstance(data, list):
+            # 旧存档：未合并的消息列表
+            buffer = cls()
+            for message in data:
+                buffer.append(message)
+            return buffer
+        buffer = cls(data["max_chars"], data["max_messages"])
+        for message, count in data["messages"]:
+            buffer._index[message] = len(buffer._messages)
+            buffer._messages.append(message)
+            buffer._counts.append(count)
+            buffer._chars += len(message)
+        buffer._dropped = data["dropped"]
+        buffer._cut = data["cut"]
+        return buffer
+
+
+class GameRecord(NamedTuple):
+    """结束时的对局快照（不可变），房间清理后仍可交给后台生成 AI 复盘"""
+    group_id: str
+    msg_origin: Any
+    winning_faction: str
+    players: Tuple[Tuple[Optional[int], str, str], ...]  # (编号, 昵称, 角色)，按加入顺序
+    events: EventLog                                      # 事件日志副本（不再修改）
+
+
+class Room:
+    """游戏房间状态"""
+    __slots__ = (
+        "config", "players", "number_to_player", "alive", "phase", "creator",
+        "night_votes", "day_votes", "night_result", "msg_origin", "seer_checked",
+        "banned_players", "bot", "timer", "speaking_order", "current_speaker_index",
+        "current_speaker", "temp_admins", "last_killed", "witch_poison_used",
+        "witch_antidote_used", "witch_saved", "witch_poisoned", "witch_acted",
+        "is_first_night", "last_words_from_vote", "pk_players", "is_pk_vote",
+        "original_group_cards", "hunter_shot", "pending_hunter_shot", "hunter_death_type",
+        "events", "current_round", "current_speech", "role_delivery", "card_task",
+        "role_members", "alive_by_role",
+    )
+
+    def __init__(self, config: RoomConfig, creator: str, msg_origin: Any, bot: Any):
+        self.config = config
+        self.players: Dict[str, Player] = {}           # 玩家ID -> 玩家记录（按加入顺序）
+        self.number_to_player: Dict[int, str] = {}     # 编号 -> 玩家ID
+        self.alive: Set[str] = set()
+        self.phase = GamePhase.WAITING
+        self.creator = creator
+        self.night_votes: Dict[str, str] = {}          # 狼人ID -> 目标ID
+        self.day_votes: Dict[str, str] = {}            # 投票者ID -> 目标ID（"ABSTAIN" 为弃票）
+        self.night_result: Optional[str] = None
+        self.msg_origin = msg_origin
+        self.seer_checked = False
+        self.banned_players: Set[str] = set()
+        self.bot = bot
+        self.timer = None                              # 当前阶段的 TimerHandle
+        self.speaking_order: List[str] = []
+        self.current_speaker_index = 0
+        self.current_speaker: Optional[str] = None
+        self.temp_admins: Set[str] = set()
+        self.last_killed: Optional[str] = None
+        self.witch_poison_used = False
+        self.witch_antidote_used = False
+        self.witch_saved: Optional[str] = None
+        self.witch_poisoned: Optional[str] = None
+        self.witch_acted = False
+        self.is_first_night = True
+        self.last_words_from_vote = False
+        self.pk_players: List[str] = []
+        self.is_pk_vote = False
+        self.original_group_cards: Dict[str, str] = {}
+        self.hunter_shot = False
+        self.pending_hunter_shot: Optional[str] = None
+        self.hunter_death_type: Optional[str] = None   # "wolf" / "vote" / "poison"
+        self.events = EventLog()
+        self.current_round = 0
+        self.current_speech = SpeechBuffer()           # 当前发言人这一轮的发言，结束时写入事件日志
+        self.role_delivery: Dict[str, RoleDelivery] = {}
+        self.card_task = None                          # 开局后在后台修改群昵称的 asyncio.Task
+        # 角色索引：开局时建立，之后只在玩家死亡时（kill）增量更新
+        self.role_members: Dict[str, List[str]] = {}   # 角色 -> 全部玩家ID（含已死亡，按加入顺序）
+        self.alive_by_role: Dict[str, Set[str]] = {}   # 角色 -> 存活玩家ID
+
+    # 需要持久化的字段（bot、timer、role_delivery、card_task 和角色索引属于运行时状态，不写入存档）
+    _SET_FIELDS = ("banned_players", "temp_admins")
+    _PLAIN_FIELDS = (
+        "creator", "night_votes", "day_votes", "night_result", "msg_origin", "seer_checked",
+        "speaking_order", "current_speaker_index", "current_speaker", "last_killed",
+        "witch_poison_used", "witch_antidote_used", "witch_saved", "witch_poisoned", "witch_acted",
+        "is_first_night", "last_words_from_vote", "pk_players", "is_pk_vote",
+        "original_group_cards", "hunter_shot", "pending_hunter_shot", "hunter_death_type",
+        "current_round",
+    )
+
+    def to_dict(self, events: bool = True) -> Dict[str, Any]:
+        """导出为可 JSON 序列化的存档（events 为 False 时不含事件日志，由调用方增量保存）"""
+        data: Dict[str, Any] = {name: getattr(self, name) for name in self._PLAIN_FIELDS}
+        for name in self._SET_FIELDS:
+            data[name] = sorted(getattr(self, name))
+        data["config"] = {name: getattr(self.config, name) for name in RoomConfig.__slots__}
+        data["players"] = [[p.id, p.name, p.number, p.role] for p in self.players.values()]
+        data["alive"] = sorted(self.alive)
+        data["phase"] = self.phase.name
+        if events:
+            data["events"] = self.events.to_dict()
+        data["current_speech"] = self.current_speech.to_dict()
+        return data
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any], bot: Any) -> "Room":
+        """从存档恢复房间（定时器需要调用方重新登记）"""
+        room = cls(RoomConfig(**data["config"]), data["creator"], data["msg_origin"], bot)
+        for name in cls._PLAIN_FIELDS:
+            setattr(room, name, data[name])
+        for name in cls._SET_FIELDS:
+            setattr(room, name, set(data[name]))
+        for player_id, name, number, role in data["players"]:
+            player = Player(player_id, name)
+            player.number = number
+            player.role = role
+            room.players[player_id] = player
+            if number is not None:
+                room.number_to_player[number] = player_id
+        room.phase = GamePhase[data["phase"]]
+        room.events = EventLog.from_dict(data["events"])
+        room.current_speech = SpeechBuffer.from_dict(data["current_speech"])
+        room.build_role_index(set(data["alive"]))
+        return room
+
+    def record(self, group_id: str, winning_faction: str) -> GameRecord:
+        """生成对局快照"""
+        return GameRecord(
+            group_id=group_id,
+            msg_origin=self.msg_origin,
+            winning_faction=winning_faction,
+            players=tuple((p.number, p.name, p.role) for p in self.players.values() if p.role is not None),
+            events=self.events.copy(),
+        )
+
+    def log(self, action: Action, actor: Optional[str] = None, target: Optional[str] = None, text: Optional[str] = None):
+        """记录一条事件（actor/target 为玩家ID，按编号保存）"""
+        self.events.append(
+            self.current_round, self.phase, action,
+            actor=self.number_of(actor) if actor else None,
+            target=self.number_of(target) if target else None,
+            text=text,
+        )
+
+    def role_of(self, player_id: str) -> Optional[str]:
+        """获取玩家角色，未分配或不在房间返回 None"""
+        player = self.players.get(player_id)
+        return player.role if player else None
+
+    def build_role_index(self, alive: Optional[Set[str]] = None):
+        """角色分配完毕后建立角色索引；alive 为空时将所有玩家标记为存活（恢复存档时传入已保存的存活集合）"""
+        self.role_members = {}
+        for player in self.players.values():
+            if player.role is not None:
+                self.role_members.setdefault(player.role, []).append(player.id)
+        self.alive = set(self.players) if alive is None else set(alive)
+        self.alive_by_role = {
+            role: {pid for pid in members if pid in self.alive}
+            for role, members in self.role_members.items()
+        }
+
+    def kill(self, player_id: str):
+        """玩家死亡：同时更新存活集合和角色索引"""
+        if player_id in self.alive:
+            self.alive.discard(player_id)
+            self.alive_by_role[self.role_of(player_id)].discard(player_id)
+
+    def members(self, role: str) -> List[str]:
+        """某角色的全部玩家（含已死亡）"""
+        return self.role_members.get(role, [])
+
+    def alive_members(self, role: str) -> AbstractSet[str]:
+        """某角色的存活玩家（只读，不要直接修改）"""
+        return self.alive_by_role.get(role, _NO_PLAYERS)
+
+    @property
+    def alive_wolf_count(self) -> int:
+        """存活狼人数"""
+        return len(self.alive_members("werewolf"))
+
+    @property
+    def alive_god_count(self) -> int:
+        """存活神职数"""
+        return sum(len(self.alive_members(role)) for role in GOD_ROLES)
+
+    def iter_roles(self):
+        """遍历 (玩家ID, 角色)，按加入顺序"""
+        for player in self.players.values():
+            if player.role is not None:
+                yield player.id, player.role
+
+    def number_of(self, player_id: str, default=None):
+        """获取玩家编号"""
+        player = self.players.get(player_id)
+        return player.number if player and player.number is not None else default
+
+    def display_name(self, player_id: str) -> str:
+        """玩家显示名：编号号.昵称"""
+        return f"{self.number_of(player_id, '?')}号.{self.name_of(player_id)}"
+
+    def name_of(self, player_id: str, default: str = "未知") -> str:
+        """获取玩家昵称"""
+        player = self.players.get(player_id)
+        return player.name if player else default
@@ -0,0 +1,339 @@
+"""
+预置配置平衡性模拟
+用脚本化的玩家策略直接驱动规则引擎，按预置配置批量对局，统计各阵营胜率和置信区间。
+
+用法（在插件目录下运行）：
+    python -m core.simulate --games 5000 --good-policy seer-trusting --wolf-policy wolf-coordinated
+"""
+import argparse
+import math
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from .engine import GameEngine, check_victory
+from .phases import GamePhase
+from .room import PRESET_CONFIGS, Player, Room, RoomConfig
+
+MAX_STEPS = 2000  # 单局最多推进的步数，超过视为僵局（正常一局远小于此）
+
+
+class Knowledge:
+    """一局中各策略共享的信息"""
+    __slots__ = ("checks", "claims", "wolf_plan")
+
+    def __init__(self):
+        self.checks: Dict[str, bool] = {}     # 预言家私有的验人结果：玩家 -> 是否狼人
+        self.claims: Dict[str, bool] = {}     # 预言家公开报出的验人结果
+        self.wolf_plan: Dict[Tuple[int, str], str] = {}  # (轮次, 场合) -> 狼队统一的目标
+
+
+class Game:
+    """策略看到的对局：房间状态 + 共享信息 + 随机数"""
+    __slots__ = ("room", "knowledge", "rng")
+
+    def __init__(self, room: Room, knowledge: Knowledge, rng: random.Random):
+        self.room = room
+        self.knowledge = knowledge
+        self.rng = rng
+
+    def alive(self, exclude: Optional[str] = None) -> List[str]:
+        """存活玩家（按编号排序，保证同一种子结果可复现）"""
+        return sorted((pid for pid in self.room.alive if pid != exclude), key=self.room.number_of)
+
+    def is_wolf(self, player_id: str) -> bool:
+        return self.room.role_of(player_id) == "werewolf"
+
+
+# ========== 策略 ==========
+
+class RandomPolicy:
+    """随机策略：每个决定都在合法选项中均匀随机（狼人不刀队友）"""
+
+    def wolf_target(self, game: Game, wolf: str) -> Optional[str]:
+        return game.rng.choice([pid for pid in game.alive() if not game.is_wolf(pid)])
+
+    def seer_target(self, game: Game, seer: str) -> str:
+        unchecked = [pid for pid in game.alive(exclude=seer) if pid not in game.knowledge.checks]
+        return game.rng.choice(unchecked or game.alive(exclude=seer))
+
+    def witch_action(self, game: Game, witch: str) -> Tuple[str, Optional[str]]:
+        """返回 ("save", None) / ("poison", 目标) / ("pass", None)"""
+        room = game.room
+        options: List[Tuple[str, Optional[str]]] = [("pass", None)]
+        if room.last_killed and not room.witch_antidote_used:
+            options.append(("save", None))
+        if not room.witch_poison_used:
+            options.append(("poison", game.rng.choice(game.alive(exclude=witch))))
+        return game.rng.choice(options)
+
+    def hunter_target(self, game: Game, hunter: str) -> Optional[str]:
+        candidates = game.alive(exclude=hunter)
+        return game.rng.choice(candidates) if candidates else None
+
+    def claims_on_speech(self, game: Game, seer: str) -> bool:
+        """预言家发言（或遗言）时是否公开验人结果"""
+        return False
+
+    def day_vote(self, game: Game, voter: str) -> Optional[str]:
+        """返回投票目标，None 为弃票"""
+        return game.rng.choice(self._candidates(game, voter))
+
+    def _candidates(self, game: Game, voter: str) -> List[str]:
+        room = game.room
+        if room.is_pk_vote:
+            others = [pid for pid in room.pk_players if pid != voter]
+            return others or list(room.pk_players)
+        return game.alive(exclude=voter)
+
+
+class SeerTrustingPolicy(RandomPolicy):
+    """好人相信预言家：预言家公开验人结果，好人集中投验出的狼、不投验过的好人，女巫首晚必救"""
+
+    def witch_action(self, game: Game, witch: str) -> Tuple[str, Optional[str]]:
+        room = game.room
+        if room.last_killed and not room.witch_antidote_used:
+            return ("save", None)
+        known_wolves = self._known_wolves(game)
+        if known_wolves and not room.witch_poison_used:
+            return ("poison", known_wolves[0])
+        return ("pass", None)
+
+    def hunter_target(self, game: Game, hunter: str) -> Optional[str]:
+        known_wolves = self._known_wolves(game)
+        if known_wolves:
+            return known_wolves[0]
+        suspects = self._suspects(game, game.alive(exclude=hunter))
+        return game.rng.choice(suspects) if suspects else None
+
+    def claims_on_speech(self, game: Game, seer: str) -> bool:
+        return True
+
+    def day_vote(self, game: Game, voter: str) -> Optional[str]:
+        candidates = self._candidates(game, voter)
+        known_wolves = [pid for pid in self._known_wolves(game) if pid in candidates]
+        if known_wolves:
+            return known_wolves[0]
+        return game.rng.choice(self._suspects(game, candidates) or candidates)
+
+    @staticmethod
+    def _known_wolves(game: Game) -> List[str]:
+        claims = game.knowledge.claims
+        return [pid for pid in game.alive() if claims.get(pid)]
+
+    @staticmethod
+    def _suspects(game: Game, candidates: List[str]) -> List[str]:
+        # 验过的好人不投
+        claims = game.knowledge.claims
+        return [pid for pid in candidates if claims.get(pid) is not False]
+
+
+class WolfCoordinatedPolicy(RandomPolicy):
+    """狼队协同：夜里统一刀同一人（优先跳出来的预言家），白天统一投同一个好人"""
+
+    def wolf_target(self, game: Game, wolf: str) -> Optional[str]:
+        return self._plan(game, "night", [pid for pid in game.alive() if not game.is_wolf(pid)])
+
+    def day_vote(self, game: Game, voter: str) -> Optional[str]:
+        candidates = self._candidates(game, voter)
+        goods = [pid for pid in candidates if not game.is_wolf(pid)]
+        if not goods:
+            return None  # PK 只剩狼队友时弃票
+        return self._plan(game, "pk" if game.room.is_pk_vote else "day", goods)
+
+    def _plan(self, game: Game, occasion: str, goods: List[str]) -> str:
+        # 同一轮同一场合第一个行动的狼人定目标，其余狼人跟随
+        key = (game.room.current_round, occasion)
+        target = game.knowledge.wolf_plan.get(key)
+        if target not in goods:
+            # 预言家公开过验人结果就暴露了身份
+            claimed_seer = [pid for pid in goods if game.room.role_of(pid) == "seer"] if game.knowledge.claims else []
+            target = claimed_seer[0] if claimed_seer else game.rng.choice(goods)
+            game.knowledge.wolf_plan[key] = target
+        return target
+
+
+POLICIES = {
+    "random": RandomPolicy,
+    "seer-trusting": SeerTrustingPolicy,
+    "wolf-coordinated": WolfCoordinatedPolicy,
+}
+GOOD_POLICIES = ("random", "seer-trusting")     # 好人阵营可用的策略
+WOLF_POLICIES = ("random", "wolf-coordinated")  # 狼人阵营可用的策略
+
+
+# ========== 对局 ==========
+
+def new_room(config: RoomConfig) -> Room:
+    """创建一个没有聊天平台的房间，玩家 ID 为 p1、p2……"""
+    room = Room(config, creator="p1", msg_origin=None, bot=None)
+    for index in range(1, config.total + 1):
+        player_id = f"p{index}"
+        room.players[player_id] = Player(player_id, player_id)
+    return room
+
+
+def play_game(config: RoomConfig, good_policy: RandomPolicy, wolf_policy: RandomPolicy,
+              rng: random.Random) -> Tuple[Optional[str], int]:
+    """按策略下完一局，返回 (胜利阵营, 轮数)，僵局时阵营为 None"""
+    engine = GameEngine(rng)
+    room = new_room(config)
+    engine.start(room)
+    game = Game(room, Knowledge(), rng)
+
+    def policy(player_id: str) -> RandomPolicy:
+        return wolf_policy if game.is_wolf(player_id) else good_policy
+
+    for _ in range(MAX_STEPS):
+        phase = room.phase
+        if phase == GamePhase.FINISHED:
+            return check_victory(room)[1], room.current_round
+
+        if phase == GamePhase.NIGHT_WOLF:
+            for wolf in sorted(room.alive_members("werewolf"), key=room.number_of):
+                if room.phase != GamePhase.NIGHT_WOLF:
+                    break
+                target = policy(wolf).wolf_target(game, wolf)
+                if target is None:
+                    engine.wolf_timeout(room)
+                    break
+                engine.wolf_vote(room, wolf, target)
+
+        elif phase == GamePhase.NIGHT_SEER:
+            seer = next(iter(room.alive_members("seer")), None)
+            if seer is None:
+                engine.seer_timeout(room)
+            else:
+                target = policy(seer).seer_target(game, seer)
+                game.knowledge.checks[target] = game.is_wolf(target)
+                engine.seer_check(room, seer, target)
+
+        elif phase == GamePhase.NIGHT_WITCH:
+            witch = next(iter(room.alive_members("witch")), None)
+            if witch is None:
+                engine.witch_timeout(room)
+            else:
+                action, target = policy(witch).witch_action(game, witch)
+                if action == "save":
+                    engine.witch_save(room, witch)
+                elif action == "poison":
+                    engine.witch_poison(room, witch, target)
+                else:
+                    engine.witch_pass(room, witch)
+
+        elif phase == GamePhase.HUNTER_SHOT:
+            hunter = room.pending_hunter_shot
+            target = policy(hunter).hunter_target(game, hunter)
+            if target is None:
+                engine.hunter_timeout(room)
+            else:
+                engine.hunter_shoot(room, hunter, target)
+
+        elif phase == GamePhase.LAST_WORDS:
+            _speak(game, room.last_killed, policy)
+            engine.finish_last_words(room, room.last_killed)
+
+        elif phase in (GamePhase.DAY_SPEAKING, GamePhase.DAY_PK):
+            _speak(game, room.current_speaker, policy)
+            engine.finish_speech(room, room.current_speaker)
+
+        elif phase == GamePhase.DAY_VOTE:
+            for voter in game.alive():
+                if room.phase != GamePhase.DAY_VOTE:
+                    break
+                engine.day_vote(room, voter, policy(voter).day_vote(game, voter))
+
+    return None, room.current_round
+
+
+def _speak(game: Game, speaker: str, policy) -> None:
+    # 模拟里发言只用来公开预言家的验人结果
+    if game.room.role_of(speaker) == "seer" and policy(speaker).claims_on_speech(game, speaker):
+        game.knowledge.claims.update(game.knowledge.checks)
+
+
+def run_batch(total: int, good: str, wolf: str, games: int, seed: int) -> Dict[str, int]:
+    """在一个进程里连续模拟 games 局，返回各结果的计数和总轮数"""
+    config = RoomConfig.from_preset(total, PRESET_CONFIGS[total])
+    rng = random.Random(seed)
+    good_policy, wolf_policy = POLICIES[good](), POLICIES[wolf]()
+    counts = {"villager": 0, "werewolf": 0, "stalled": 0, "rounds": 0}
+    for _ in range(games):
+        winner, rounds = play_game(config, good_policy, wolf_policy, rng)
+        counts[winner or "stalled"] += 1
+        counts["rounds"] += rounds
+    return counts
+
+
+# ========== 统计 ==========
+
+def wilson_interval(wins: int, n: int, z: float = 1.96) -> Tuple[float, float]:
+    """胜率的 Wilson 置信区间（默认 95%）"""
+    if n == 0:
+        return 0.0, 1.0
+    p = wins / n
+    denom = 1 + z * z / n
+    center = (p + z * z / (2 * n)) / denom
+    half = z * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / denom
+    return max(0.0, center - half), min(1.0, center + half)
+
+
+def simulate(players: List[int], games: int, good: str, wolf: str, workers: int,
+             seed: int, chunk: int = 500) -> Dict[int, Dict[str, int]]:
+    """按预置配置并行模拟，返回 {人数: 计数}；每个分块的种子固定，结果与进程数无关"""
+    jobs = []
+    for total in players:
+        for index, start in enumerate(range(0, games, chunk)):
+            jobs.append((total, good, wolf, min(chunk, games - start), seed * 1_000_003 + total * 10_007 + index))
+
+    results: Dict[int, Dict[str, int]] = {total: {} for total in players}
+    if workers <= 1:
+        batches = [run_batch(*job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            batches = list(pool.map(run_batch, *zip(*jobs)))
+    for job, counts in zip(jobs, batches):
+        merged = results[job[0]]
+        for key, value in counts.items():
+            merged[key] = merged.get(key, 0) + value
+    return results
+
+
+def format_report(results: Dict[int, Dict[str, int]], z: float = 1.96) -> str:
+    lines = [f"{'人数':<4} {'配置':<14} {'局数':>6} {'好人胜率':>8} {'95% 置信区间':>16} {'平均轮数':>8} {'僵局':>4}"]
+    for total, counts in sorted(results.items()):
+        preset = PRESET_CONFIGS[total]
+        composition = f"{preset['werewolf']}狼{preset['seer']}预{preset['witch']}巫{preset['hunter']}猎{preset['villager']}民"
+        decided = counts["villager"] + counts["werewolf"]
+        n = decided + counts["stalled"]
+        low, high = wilson_interval(counts["villager"], decided, z)
+        rate = counts["villager"] / decided if decided else 0.0
+        lines.append(
+            f"{total:<6} {composition:<12} {n:>8} {rate:>10.1%} {f'[{low:.1%}, {high:.1%}]':>18} "
+            f"{counts['rounds'] / max(n, 1):>10.2f} {counts['stalled']:>6}"
+        )
+    return "\n".join(lines)
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="狼人杀预置配置平衡性模拟")
+    parser.add_argument("--players", type=int, nargs="+", default=sorted(PRESET_CONFIGS),
+                        choices=sorted(PRESET_CONFIGS), help="要模拟的人数（默认全部预置配置）")
+    parser.add_argument("--games", type=int, default=2000, help="每个配置模拟的局数")
+    parser.add_argument("--good-policy", choices=GOOD_POLICIES, default="random", help="好人阵营的策略")
+    parser.add_argument("--wolf-policy", choices=WOLF_POLICIES, default="random", help="狼人阵营的策略")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="进程数（1 为单进程）")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    results = simulate(args.players, args.games, args.good_policy, args.wolf_policy, args.workers, args.seed)
+    print(f"好人策略：{args.good_policy}  狼人策略：{args.wolf_policy}  种子：{args.seed}")
+    print(format_report(results))
+    print(f"耗时 {time.perf_counter() - started:.1f} 秒")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,374 @@
+"""
+NumPy 批量模拟
+把 N 局游戏的状态放进数组（存活矩阵、身份矩阵、药水标记、验人结果），
+每个夜晚/白天阶段对所有对局一次性做向量运算，用来快速扫描各种角色组合的胜率。
+
+规则与 core/engine.py 一致；策略对应 core/simulate.py 中的 random、seer-trusting、wolf-coordinated。
+需要安装 numpy（插件本身不依赖）。
+
+用法（在插件目录下运行）：
+    python -m core.simulate_batch --max-players 12 --games 20000
+    python -m core.simulate_batch --presets --good-policy seer-trusting
+"""
+import argparse
+import time
+from itertools import product
+from typing import Dict, Iterator, List, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # 可选依赖：只有批量模拟需要
+    np = None
+
+from .room import PRESET_CONFIGS
+from .simulate import GOOD_POLICIES, WOLF_POLICIES, wilson_interval
+
+VILLAGER, WEREWOLF, SEER, WITCH, HUNTER = range(5)
+ROLE_CODES = {"villager": VILLAGER, "werewolf": WEREWOLF, "seer": SEER, "witch": WITCH, "hunter": HUNTER}
+MAX_ROUNDS = 50  # 超过视为僵局
+CHUNK = 100000   # 每批最多同时模拟的局数（控制内存）
+
+
+def _require_numpy():
+    if np is None:
+        raise SystemExit("批量模拟需要 numpy：pip install numpy")
+
+
+class BatchGames:
+    """N 局相同配置的对局，按轮（一夜 + 一天）同步推进；轮内用 active 掩码排除已结束的对局，轮末移出数组"""
+
+    def __init__(self, composition: Dict[str, int], n: int, rng: "np.random.Generator",
+                 trust_seer: bool = False, wolves_coordinate: bool = False):
+        pool = np.array([ROLE_CODES[role] for role, count in composition.items() for _ in range(count)])
+        self.n, self.p = n, len(pool)
+        self.rng = rng
+        self.trust_seer = trust_seer
+        self.wolves_coordinate = wolves_coordinate
+
+        self.roles = rng.permuted(np.tile(pool, (n, 1)), axis=1)  # 玩家下标即编号 - 1
+        self.is_wolf = self.roles == WEREWOLF
+        self.is_god = (self.roles == SEER) | (self.roles == WITCH) | (self.roles == HUNTER)
+        self.alive = np.ones((n, self.p), dtype=bool)
+        self.antidote = np.ones(n, dtype=bool)
+        self.poison = np.ones(n, dtype=bool)
+        self.checks = np.full((n, self.p), -1, dtype=np.int8)  # 预言家私有的验人结果：-1 未验 / 0 好人 / 1 狼人
+        self.claims = np.full((n, self.p), -1, dtype=np.int8)  # 预言家公开的验人结果
+        self.active = np.ones(n, dtype=bool)
+        self.winner = np.zeros(n, dtype=np.int8)  # 0 未分胜负 / 1 好人 / 2 狼人
+        self.rounds = np.zeros(n, dtype=np.int32)
+        self._rows = np.arange(n)
+        self._done = {"villager": 0, "werewolf": 0, "rounds": 0}  # 已从数组中移除的对局的结果
+        self._not_self = ~np.eye(self.p, dtype=bool)
+
+    # ========== 向量化工具 ==========
+
+    def _choose(self, mask: "np.ndarray") -> Tuple["np.ndarray", "np.ndarray"]:
+        """每局在 mask (N, P) 的 True 中均匀随机选一个，返回 (下标, 是否有可选项)"""
+        noise = np.where(mask, self.rng.random(mask.shape), -1.0)
+        return noise.argmax(axis=1), mask.any(axis=1)
+
+    def _choose_other(self, members: "np.ndarray") -> Tuple["np.ndarray", "np.ndarray"]:
+        """每名玩家从本局的集合 members (N, P) 中随机选一个自己以外的人，返回 (N, P) 的 (下标, 是否有可选项)
+
+        把集合成员按编号排到前面，抽一个名次并跳过自己的名次，不需要 N×P×P 的数组
+        """
+        order = np.argsort(~members, axis=1, kind="stable")
+        rank = np.cumsum(members, axis=1) - 1
+        available = members.sum(axis=1, keepdims=True) - members
+        pick = (self.rng.random((self.n, self.p)) * available).astype(np.intp)
+        pick += members & (pick >= rank)
+        return np.take_along_axis(order, np.minimum(pick, self.p - 1), axis=1), available > 0
+
+    @staticmethod
+    def _first(mask: "np.ndarray") -> Tuple["np.ndarray", "np.ndarray"]:
+        """每局第一个 True（编号最小），返回 (下标, 是否存在)"""
+        return mask.argmax(axis=1), mask.any(axis=1)
+
+    def _tally(self, choice: "np.ndarray", valid: "np.ndarray") -> "np.ndarray":
+        """把每个投票者的选择 (N, P) 汇总成每名玩家的得票数 (N, P)"""
+        flat = (self._rows[:, None] * self.p + choice)[valid]
+        return np.bincount(flat, minlength=self.n * self.p).reshape(self.n, self.p)
+
+    def _kill(self, rows: "np.ndarray", players: "np.ndarray"):
+        self.alive[self._rows[rows], players[rows]] = False
+
+    def _role_at(self, players: "np.ndarray") -> "np.ndarray":
+        return self.roles[self._rows, players]
+
+    def _publish_checks(self, rows: "np.ndarray"):
+        """预言家发言或留遗言时公开验人结果（只有相信预言家的策略会报）"""
+        if self.trust_seer:
+            self.claims[rows] = self.checks[rows]
+
+    def _known_wolves(self) -> "np.ndarray":
+        return self.alive & (self.claims == 1)
+
+    def _wolf_plan(self, goods: "np.ndarray") -> Tuple["np.ndarray", "np.ndarray"]:
+        """狼队统一的目标：预言家公开过验人结果就优先选他，否则随机选一个好人"""
+        claimed = (self.claims >= 0).any(axis=1)
+        seer, seer_found = self._first(goods & (self.roles == SEER) & claimed[:, None])
+        target, has = self._choose(goods)
+        return np.where(seer_found, seer, target), has
+
+    def _check_victory(self, rows: "np.ndarray"):
+        rows = rows & self.active
+        wolves = (self.alive & self.is_wolf).sum(axis=1)
+        goods = self.alive.sum(axis=1) - wolves
+        gods = (self.alive & self.is_god).sum(axis=1)
+        villager_win = rows & (wolves == 0)
+        wolf_win = rows & ~villager_win & ((goods <= wolves) | (gods == 0))
+        self.winner[villager_win] = 1
+        self.winner[wolf_win] = 2
+        self.active[villager_win | wolf_win] = False
+
+    # ========== 一轮 ==========
+
+    def run(self, max_rounds: int = MAX_ROUNDS):
+        for _ in range(max_rounds):
+            if not self.active.any():
+                break
+            self._night()
+            self._day()
+            self._compact()
+
+    def _compact(self):
+        """把已结束的对局移出数组，后面的轮次只对还在进行的对局做运算"""
+        if self.active.all():
+            return
+        ended = ~self.active
+        self._done["villager"] += int((self.winner[ended] == 1).sum())
+        self._done["werewolf"] += int((self.winner[ended] == 2).sum())
+        self._done["rounds"] += int(self.rounds[ended].sum())
+        keep = self.active
+        for name in ("roles", "is_wolf", "is_god", "alive", "antidote", "poison", "checks", "claims",
+                     "active", "winner", "rounds"):
+            setattr(self, name, getattr(self, name)[keep])
+        self.n = int(keep.sum())
+        self._rows = np.arange(self.n)
+
+    def _night(self):
+        rows = self.active.copy()
+        self.rounds[rows] += 1
+        first_night = rows & (self.rounds == 1)
+        goods_alive = self.alive & ~self.is_wolf
+
+        # 狼人刀人
+        if self.wolves_coordinate:
+            killed, _ = self._wolf_plan(goods_alive)
+        else:
+            wolves_alive = self.alive & self.is_wolf
+            choice, has = self._choose_other(goods_alive)
+            counts = self._tally(choice, wolves_alive & has)
+            killed, _ = self._choose(counts == counts.max(axis=1, keepdims=True))
+        has_kill = rows & goods_alive.any(axis=1)
+
+        # 预言家验人
+        seer, seer_alive = self._first(self.alive & (self.roles == SEER))
+        seer_alive &= rows
+        others = self.alive & self._not_self[seer]
+        unchecked = others & (self.checks < 0)
+        target, _ = self._choose(np.where(unchecked.any(axis=1, keepdims=True), unchecked, others))
+        checked = seer_alive & others.any(axis=1)
+        self.checks[self._rows[checked], target[checked]] = self.is_wolf[self._rows, target][checked]
+
+        # 女巫：救人 / 毒人 / 不操作
+        witch, witch_alive = self._first(self.alive & (self.roles == WITCH))
+        witch_alive &= rows
+        can_save = witch_alive & has_kill & self.antidote
+        can_poison = witch_alive & self.poison
+        poison_candidates = self.alive & self._not_self[witch]
+        if self.trust_seer:
+            known, has_known = self._first(self._known_wolves())
+            save = can_save
+            poison = ~save & can_poison & has_known
+            poison_target = known
+        else:
+            options = np.stack([np.ones(self.n, dtype=bool), can_save, can_poison & poison_candidates.any(axis=1)], axis=1)
+            option, _ = self._choose(options)
+            save, poison = option == 1, option == 2
+            poison_target, _ = self._choose(poison_candidates)
+        self.antidote &= ~save
+        self.poison &= ~poison
+
+        # 天亮结算
+        killed_final = has_kill & ~save
+        poisoned_hunter = poison & (self._role_at(poison_target) == HUNTER)
+        pending_hunter = killed_final & (self._role_at(killed) == HUNTER) & ~poisoned_hunter
+        seer_last_words = first_night & killed_final & (self._role_at(killed) == SEER)
+        self._kill(killed_final, killed)
+        self._kill(poison, poison_target)
+        self._check_victory(rows)
+
+        # 被刀的猎人开枪
+        shooting = pending_hunter & self.active
+        self._hunter_shoot(shooting, killed)
+        self._check_victory(shooting)
+
+        # 第一晚被刀的预言家留遗言
+        self._publish_checks(seer_last_words & self.active)
+
+    def _day(self):
+        rows = self.active.copy()
+        # 存活的预言家发言时公开验人结果
+        seer_alive = (self.alive & (self.roles == SEER)).any(axis=1)
+        self._publish_checks(rows & seer_alive)
+
+        counts = self._vote(rows, self.alive)
+        top = (counts == counts.max(axis=1, keepdims=True)) & (counts > 0)
+        tied = rows & (top.sum(axis=1) > 1)
+        exile_rows = rows & (top.sum(axis=1) == 1)
+
+        # 平票玩家 PK 发言后再投一次，再次平票本轮无人出局
+        if tied.any():
+            pk_players = top & tied[:, None]
+            pk_counts = self._vote(tied, pk_players)
+            pk_top = (pk_counts == pk_counts.max(axis=1, keepdims=True)) & (pk_counts > 0)
+            pk_exile = tied & (pk_top.sum(axis=1) == 1)
+            top = np.where(pk_exile[:, None], pk_top, top)
+            exile_rows |= pk_exile
+
+        exiled, _ = self._first(top)
+        exiled_role = self._role_at(exiled)
+        self._kill(exile_rows, exiled)
+
+        hunter = exile_rows & (exiled_role == HUNTER)
+        self._hunter_shoot(hunter, exiled)
+        self._check_victory(exile_rows)
+        # 被放逐的预言家留遗言
+        self._publish_checks(exile_rows & (exiled_role == SEER) & self.active)
+
+    def _vote(self, rows: "np.ndarray", members: "np.ndarray") -> "np.ndarray":
+        """所有存活玩家按各自阵营的策略投给 members 中自己以外的人，返回得票数 (N, P)"""
+        voters = self.alive & rows[:, None]
+        # 随机策略的选择：每名投票者只用一次，好人和狼人可以共用同一次抽样
+        anyone, has_anyone = self._choose_other(members)
+
+        if self.trust_seer:
+            known, has_known = self._first(members & self._known_wolves())
+            # 排除验过的好人，没有剩余时退回全部候选
+            suspect, has_suspect = self._choose_other(members & (self.claims != 0))
+            good_choice = np.where(has_known[:, None], known[:, None], np.where(has_suspect, suspect, anyone))
+        else:
+            good_choice = anyone
+
+        if self.wolves_coordinate:
+            # 狼队统一投同一个好人；PK 候选里没有好人时弃票
+            shared, has_good = self._wolf_plan(members & ~self.is_wolf & rows[:, None])
+            wolf_choice, wolf_valid = shared[:, None], has_good[:, None]
+        else:
+            wolf_choice, wolf_valid = anyone, has_anyone
+
+        choice = np.where(self.is_wolf, wolf_choice, good_choice)
+        valid = voters & np.where(self.is_wolf, wolf_valid, has_anyone)
+        return self._tally(choice, valid)
+
+    def _hunter_shoot(self, rows: "np.ndarray", hunter: "np.ndarray"):
+        if not rows.any():
+            return
+        candidates = self.alive & self._not_self[hunter]  # 开枪时猎人已经出局，这里只是保险
+        if self.trust_seer:
+            known, has_known = self._first(self._known_wolves())
+            suspects = candidates & (self.claims != 0)
+            fallback, has_suspect = self._choose(suspects)
+            target = np.where(has_known, known, fallback)
+            shoot = rows & (has_known | has_suspect)
+        else:
+            target, has = self._choose(candidates)
+            shoot = rows & has
+        self._kill(shoot, target)
+
+    # ========== 结果 ==========
+
+    def counts(self) -> Dict[str, int]:
+        return {
+            "villager": self._done["villager"] + int((self.winner == 1).sum()),
+            "werewolf": self._done["werewolf"] + int((self.winner == 2).sum()),
+            "stalled": int(self.active.sum()),
+            "rounds": self._done["rounds"] + int(self.rounds.sum()),
+        }
+
+
+def simulate_composition(composition: Dict[str, int], games: int, good: str, wolf: str,
+                         seed: int) -> Dict[str, int]:
+    """分批模拟一种角色组合，返回各结果的计数和总轮数"""
+    _require_numpy()
+    rng = np.random.default_rng(seed)
+    total = {"villager": 0, "werewolf": 0, "stalled": 0, "rounds": 0}
+    for start in range(0, games, CHUNK):
+        batch = BatchGames(composition, min(CHUNK, games - start), rng,
+                           trust_seer=good == "seer-trusting", wolves_coordinate=wolf == "wolf-coordinated")
+        batch.run()
+        for key, value in batch.counts().items():
+            total[key] += value
+    return total
+
+
+def compositions(min_players: int, max_players: int) -> Iterator[Dict[str, int]]:
+    """所有合理的角色组合：预言家/女巫/猎人各 0-1 个，狼人少于好人"""
+    for total in range(min_players, max_players + 1):
+        for wolves in range(1, (total + 1) // 2):
+            for seer, witch, hunter in product((0, 1), repeat=3):
+                villagers = total - wolves - seer - witch - hunter
+                if villagers >= 0:
+                    yield {"werewolf": wolves, "seer": seer, "witch": witch, "hunter": hunter, "villager": villagers}
+
+
+def describe(composition: Dict[str, int]) -> str:
+    return (f"{composition['werewolf']}狼{composition['seer']}预{composition['witch']}巫"
+            f"{composition['hunter']}猎{composition['villager']}民")
+
+
+def format_report(rows: List[Tuple[Dict[str, int], Dict[str, int]]]) -> str:
+    lines = [f"{'人数':<4} {'配置':<14} {'局数':>7} {'好人胜率':>8} {'95% 置信区间':>16} {'平均轮数':>8}"]
+    for composition, counts in rows:
+        decided = counts["villager"] + counts["werewolf"]
+        n = decided + counts["stalled"]
+        low, high = wilson_interval(counts["villager"], decided)
+        rate = counts["villager"] / decided if decided else 0.0
+        lines.append(
+            f"{sum(composition.values()):<6} {describe(composition):<12} {n:>9} {rate:>10.1%} "
+            f"{f'[{low:.1%}, {high:.1%}]':>18} {counts['rounds'] / max(n, 1):>10.2f}"
+        )
+    return "\n".join(lines)
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="狼人杀角色组合胜率批量扫描（NumPy）")
+    parser.add_argument("--games", type=int, default=20000, help="每种组合模拟的局数")
+    parser.add_argument("--min-players", type=int, default=5)
+    parser.add_argument("--max-players", type=int, default=12)
+    parser.add_argument("--presets", action="store_true", help="只模拟预置配置")
+    parser.add_argument("--top", type=int, default=0, help="每个人数只列出最接近 50%% 胜率的前几种组合（0 为全部）")
+    parser.add_argument("--good-policy", choices=GOOD_POLICIES, default="random", help="好人阵营的策略")
+    parser.add_argument("--wolf-policy", choices=WOLF_POLICIES, default="random", help="狼人阵营的策略")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子")
+    args = parser.parse_args(argv)
+    _require_numpy()
+
+    if args.presets:
+        candidates = [dict(preset) for _, preset in sorted(PRESET_CONFIGS.items())]
+    else:
+        candidates = list(compositions(args.min_players, args.max_players))
+
+    started = time.perf_counter()
+    results = [
+        (composition, simulate_composition(composition, args.games, args.good_policy, args.wolf_policy, args.seed + index))
+        for index, composition in enumerate(candidates)
+    ]
+
+    if args.top > 0:
+        by_size: Dict[int, list] = {}
+        for composition, counts in results:
+            decided = max(counts["villager"] + counts["werewolf"], 1)
+            by_size.setdefault(sum(composition.values()), []).append(
+                (abs(counts["villager"] / decided - 0.5), composition, counts))
+        results = [(composition, counts) for _, group in sorted(by_size.items())
+                   for _, composition, counts in sorted(group, key=lambda item: item[0])[:args.top]]
+
+    print(f"好人策略：{args.good_policy}  狼人策略：{args.wolf_policy}  种子：{args.seed}")
+    print(format_report(results))
+    print(f"{len(candidates)} 种组合，耗时 {time.perf_counter() - started:.1f} 秒")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""
+共享定时调度器
+所有房间的阶段截止时间都登记在同一个最小堆里，由一个后台任务统一休眠到最近的截止时间，
+无论有多少房间都只占用一个常驻 asyncio.Task。到期回调在独立的短生命周期任务里执行，
+回调内部取消或重新登记定时器不会打断自己。
+"""
+import asyncio
+import heapq
+import itertools
+from typing import Any, Awaitable, Callable, List, Optional, Set, Tuple
+
+
+class TimerHandle:
+    """已登记的定时器，可查询剩余时间、取消或延长"""
+    __slots__ = ("deadline", "label", "cancelled", "fired", "_callback", "_args", "_on_cancel", "_scheduler")
+
+    def __init__(self, scheduler: "TimerScheduler", deadline: float, label: str,
+                 callback: Callable[..., Awaitable], args: tuple,
+                 on_cancel: Optional[Callable[[], Any]]):
+        self.deadline = deadline
+        self.label = label
+        self.cancelled = False
+        self.fired = False
+        self._callback = callback
+        self._args = args
+        self._on_cancel = on_cancel
+        self._scheduler = scheduler
+
+    @property
+    def active(self) -> bool:
+        """尚未到期且未被取消"""
+        return not (self.cancelled or self.fired)
+
+    @property
+    def callback(self) -> Callable[..., Awaitable]:
+        """到期时执行的回调"""
+        return self._callback
+
+    def remaining(self) -> float:
+        """距离截止还有多少秒（已失效返回 0）"""
+        if not self.active:
+            return 0.0
+        return max(0.0, self.deadline - self._scheduler.time())
+
+    def cancel(self):
+        """取消定时器；已经触发的定时器取消无效（不会打断正在执行的回调）"""
+        if not self.active:
+            return
+        self.cancelled = True
+        self._scheduler._pending -= 1
+        if self._on_cancel:
+            self._on_cancel()
+
+    def extend(self, seconds: float) -> bool:
+        """顺延（负数为提前）截止时间，返回是否成功"""
+        return self._scheduler.reschedule(self, self.deadline + seconds)
+
+
+class TimerScheduler:
+    """基于最小堆的单任务定时调度器"""
+
+    def __init__(self, on_error: Optional[Callable[[TimerHandle, Exception], Any]] = None,
+                 on_fire: Optional[Callable[[TimerHandle, float], Any]] = None):
+        self._heap: List[Tuple[float, int, TimerHandle]] = []
+        self._seq = itertools.count()
+        self._pending = 0
+        self._runner: Optional[asyncio.Task] = None
+        self._waiter: Optional[asyncio.Future] = None
+        self._firing: Set[asyncio.Task] = set()
+        self._on_error = on_error
+        self._on_fire = on_fire  # 回调开始执行时调用，参数为定时器和相对截止时间的延迟（秒）
+
+    def __len__(self) -> int:
+        """待触发的定时器数量"""
+        return self._pending
+
+    @staticmethod
+    def time() -> float:
+        return asyncio.get_running_loop().time()
+
+    def schedule(self, delay: float, callback: Callable[..., Awaitable], *args,
+                 label: str = "", on_cancel: Optional[Callable[[], Any]] = None) -> TimerHandle:
+        """登记 delay 秒后执行 await callback(*args)"""
+        handle = TimerHandle(self, self.time() + max(0.0, delay), label, callback, args, on_cancel)
+        self._pending += 1
+        self._push(handle)
+        return handle
+
+    def reschedule(self, handle: TimerHandle, deadline: float) -> bool:
+        """修改截止时间（旧的堆条目留在堆里，弹出时按截止时间不一致丢弃）"""
+        if not handle.active:
+            return False
+        handle.deadline = deadline
+        self._push(handle)
+        return True
+
+    async def close(self):
+        """停止调度并取消所有正在执行的回调"""
+        tasks = list(self._firing)
+        if self._runner:
+            tasks.append(self._runner)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._runner = None
+        self._heap.clear()
+        self._pending = 0
+
+    def _push(self, handle: TimerHandle):
+        heapq.heappush(self._heap, (handle.deadline, next(self._seq), handle))
+        if self._runner is None or self._runner.done():
+            self._runner = asyncio.get_running_loop().create_task(self._run())
+        elif self._heap[0][2] is handle:
+            # 新的截止时间最早，唤醒后台任务重新计算休眠时长
+            self._wake()
+
+    def _wake(self):
+        if self._waiter and not self._waiter.done():
+            self._waiter.set_result(None)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            now = loop.time()
+            while self._heap:
+                deadline, _, handle = self._heap[0]
+                stale = not handle.active or deadline != handle.deadline
+                if not stale and deadline > now:
+                    break
+                heapq.heappop(self._heap)
+                if not stale:
+                    self._fire(loop, handle)
+
+            self._waiter = loop.create_future()
+            wakeup = loop.call_at(self._heap[0][0], self._wake) if self._heap else None
+            try:
+                await self._waiter
+            finally:
+                if wakeup:
+                    wakeup.cancel()
+                self._waiter = None
+
+    def _fire(self, loop: asyncio.AbstractEventLoop, handle: TimerHandle):
+        handle.fired = True
+        self._pending -= 1
+        task = loop.create_task(self._invoke(handle))
+        self._firing.add(task)
+        task.add_done_callback(self._firing.discard)
+
+    async def _invoke(self, handle: TimerHandle):
+        if self._on_fire:
+            self._on_fire(handle, self.time() - handle.deadline)
+        try:
+            await handle._callback(*handle._args)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            if self._on_error:
+                self._on_error(handle, e)
@@ -0,0 +1,220 @@
+"""
+调用追踪
+命令处理、阶段切换、超时结算各记录为一个 span（带房间、阶段、轮次），span 之间按调用关系嵌套；
+平台调用的耗时记到当时所在的 span 上，结束时把总耗时拆成三部分：
+    code_ms    插件自己的代码（含限速排队）
+    adapter_ms 等待平台调用返回（并发调用按时间段合并，不重复计算）
+    reply_ms   命令 yield 回复后等待框架发送
+结束的 span 由导出器写成 JSON Lines，字段名与 OpenTelemetry 的 span 一致。
+"""
+import contextlib
+import contextvars
+import functools
+import inspect
+import json
+import os
+import random
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+_current: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("werewolf_span", default=None)
+
+
+class Span:
+    """一次被追踪的调用"""
+    __slots__ = ("name", "trace_id", "span_id", "parent", "attributes", "start_ns", "started",
+                 "ended", "adapter", "reply", "error")
+
+    def __init__(self, name: str, parent: Optional["Span"], attributes: Dict[str, Any]):
+        if parent is not None and parent.ended is not None:
+            parent = None  # 后台任务继承了创建时的上下文，上级早已结束时作为新的根 span
+        self.name = name
+        self.parent = parent
+        self.trace_id = parent.trace_id if parent else f"{random.getrandbits(128):032x}"
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.attributes = attributes
+        self.start_ns = time.time_ns()
+        self.started = time.perf_counter()
+        self.ended: Optional[float] = None
+        self.adapter: List[Tuple[float, float]] = []  # 平台调用的 (开始, 结束)，perf_counter 时间
+        self.reply = 0.0
+        self.error: Optional[str] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        duration = self.ended - self.started
+        adapter = _merged_length(self.adapter)
+        attributes = dict(self.attributes)
+        attributes.update(
+            code_ms=round(max(0.0, duration - adapter - self.reply) * 1000, 3),
+            adapter_ms=round(adapter * 1000, 3),
+            reply_ms=round(self.reply * 1000, 3),
+            adapter_calls=len(self.adapter),
+        )
+        return {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent.span_id if self.parent else "",
+            "name": self.name,
+            "startTimeUnixNano": self.start_ns,
+            "endTimeUnixNano": self.start_ns + int(duration * 1e9),
+            "attributes": attributes,
+            "status": {"code": "ERROR", "message": self.error} if self.error else {"code": "OK"},
+        }
+
+
+def _merged_length(intervals: List[Tuple[float, float]]) -> float:
+    """时间段并集的总长度"""
+    total = 0.0
+    current_start = current_end = None
+    for start, end in sorted(intervals):
+        if current_end is None or start > current_end:
+            if current_end is not None:
+                total += current_end - current_start
+            current_start, current_end = start, end
+        else:
+            current_end = max(current_end, end)
+    if current_end is not None:
+        total += current_end - current_start
+    return total
+
+
+class JsonlExporter:
+    """每个结束的 span 写一行 JSON；文件超过 max_bytes 时轮转为 .1（只保留一份旧文件）"""
+
+    def __init__(self, path: str, max_bytes: int = 20 * 1024 * 1024, flush_every: int = 100):
+        self._path = path
+        self._max_bytes = max_bytes
+        self._flush_every = max(1, flush_every)
+        self._file = None
+        self._size = 0
+        self._pending = 0
+
+    def export(self, record: Dict[str, Any]):
+        if self._file is None:
+            os.makedirs(os.path.dirname(self._path) or ".", exist_ok=True)
+            self._file = open(self._path, "a", encoding="utf-8")
+            self._size = self._file.tell()
+        line = json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n"
+        self._file.write(line)
+        self._size += len(line.encode("utf-8"))
+        self._pending += 1
+        if self._pending >= self._flush_every:
+            self._file.flush()
+            self._pending = 0
+        if self._max_bytes and self._size >= self._max_bytes:
+            self._file.close()
+            self._file = None
+            os.replace(self._path, self._path + ".1")
+
+    def close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+
+
+class Tracer:
+    """span 的创建和导出；没有配置导出器时所有操作都直接跳过"""
+
+    def __init__(self):
+        self._export: Optional[Callable[[Dict[str, Any]], Any]] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self._export is not None
+
+    def configure(self, export: Optional[Callable[[Dict[str, Any]], Any]]):
+        """设置导出函数（例如 JsonlExporter.export），None 为关闭追踪"""
+        self._export = export
+
+    @contextlib.contextmanager
+    def span(self, name: str, *, root: bool = False, **attributes) -> Iterator[Optional[Span]]:
+        """同步或异步代码里记录一个 span：with tracer.span("名称", room=...) as span
+
+        root 为 True 时不挂到当前 span 下（例如定时器回调，执行时的上下文与调用关系无关）
+        """
+        if self._export is None:
+            yield None
+            return
+        span = Span(name, None if root else _current.get(), attributes)
+        token = _current.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            _current.reset(token)
+            self._finish(span)
+
+    def record_adapter(self, seconds: float):
+        """登记一次刚结束、耗时 seconds 的平台调用（记到当前 span 及其仍未结束的上级）"""
+        span = _current.get()
+        if span is None:
+            return
+        end = time.perf_counter()
+        while span is not None:
+            if span.ended is None:
+                span.adapter.append((end - seconds, end))
+            span = span.parent
+
+    def traced(self, name: Optional[str] = None,
+               attributes: Optional[Callable[..., Dict[str, Any]]] = None) -> Callable:
+        """装饰异步函数或异步生成器函数，每次调用记录一个 span
+
+        name 默认为函数名；attributes(*args, **kwargs) 在调用开始时计算 span 属性。
+        异步生成器只在函数体执行期间是当前 span，挂起在 yield 的时间记为 reply
+        """
+        def decorate(func):
+            span_name = name or func.__name__
+
+            if inspect.isasyncgenfunction(func):
+                @functools.wraps(func)
+                async def wrapper(*args, **kwargs):
+                    if self._export is None:
+                        async for item in func(*args, **kwargs):
+                            yield item
+                        return
+                    span = Span(span_name, _current.get(), attributes(*args, **kwargs) if attributes else {})
+                    agen = func(*args, **kwargs)
+                    try:
+                        while True:
+                            token = _current.set(span)
+                            try:
+                                item = await agen.__anext__()
+                            except StopAsyncIteration:
+                                break
+                            finally:
+                                _current.reset(token)
+                            suspended = time.perf_counter()
+                            try:
+                                yield item
+                            finally:
+                                span.reply += time.perf_counter() - suspended
+                    except BaseException as e:
+                        if not isinstance(e, GeneratorExit):
+                            span.error = f"{type(e).__name__}: {e}"
+                        raise
+                    finally:
+                        await agen.aclose()
+                        self._finish(span)
+            else:
+                @functools.wraps(func)
+                async def wrapper(*args, **kwargs):
+                    if self._export is None:
+                        return await func(*args, **kwargs)
+                    with self.span(span_name, **(attributes(*args, **kwargs) if attributes else {})):
+                        return await func(*args, **kwargs)
+
+            return wrapper
+
+        return decorate
+
+    def _finish(self, span: Span):
+        span.ended = time.perf_counter()
+        export = self._export
+        if export is not None:
+            export(span.to_dict())
+
+
+# 插件共用的追踪器（默认关闭）
+TRACER = Tracer()
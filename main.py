@@ -4,32 +4,88 @@
 神职：预言家 + 女巫 + 猎人
 流程：创建房间 → 分配角色 → 夜晚（狼人办掉→预言家验人→女巫行动） → 白天投票 → 判断胜负
 """
+import os
 import re
+import time
 import random
 import asyncio
-from typing import Dict, Set, List, Optional
-from enum import Enum
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Set
 
-from astrbot.api.star import Context, Star, register
+from astrbot.api.star import Context, Star, StarTools, register
 from astrbot.api import logger
 from astrbot.api.event import filter, AstrMessageEvent
 from astrbot.core.platform.astr_message_event import AstrMessageEvent
 from astrbot.core.message.components import At
 from astrbot.core.message.message_event_result import MessageChain
 
+from .core.cache import ReviewCache, cache_key
+from .core.engine import (
+    Dawn, Exiled, GameEngine, GameOver, HunterShot, HunterTimedOut, HunterTurn, NightFell, RuleViolation,
+    SeerTimedOut, Silenced, SpeakerDone, SpeakerTurn, TieBreak, VoteOpened, VoteTimedOut, WitchTimedOut,
+    WitchTurn, WolvesDone,
+)
+from .core.jobs import JobQueue
+from .core.events import Action, EventLog
+from .core.gamelog import GameLogger
+from .core.ledger import ADMIN, BAN, CARD, WHOLE_BAN, SideEffect, SideEffectLedger
+from .core.metrics import REGISTRY, MetricsServer, timed
+from .core.outbox import Outbox
+from .core.persistence import Journal
+from .core.ratelimit import NORMAL, RateLimitedBot, RateLimiter
+from .core.review import ParagraphChunker, compact_game_log, estimate_tokens
+from .core.room import (
+    PRESET_CONFIGS, SPEECH_MAX_CHARS, SPEECH_MAX_MESSAGES, GamePhase, GameRecord, Player, Room, RoomConfig,
+    RoleDelivery, SpeechBuffer,
+)
+from .core.timers import TimerScheduler
+from .core.tracing import TRACER, JsonlExporter
+
 
 # 游戏常量
-LOG_SEPARATOR = "=" * 30  # 游戏日志分隔线
-
-# 在 GameConfig 类定义之前或其中添加预置配置
-PRESET_CONFIGS = {
-    5:  {"werewolf": 2, "seer": 1, "witch": 0, "hunter": 1, "villager": 1},
-    6:  {"werewolf": 2, "seer": 1, "witch": 1, "hunter": 1, "villager": 1},
-    7:  {"werewolf": 2, "seer": 1, "witch": 1, "hunter": 1, "villager": 2},
-    8:  {"werewolf": 3, "seer": 1, "witch": 1, "hunter": 1, "villager": 2},
-    9:  {"werewolf": 3, "seer": 1, "witch": 1, "hunter": 1, "villager": 3}, # 标准局
-    10: {"werewolf": 3, "seer": 1, "witch": 1, "hunter": 1, "villager": 4},
-}
+ROLE_DM_RETRIES = 2  # 身份私聊发送失败后的自动重发次数
+RECOVERY_DELAY = 5  # 插件加载后等待多少秒再恢复存档中的房间（等待消息平台连接）
+# 存档里可以恢复的定时回调（按方法名保存）
+RESUMABLE_TIMEOUTS = frozenset({
+    "_wolf_kill_timeout", "_seer_check_timeout", "_witch_timeout", "_last_words_timeout",
+    "_speaking_timeout", "_pk_speaking_timeout", "_hunter_shot_timeout_for_vote",
+    "_hunter_shot_timeout", "_day_vote_reminder", "_day_vote_timeout",
+})
+
+# 指标（Prometheus 文本格式，开启 metrics_port 后通过 /metrics 导出）
+ROOMS_BY_PHASE = REGISTRY.gauge("werewolf_rooms", "当前房间数（按阶段）", ("phase",))
+GAMES_STARTED = REGISTRY.counter("werewolf_games_started_total", "开局次数")
+GAMES_FINISHED = REGISTRY.counter("werewolf_games_finished_total", "结束的对局数（按获胜阵营）", ("faction",))
+COMMAND_SECONDS = REGISTRY.histogram(
+    "werewolf_command_seconds", "命令处理耗时（秒，不含框架发送回复的时间）", ("command",))
+ADAPTER_SECONDS = REGISTRY.histogram(
+    "werewolf_adapter_call_seconds", "平台调用耗时（秒，不含限速排队）", ("method",))
+ADAPTER_FAILURES = REGISTRY.counter("werewolf_adapter_call_failures_total", "平台调用失败次数", ("method",))
+TIMER_DRIFT = REGISTRY.histogram(
+    "werewolf_timer_drift_seconds", "定时器回调实际执行时间与截止时间之差（秒）", ("timer",),
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0))
+AI_REVIEW_SECONDS = REGISTRY.histogram(
+    "werewolf_ai_review_seconds", "AI复盘生成耗时（秒，按生成方式）", ("mode",),
+    buckets=(1, 2, 5, 10, 20, 30, 60, 120, 300))
+
+
+def _command_span_attributes(plugin: "WerewolfPlugin", event: AstrMessageEvent, *args, **kwargs) -> dict:
+    """命令 span 的属性：房间（群号）、阶段、轮次和发送者"""
+    sender = event.get_sender_id()
+    group_id = event.get_group_id() or plugin.player_rooms.get(sender)
+    room = plugin.game_rooms.get(group_id) if group_id else None
+    return {
+        "room": group_id or "",
+        "user": sender,
+        "phase": room.phase.name if room else "",
+        "round": room.current_round if room else 0,
+    }
+
+
+def instrumented_command(func):
+    """命令处理函数统一的装饰：按函数名统计耗时，开启追踪时记录 span"""
+    return timed(COMMAND_SECONDS, "command")(TRACER.traced(attributes=_command_span_attributes)(func))
+
+
 class GameConfig:
     """游戏配置常量"""
     TOTAL_PLAYERS = 9          # 总玩家数
@@ -39,6 +95,7 @@ class GameConfig:
     HUNTER_COUNT = 1           # 猎人数量
     VILLAGER_COUNT = 3         # 平民数量
     BAN_DURATION_DAYS = 30     # 禁言时长（天）
+    BULK_CONCURRENCY = 5       # 批量群管理调用的最大并发数
 
     @classmethod
     def get_roles_pool(cls) -> List[str]:
@@ -52,19 +109,6 @@ class GameConfig:
         )
 
 
-class GamePhase(Enum):
-    """游戏阶段"""
-    WAITING = "等待中"
-    NIGHT_WOLF = "夜晚-狼人行动"
-    NIGHT_SEER = "夜晚-预言家验人"
-    NIGHT_WITCH = "夜晚-女巫行动"
-    LAST_WORDS = "遗言阶段"
-    DAY_SPEAKING = "白天发言"
-    DAY_VOTE = "白天投票"
-    DAY_PK = "PK发言"  # 平票时PK发言
-    FINISHED = "已结束"
-
-
 @register("astrbot_plugin_werewolf", "miao", "狼人杀游戏（3狼3神3平民+AI复盘）", "v1.0.0")
 class WerewolfPlugin(Star):
     def __init__(self, context: Context, config: dict = None, *args, **kwargs):
@@ -76,6 +120,8 @@ class WerewolfPlugin(Star):
         self.enable_ai_review = self.config.get("enable_ai_review", True)
         self.ai_review_model = self.config.get("ai_review_model", "")
         self.ai_review_prompt = self.config.get("ai_review_prompt", "")
+        self.ai_review_stream = self.config.get("ai_review_stream", True)
+        self.ai_review_token_budget = self.config.get("ai_review_token_budget", 3000)
 
         # 游戏人数配置
         GameConfig.TOTAL_PLAYERS = self.config.get("total_players", 9)
@@ -85,6 +131,7 @@ class WerewolfPlugin(Star):
         GameConfig.HUNTER_COUNT = self.config.get("hunter_count", 1)
         GameConfig.VILLAGER_COUNT = self.config.get("villager_count", 3)
         GameConfig.BAN_DURATION_DAYS = self.config.get("ban_duration_days", 30)
+        GameConfig.BULK_CONCURRENCY = max(1, self.config.get("bulk_concurrency", 5))
 
         # 验证配置
         role_sum = (GameConfig.WEREWOLF_COUNT + GameConfig.SEER_COUNT +
@@ -113,8 +160,111 @@ class WerewolfPlugin(Star):
         self.timeout_dead_min = self.config.get("timeout_dead_min", 10)
         self.timeout_dead_max = self.config.get("timeout_dead_max", 15)
 
+        # 对局日志：逐事件的高频日志按级别过滤、按房间抽样，参数只在真正输出时求值
+        self.glog = GameLogger(
+            logger,
+            level=self.config.get("game_log_level", "info"),
+            sample_rate=self.config.get("game_log_sample_rate", 1.0),
+        )
+
+        # 身份私聊并发数
+        self.role_dm_concurrency = max(1, self.config.get("role_dm_concurrency", 10))
+
+        # 每轮发言记录的上限（写入事件日志，供 AI 复盘）
+        self.speech_max_chars = max(1, self.config.get("speech_max_chars", SPEECH_MAX_CHARS))
+        self.speech_max_messages = max(1, self.config.get("speech_max_messages", SPEECH_MAX_MESSAGES))
+
         # 游戏房间：{群号: 房间数据}
-        self.game_rooms: Dict[str, Dict] = {}
+        self.game_rooms: Dict[str, Room] = {}
+        # 处于发言阶段（白天发言、PK发言、遗言）的群：{群号: 当前可发言的玩家}，capture_speech 先查这张表
+        self.speaking_groups: Dict[str, str] = {}
+        # 规则引擎：命令和超时都交给它结算，返回的效果由 _apply_effects 执行
+        self.engine = GameEngine()
+        self._effect_handlers = {
+            NightFell: self._on_night_fell,
+            WolvesDone: self._on_wolves_done,
+            SeerTimedOut: self._on_seer_timed_out,
+            WitchTurn: self._on_witch_turn,
+            WitchTimedOut: self._on_witch_timed_out,
+            Dawn: self._on_dawn,
+            Silenced: self._on_silenced,
+            HunterTurn: self._on_hunter_turn,
+            HunterShot: self._on_hunter_shot,
+            HunterTimedOut: self._on_hunter_timed_out,
+            SpeakerTurn: self._on_speaker_turn,
+            SpeakerDone: self._on_speaker_done,
+            TieBreak: self._on_tie_break,
+            VoteOpened: self._on_vote_opened,
+            VoteTimedOut: self._on_vote_timed_out,
+            Exiled: self._on_exiled,
+            GameOver: self._on_game_over,
+        }
+        # 所有房间共用一个定时调度器（只占用一个后台任务）
+        self.timers = TimerScheduler(
+            on_error=lambda handle, e: logger.error(f"[狼人杀] {handle.label}超时处理失败: {e}"),
+            on_fire=lambda handle, late: TIMER_DRIFT.observe(late, timer=handle.label),
+        )
+        # 玩家反向索引：{玩家ID: 群号}（一个玩家同一时间只能在一个房间中）
+        self.player_rooms: Dict[str, str] = {}
+        # 有房间存档、还没等到恢复的群：恢复前不能在这些群创建新房间，否则新房间会覆盖存档、随后又被存档顶替
+        self.pending_recovery: Set[str] = set()
+
+        # 出站调用限速：全局 / 每群 / 每用户令牌桶（每秒次数，<=0 不限速），私聊提示优先、改群昵称最后
+        self.limiter = RateLimiter(
+            global_rate=self.config.get("rate_limit_global", 20),
+            group_rate=self.config.get("rate_limit_group", 5),
+            user_rate=self.config.get("rate_limit_user", 2),
+        )
+
+        # 群消息出站队列：同一轮事件循环内发往同一个群的消息合并发送
+        self.outbox = Outbox(
+            self._send_merged,
+            size=lambda chain: len(chain.get_plain_text()),
+            max_size=max(1, self.config.get("message_merge_max_chars", 1500)),
+            on_error=lambda origin, e: logger.error(f"[狼人杀] 群消息发送失败 {origin}: {e}"),
+        )
+
+        # AI复盘后台队列：游戏结束立即清理房间，复盘生成后再发到群里
+        self.review_jobs = JobQueue(
+            self._run_ai_review,
+            workers=self.config.get("ai_review_workers", 2),
+            maxsize=max(0, self.config.get("ai_review_queue_size", 20)),
+            on_error=lambda record, e: logger.error(f"[狼人杀] 群 {record.group_id} AI复盘发送失败: {e}"),
+        )
+
+        # 房间存档：阶段切换时写入，重启后恢复或回滚
+        self.resume_games = self.config.get("resume_games_on_restart", True)
+        data_dir = str(StarTools.get_data_dir("astrbot_plugin_werewolf"))
+        compact_every = max(1, self.config.get("journal_compact_every", 200))
+        self.journal = Journal(
+            data_dir, "rooms", compact_every=compact_every,
+            on_error=lambda e: logger.warning(f"[狼人杀] 房间存档压缩失败: {e}"),
+        )
+        # 群管理副作用台账：禁言、临时管理员、群昵称等，加载和终止时撤销遗留项
+        self.ledger = SideEffectLedger(Journal(
+            data_dir, "effects", compact_every=compact_every,
+            on_error=lambda e: logger.warning(f"[狼人杀] 群管理台账压缩失败: {e}"),
+        ))
+        # AI复盘缓存：同一局游戏重复复盘时直接使用上次的结果
+        self.review_cache = ReviewCache(
+            os.path.join(data_dir, "review_cache"),
+            max_bytes=int(max(0, self.config.get("ai_review_cache_mb", 5)) * 1024 * 1024),
+        )
+        self.last_records: Dict[str, tuple] = {}  # 群号 -> (最近一局的对局快照, 房主)
+
+        # 调用追踪：命令、阶段切换和超时结算的 span 写入插件数据目录的 traces.jsonl
+        self.trace_exporter = JsonlExporter(
+            os.path.join(data_dir, "traces.jsonl"),
+            max_bytes=int(max(0, self.config.get("trace_max_mb", 20)) * 1024 * 1024),
+        ) if self.config.get("trace_enabled", False) else None
+        TRACER.configure(self.trace_exporter.export if self.trace_exporter else None)
+
+        # 指标导出：metrics_port 为 0 时不监听端口，指标照常统计
+        REGISTRY.add_collector(self._collect_metrics)
+        metrics_port = self.config.get("metrics_port", 0)
+        self.metrics_server = MetricsServer(
+            REGISTRY, host=self.config.get("metrics_host", "127.0.0.1"), port=metrics_port,
+        ) if metrics_port > 0 else None
 
         ai_status = "已关闭" if not self.enable_ai_review else (
             f"{self.ai_review_model if self.ai_review_model else '默认模型'}"
@@ -126,8 +276,36 @@ class WerewolfPlugin(Star):
             f"({GameConfig.WEREWOLF_COUNT}狼{GameConfig.SEER_COUNT+GameConfig.WITCH_COUNT+GameConfig.HUNTER_COUNT}神{GameConfig.VILLAGER_COUNT}民) | "
             f"AI复盘：{ai_status}"
         )
-        
+
+    async def initialize(self):
+        """插件初始化：启动指标端点，读取存档，稍后恢复重启前未结束的房间"""
+        if self.metrics_server:
+            try:
+                await self.metrics_server.start()
+                logger.info(f"[狼人杀] 指标端点已启动：http://{self.config.get('metrics_host', '127.0.0.1')}:"
+                            f"{self.metrics_server.port}/metrics")
+            except OSError as e:
+                logger.error(f"[狼人杀] 指标端点启动失败: {e}")
+        try:
+            self.review_cache.load()
+        except OSError as e:
+            logger.error(f"[狼人杀] 读取AI复盘缓存失败: {e}")
+        try:
+            saved = self.journal.load()
+            effects = self.ledger.load()
+        except (OSError, ValueError) as e:
+            logger.error(f"[狼人杀] 读取房间存档失败: {e}")
+            return
+        if saved or effects:
+            logger.info(
+                f"[狼人杀] 发现 {len(saved)} 个未结束的房间存档、{len(effects)} 项未撤销的群管理操作，"
+                f"{RECOVERY_DELAY} 秒后处理"
+            )
+            self.pending_recovery = set(saved)
+            self.timers.schedule(RECOVERY_DELAY, self._recover_rooms, saved, label="房间恢复")
+
     @filter.command("创建房间")
+    @instrumented_command
     async def create_room(self, event: AstrMessageEvent, player_count: int = 9): # 默认为9
         """创建游戏房间：/创建房间 [人数]"""
         group_id = event.get_group_id()
@@ -138,6 +316,10 @@ class WerewolfPlugin(Star):
         if group_id in self.game_rooms:
             yield event.plain_result("❌ 当前群已存在游戏房间！请先结束现有游戏。")
             return
+
+        if group_id in self.pending_recovery:
+            yield event.plain_result("⚠️ 插件刚重启，本群上一局游戏正在恢复，请稍后再试！")
+            return
         
         # 1. 检查是否有预置配置
         if player_count not in PRESET_CONFIGS:
@@ -149,71 +331,33 @@ class WerewolfPlugin(Star):
         config = PRESET_CONFIGS[player_count]
         
         # 3. 初始化房间，将配置存入房间数据中
-        self.game_rooms[group_id] = {
-            "config": {
-                "total": player_count,
-                "werewolf": config["werewolf"],
-                "seer": config["seer"],
-                "witch": config["witch"],
-                "hunter": config["hunter"],
-                "villager": config["villager"]
-            },
-            "players": set(),           
-            "player_names": {},         
-            "roles": {},                
-            "alive": set(),             
-            "phase": GamePhase.WAITING, 
-            "creator": event.get_sender_id(),
-            "night_votes": {},          
-            "day_votes": {},            
-            "night_result": None,       
-            "msg_origin": event.unified_msg_origin, 
-            "seer_checked": False,      
-            "banned_players": set(),    
-            "bot": event.bot,           
-            "timer_task": None,         
-            "speaking_order": [],       
-            "current_speaker_index": 0, 
-            "current_speaker": None,    
-            "temp_admins": set(),       
-            "last_killed": None,        
-            "witch_poison_used": False, 
-            "witch_antidote_used": False, 
-            "witch_saved": None,        
-            "witch_poisoned": None,     
-            "witch_acted": False,       
-            "is_first_night": True,     
-            "last_words_from_vote": False, 
-            "pk_players": [],           
-            "is_pk_vote": False,        
-            "player_numbers": {},       
-            "number_to_player": {},     
-            "original_group_cards": {}, 
-            "hunter_shot": False,       
-            "pending_hunter_shot": None,
-            "hunter_death_type": None,  
-            "game_log": [],             
-            "current_round": 0,         
-            "current_speech": [],       
-        }
+        self.game_rooms[group_id] = Room(
+            config=RoomConfig.from_preset(player_count, config),
+            creator=event.get_sender_id(),
+            msg_origin=event.unified_msg_origin,
+            bot=self._wrap_bot(event.bot),
+        )
+        self.game_rooms[group_id].current_speech = SpeechBuffer(self.speech_max_chars, self.speech_max_messages)
+        self._save_room(group_id, self.game_rooms[group_id])
 
         # 构建角色配置描述用于回显
-        cfg = self.game_rooms[group_id]["config"]
+        cfg = self.game_rooms[group_id].config
         god_roles = []
-        if cfg["seer"] > 0: god_roles.append(f"预言家×{cfg['seer']}")
-        if cfg["witch"] > 0: god_roles.append(f"女巫×{cfg['witch']}")
-        if cfg["hunter"] > 0: god_roles.append(f"猎人×{cfg['hunter']}")
+        if cfg.seer > 0: god_roles.append(f"预言家×{cfg.seer}")
+        if cfg.witch > 0: god_roles.append(f"女巫×{cfg.witch}")
+        if cfg.hunter > 0: god_roles.append(f"猎人×{cfg.hunter}")
 
         yield event.plain_result(
             f"✅ 狼人杀房间创建成功！\n\n"
             f"📋 游戏规则：\n"
-            f"• {cfg['total']}人局（{cfg['werewolf']}狼人 + {cfg['seer']+cfg['witch']+cfg['hunter']}神 + {cfg['villager']}平民）\n"
+            f"• {cfg.total}人局（{cfg.werewolf}狼人 + {cfg.seer+cfg.witch+cfg.hunter}神 + {cfg.villager}平民）\n"
             f"• 神职：{' + '.join(god_roles)}\n"
             f"• 游戏结束后{'生成' if self.enable_ai_review else '不生成'}AI复盘\n\n"
             f"💡 使用 /加入房间 来参与游戏\n"
-            f"👥 {cfg['total']}人齐全后，房主使用 /开始游戏"
+            f"👥 {cfg.total}人齐全后，房主使用 /开始游戏"
         )
     @filter.command("解散房间")
+    @instrumented_command
     async def dismiss_room(self, event: AstrMessageEvent):
         """解散当前房间（房主专用）"""
         group_id = event.get_group_id()
@@ -224,7 +368,7 @@ class WerewolfPlugin(Star):
         room = self.game_rooms[group_id]
         
         # 验证房主权限
-        if event.get_sender_id() != room["creator"]:
+        if event.get_sender_id() != room.creator:
             yield event.plain_result("⚠️ 只有房主才能解散房间！")
             return
 
@@ -236,6 +380,7 @@ class WerewolfPlugin(Star):
 
         yield event.plain_result("✅ 房间已成功解散！")
     @filter.command("加入房间")
+    @instrumented_command
     async def join_room(self, event: AstrMessageEvent):
         """加入游戏"""
         group_id = event.get_group_id()
@@ -248,22 +393,28 @@ class WerewolfPlugin(Star):
             return
 
         room = self.game_rooms[group_id]
-        if room["phase"] != GamePhase.WAITING:
+        if room.phase != GamePhase.WAITING:
             yield event.plain_result("❌ 游戏已开始，无法加入！")
             return
 
         player_id = event.get_sender_id()
-        if player_id in room["players"]:
+        if player_id in room.players:
             yield event.plain_result("⚠️ 你已经在游戏中了！")
             return
 
-        max_players = room["config"]["total"] # 修改这里：从房间配置获取总人数
+        # 私聊命令通过反向索引定位房间，所以不允许同时加入多个群的房间
+        if self.player_rooms.get(player_id, group_id) != group_id:
+            yield event.plain_result("⚠️ 你已经在其他群的游戏房间中了！请先结束那边的游戏。")
+            return
+
+        max_players = room.config.total # 修改这里：从房间配置获取总人数
 
-        if len(room["players"]) >= max_players:
+        if len(room.players) >= max_players:
             yield event.plain_result(f"❌ 房间已满（{max_players}/{max_players}）！")
             return
-        # 加入游戏
-        room["players"].add(player_id)
+        # 加入游戏（昵称稍后获取）
+        room.players[player_id] = Player(player_id, "")
+        self.player_rooms[player_id] = group_id
 
         # 获取玩家昵称
         try:
@@ -299,15 +450,17 @@ class WerewolfPlugin(Star):
             logger.warning(f"[狼人杀] 获取玩家昵称失败: {e}")
             player_name = f"玩家{player_id[-4:]}"
 
-        room["player_names"][player_id] = player_name
+        room.players[player_id].name = player_name
+        self._save_room(group_id, room)
 
         yield event.plain_result(
             f"✅ 成功加入游戏！\n\n"
-            f"当前人数：{len(room['players'])}/{max_players}"
+            f"当前人数：{len(room.players)}/{max_players}"
         )
 
 
     @filter.command("开始游戏")
+    @instrumented_command
     async def start_game(self, event: AstrMessageEvent):
         """开始游戏（房主专用）"""
         group_id = event.get_group_id()
@@ -316,52 +469,26 @@ class WerewolfPlugin(Star):
             return
 
         room = self.game_rooms[group_id]
-        config = room["config"] # 获取房间配置
+        config = room.config # 获取房间配置
         # 验证房主权限
-        if event.get_sender_id() != room["creator"]:
+        if event.get_sender_id() != room.creator:
             yield event.plain_result("⚠️ 只有房主才能开始游戏！")
             return
 
         # 验证人数
-        if len(room["players"]) != config["total"]:
-            yield event.plain_result(f"❌ 人数不足！当前 {len(room['players'])}/{config['total']} 人")
+        if len(room.players) != config.total:
+            yield event.plain_result(f"❌ 人数不足！当前 {len(room.players)}/{config.total} 人")
             return
 
-        if room["phase"] != GamePhase.WAITING:
+        if room.phase != GamePhase.WAITING:
             yield event.plain_result("❌ 游戏已经开始！")
             return
 
-        # 分配角色（完全随机）
-        players_list = list(room["players"])
-
-        # 分配编号（1-9）
-        for index, player_id in enumerate(players_list, start=1):
-            room["player_numbers"][player_id] = index
-            room["number_to_player"][index] = player_id
-
-        roles_pool = (
-            ["werewolf"] * config["werewolf"] +
-            ["seer"] * config["seer"] +
-            ["witch"] * config["witch"] +
-            ["hunter"] * config["hunter"] +
-            ["villager"] * config["villager"]
-        )
-        random.shuffle(roles_pool)
-
-        # 分配角色
-        for player_id, role in zip(players_list, roles_pool):
-            room["roles"][player_id] = role
-
-        # 初始化存活状态和验人记录
-        room["alive"] = set(players_list)
-        room["seer_checked"] = False  # 预言家是否已验人
-        room["phase"] = GamePhase.NIGHT_WOLF
-        room["current_round"] = 1  # 第一晚
-
-        # 记录日志
-        room["game_log"].append(LOG_SEPARATOR)
-        room["game_log"].append("第1晚")
-        room["game_log"].append(LOG_SEPARATOR)
+        # 分配编号和身份，进入第一晚；同时确认反向索引指向本房间
+        self.engine.start(room)
+        GAMES_STARTED.inc()
+        for player_id in room.players:
+            self.player_rooms[player_id] = group_id
 
         # 公告游戏开始
         yield event.plain_result(
@@ -374,23 +501,32 @@ class WerewolfPlugin(Star):
             "⏰ 剩余时间：2分钟"
         )
 
-        # 修改玩家群昵称为编号
-        await self._set_group_cards_to_numbers(group_id, room)
-
         # 开启全员禁言
         await self._set_group_whole_ban(group_id, room, True)
 
-        # 启动狼人办掉定时器
-        room["timer_task"] = asyncio.create_task(self._wolf_kill_timeout(group_id))
+        # 修改群昵称只是装饰（走最低优先级），放到后台，不拖延狼人定时器
+        room.card_task = asyncio.create_task(self._set_group_cards_to_numbers(group_id, room))
 
         # 主动私聊告知所有玩家身份
-        await self._send_roles_to_players(group_id, room)
+        undelivered = await self._send_roles_to_players(group_id, room)
+
+        # 身份发送完毕（含重发）后再启动狼人办掉定时器，保证狼人拿到完整的行动时间
+        # （发送期间狼人可能已经全部投票，或房间已被结束，此时不再启动）
+        if self.game_rooms.get(group_id) is room and room.phase == GamePhase.NIGHT_WOLF:
+            self._start_timer(group_id, room, self.timeout_wolf, "狼人办掉", self._wolf_kill_timeout)
+
+        if undelivered:
+            undelivered_names = ", ".join(self._format_player_name(pid, room) for pid in undelivered)
+            yield event.plain_result(
+                f"⚠️ 以下玩家未能收到身份私聊：{undelivered_names}\n"
+                f"请添加机器人为好友后私聊使用：/查角色"
+            )
 
         # 记录狼人用于调试
-        werewolves = [pid for pid, role in room["roles"].items() if role == "werewolf"]
-        logger.info(f"[狼人杀] 群 {group_id} - 狼人: {werewolves}")
+        self.glog.info("狼人名单", group_id, wolves=lambda: ",".join(room.members("werewolf")))
 
     @filter.command("查角色")
+    @instrumented_command
     async def check_role(self, event: AstrMessageEvent):
         """查看自己的角色（私聊）"""
         player_id = event.get_sender_id()
@@ -408,93 +544,17 @@ class WerewolfPlugin(Star):
             return
 
         # 获取角色
-        role = player_room["roles"].get(player_id)
+        role = player_room.role_of(player_id)
         if not role:
             yield event.plain_result("❌ 游戏尚未开始，角色还未分配！")
             return
 
         # 返回角色信息
-        if role == "werewolf":
-            # 找到其他狼人
-            werewolves = [pid for pid, r in player_room["roles"].items() if r == "werewolf"]
-            teammates = [pid for pid in werewolves if pid != player_id]
-
-            # 狼人队友信息
-            teammate_info = ""
-            if teammates:
-                teammate_names = ", ".join([self._format_player_name(pid, player_room) for pid in teammates])
-                teammate_info = f"\n\n🤝 你的队友：{teammate_names}"
-
-            # 列出所有其他玩家（除了狼人自己）
-            other_players = [pid for pid in player_room["players"] if pid not in werewolves]
-            players_list = "\n".join([f"  • {self._format_player_name(pid, player_room)}" for pid in other_players])
-
-            role_text = (
-                f"🐺 狼人\n\n"
-                f"你的目标：消灭所有平民！{teammate_info}\n\n"
-                f"📋 可选目标列表：\n{players_list}\n\n"
-                f"💡 夜晚私聊使用命令：\n"
-                f"  /办掉 编号 - 投票办掉目标\n"
-                f"  /密谋 消息 - 与队友交流\n"
-                f"示例：/办掉 {list(room['player_numbers'].values())[0] if room.get('player_numbers') else '1'}"
-            )
-        elif role == "seer":
-            # 列出所有其他玩家（预言家可以验所有人）
-            other_players = [pid for pid in player_room["players"] if pid != player_id]
-            players_list = "\n".join([f"  • {self._format_player_name(pid, player_room)}" for pid in other_players])
-
-            role_text = (
-                f"🔮 预言家\n\n"
-                f"你的目标：找出狼人，帮助平民获胜！\n\n"
-                f"📋 可验证玩家列表：\n{players_list}\n\n"
-                f"💡 夜晚私聊使用命令：\n"
-                f"/验人 编号\n"
-                f"示例：/验人 {room['player_numbers'][other_players[0]] if other_players else '3'}\n\n"
-                f"⚠️ 注意：每晚只能验证一个人！"
-            )
-        elif role == "witch":
-            # 列出所有其他玩家
-            other_players = [pid for pid in player_room["players"] if pid != player_id]
-            players_list = "\n".join([f"  • {self._format_player_name(pid, player_room)}" for pid in other_players])
-
-            role_text = (
-                f"💊 女巫\n\n"
-                f"你的目标：帮助平民获胜！\n\n"
-                f"你拥有两种药：\n"
-                f"💉 解药：可以救活当晚被杀的人（只能用一次）\n"
-                f"💊 毒药：可以毒杀任何人（只能用一次）\n\n"
-                f"⚠️ 注意：\n"
-                f"• 同一晚不能同时使用两种药\n"
-                f"• 解药只能救当晚被杀的人\n"
-                f"• 每晚女巫行动时会告知谁被杀\n\n"
-                f"💡 夜晚私聊使用命令：\n"
-                f"  /救人 - 救活被杀的人\n"
-                f"  /毒人 编号 - 毒杀某人\n"
-                f"  /不操作 - 不使用任何药"
-            )
-        elif role == "hunter":
-            # 列出所有其他玩家
-            other_players = [pid for pid in player_room["players"] if pid != player_id]
-            players_list = "\n".join([f"  • {self._format_player_name(pid, player_room)}" for pid in other_players])
-
-            role_text = (
-                f"🔫 猎人\n\n"
-                f"你的目标：帮助好人获胜！\n\n"
-                f"你的技能：\n"
-                f"• 被狼人办掉时可以开枪带走一人\n"
-                f"• 被投票放逐时可以开枪带走一人\n"
-                f"• 被女巫毒死时不能开枪（死的太突然）\n\n"
-                f"📋 可选目标列表：\n{players_list}\n\n"
-                f"💡 当你死亡时（非毒死），私聊使用命令：\n"
-                f"  /开枪 编号 - 带走一个人\n"
-                f"示例：/开枪 1"
-            )
-        else:
-            role_text = "👤 平民\n\n你的目标：找出并放逐所有狼人！\n白天投票时使用 /投票 编号 放逐可疑玩家。"
-
+        role_text = self._build_role_text(player_id, player_room)
         yield event.plain_result(f"🎭 你的角色是：\n\n{role_text}")
 
     @filter.command("游戏状态")
+    @instrumented_command
     async def show_status(self, event: AstrMessageEvent):
         """查看游戏状态"""
         group_id = event.get_group_id()
@@ -503,18 +563,19 @@ class WerewolfPlugin(Star):
             return
 
         room = self.game_rooms[group_id]
-        alive_count = len(room["alive"])
-        total_count = len(room["players"])
+        alive_count = len(room.alive)
+        total_count = len(room.players)
 
         status_text = (
             f"📊 游戏状态\n\n"
-            f"阶段：{room['phase'].value}\n"
+            f"阶段：{room.phase.value}\n"
             f"存活人数：{alive_count}/{total_count}\n"
         )
 
         yield event.plain_result(status_text)
 
     @filter.command("结束游戏")
+    @instrumented_command
     async def end_game(self, event: AstrMessageEvent):
         """强制结束游戏（房主专用）"""
         group_id = event.get_group_id()
@@ -523,7 +584,7 @@ class WerewolfPlugin(Star):
             return
 
         room = self.game_rooms[group_id]
-        if event.get_sender_id() != room["creator"]:
+        if event.get_sender_id() != room.creator:
             yield event.plain_result("⚠️ 只有房主才能结束游戏！")
             return
 
@@ -532,7 +593,30 @@ class WerewolfPlugin(Star):
 
         yield event.plain_result("✅ 游戏已强制结束！")
 
+    @filter.command("重新复盘")
+    @instrumented_command
+    async def rerun_ai_review(self, event: AstrMessageEvent):
+        """重新发送上一局的AI复盘（上一局房主或管理员），结果已缓存时不会再次调用模型"""
+        group_id = event.get_group_id()
+        if not self.enable_ai_review:
+            yield event.plain_result("❌ AI复盘已关闭！")
+            return
+        if not group_id or group_id not in self.last_records:
+            yield event.plain_result("❌ 当前群没有可以复盘的对局！")
+            return
+
+        record, creator = self.last_records[group_id]
+        if event.get_sender_id() != creator and not event.is_admin():
+            yield event.plain_result("⚠️ 只有上一局的房主或管理员才能重新复盘！")
+            return
+
+        if not self.review_jobs.submit(record):
+            yield event.plain_result("⚠️ 复盘队列已满，请稍后再试！")
+            return
+        yield event.plain_result("🤖 正在生成复盘，请稍候...")
+
     @filter.command("办掉")
+    @instrumented_command
     async def werewolf_kill(self, event: AstrMessageEvent):
         """狼人夜晚办掉目标（支持私聊）"""
         player_id = event.get_sender_id()
@@ -544,88 +628,36 @@ class WerewolfPlugin(Star):
             yield event.plain_result("❌ 你没有参与任何游戏！")
             return
 
-        # 验证阶段
-        if room["phase"] != GamePhase.NIGHT_WOLF:
-            yield event.plain_result("⚠️ 现在不是狼人行动阶段！")
-            return
-
-        # 验证身份
-        if room["roles"].get(player_id) != "werewolf":
-            yield event.plain_result("❌ 你不是狼人！")
-            return
-
-        # 验证存活
-        if player_id not in room["alive"]:
-            yield event.plain_result("❌ 你已经出局了！")
+        # 先校验身份和阶段，再解析目标
+        try:
+            self.engine.check_actor(room, player_id, "werewolf")
+        except RuleViolation as e:
+            yield event.plain_result(str(e))
             return
 
         # 获取目标（支持@、编号、QQ号）
-        target_str = self._get_target_user(event)
-        if not target_str:
-            yield event.plain_result("❌ 请指定目标！\n使用：/办掉 编号\n示例：/办掉 1")
-            return
-
-        # 解析目标（编号或QQ号）
-        target_id = self._parse_target(target_str, room)
-        if not target_id:
-            yield event.plain_result(f"❌ 无效的目标：{target_str}\n请使用玩家编号（1-9）")
+        target_id, error = self._get_target_player(event, room, "❌ 请指定目标！\n使用：/办掉 编号\n示例：/办掉 1")
+        if error:
+            yield event.plain_result(error)
             return
 
-        # 验证目标存活
-        if target_id not in room["alive"]:
-            yield event.plain_result("❌ 目标玩家已经出局！")
+        wolf_count = room.alive_wolf_count
+        try:
+            effects = self.engine.wolf_vote(room, player_id, target_id)
+        except RuleViolation as e:
+            yield event.plain_result(str(e))
             return
 
-        # 记录投票（允许选择任何存活玩家，包括队友和自己）
-        room["night_votes"][player_id] = target_id
-
-        # 记录日志
-        voter_name = self._format_player_name(player_id, room)
-        target_name = self._format_player_name(target_id, room)
-        room["game_log"].append(f"🐺 {voter_name}（狼人）选择刀 {target_name}")
-
-        yield event.plain_result(f"✅ 你选择了办掉目标！当前 {len(room['night_votes'])}/{len([p for p, r in room['roles'].items() if r == 'werewolf' and p in room['alive']])} 人已投票")
-
-        # 检查是否所有狼人都投票了
-        werewolves = [pid for pid, role in room["roles"].items() if role == "werewolf" and pid in room["alive"]]
-        if len(room["night_votes"]) >= len(werewolves):
-            # 取消狼人定时器
-            await self._cancel_timer(room)
-
-            # 处理夜晚办掉，将结果存储到房间
-            await self._process_night_kill(group_id)
-
-            # 检查游戏是否结束（_process_night_kill可能会清理房间）
-            if group_id not in self.game_rooms:
-                yield event.plain_result("✅ 所有狼人已投票完成！游戏结束。")
-                return  # 游戏已结束，退出
-
-            # 重新获取room引用，确保使用最新状态
-            room = self.game_rooms[group_id]
-
-            # 进入预言家验人阶段（不管预言家是否存活都进入，避免泄露身份）
-            room["phase"] = GamePhase.NIGHT_SEER
-            room["seer_checked"] = False
-
-            # 在群里发送预言家验人提示
-            if room.get("msg_origin"):
-                seer_msg = MessageChain().message("🔮 狼人行动完成！\n预言家请私聊机器人验人：/验人 编号\n⏰ 剩余时间：2分钟")
-                await self.context.send_message(room["msg_origin"], seer_msg)
-
-            # 启动预言家定时器（如果预言家已死，等待随机时间后自动进入下一阶段）
-            seer_alive = any(r == "seer" and pid in room["alive"] for pid, r in room["roles"].items())
-            if seer_alive:
-                # 预言家存活，正常倒计时
-                wait_time = self.timeout_seer
-            else:
-                # 预言家已死，随机等待
-                wait_time = random.uniform(self.timeout_dead_min, self.timeout_dead_max)
-
-            room["timer_task"] = asyncio.create_task(self._seer_check_timeout(group_id, wait_time))
+        voted = wolf_count if effects else len(room.night_votes)
+        yield event.plain_result(f"✅ 你选择了办掉目标！当前 {voted}/{wolf_count} 人已投票")
 
+        # 所有狼人都投票了：结算并进入预言家验人阶段
+        if effects:
             yield event.plain_result("✅ 所有狼人已投票完成！现在进入预言家验人阶段。")
+            await self._apply_effects(group_id, room, effects)
 
     @filter.command("密谋")
+    @instrumented_command
     async def werewolf_chat(self, event: AstrMessageEvent):
         """狼人队友之间交流（私聊）"""
         player_id = event.get_sender_id()
@@ -636,30 +668,24 @@ class WerewolfPlugin(Star):
             return
 
         # 查找玩家所在的游戏房间
-        room = None
-        group_id = None
-        for gid, r in self.game_rooms.items():
-            if player_id in r["players"]:
-                room = r
-                group_id = gid
-                break
+        group_id, room = self._get_player_room(player_id)
 
         if not room:
             yield event.plain_result("❌ 你没有参与任何游戏！")
             return
 
         # 验证身份
-        if room["roles"].get(player_id) != "werewolf":
+        if room.role_of(player_id) != "werewolf":
             yield event.plain_result("❌ 你不是狼人！")
             return
 
         # 验证存活
-        if player_id not in room["alive"]:
+        if player_id not in room.alive:
             yield event.plain_result("❌ 你已经出局了！")
             return
 
         # 验证阶段（只能在夜晚狼人行动阶段交流）
-        if room["phase"] != GamePhase.NIGHT_WOLF:
+        if room.phase != GamePhase.NIGHT_WOLF:
             yield event.plain_result("⚠️ 只能在夜晚狼人行动阶段与队友交流！")
             return
 
@@ -671,7 +697,7 @@ class WerewolfPlugin(Star):
             return
 
         # 找到其他存活的狼人队友
-        werewolves = [pid for pid, role in room["roles"].items() if role == "werewolf" and pid in room["alive"] and pid != player_id]
+        werewolves = room.alive_members("werewolf") - {player_id}
 
         if not werewolves:
             yield event.plain_result("❌ 没有其他存活的狼人队友！")
@@ -684,17 +710,18 @@ class WerewolfPlugin(Star):
         success_count = 0
         for teammate_id in werewolves:
             try:
-                await room["bot"].send_private_msg(user_id=int(teammate_id), message=teammate_msg)
+                await room.bot.send_private_msg(user_id=int(teammate_id), message=teammate_msg)
                 success_count += 1
             except Exception as e:
                 logger.error(f"[狼人杀] 发送消息给狼人 {teammate_id} 失败: {e}")
 
         # 记录日志
-        room["game_log"].append(f"💬 {sender_name}（狼人）密谋：{message_text}")
+        room.log(Action.WOLF_CHAT, player_id, text=message_text)
 
         yield event.plain_result(f"✅ 消息已发送给 {success_count} 名队友！")
 
     @filter.command("验人")
+    @instrumented_command
     async def seer_check(self, event: AstrMessageEvent):
         """预言家夜晚验人（支持私聊）"""
         player_id = event.get_sender_id()
@@ -706,107 +733,36 @@ class WerewolfPlugin(Star):
             yield event.plain_result("❌ 你没有参与任何游戏！")
             return
 
-        # 验证阶段
-        if room["phase"] != GamePhase.NIGHT_SEER:
-            yield event.plain_result("⚠️ 现在不是预言家验人阶段！")
-            return
-
-        # 验证身份
-        if room["roles"].get(player_id) != "seer":
-            yield event.plain_result("❌ 你不是预言家！")
-            return
-
-        # 检查是否已经验过人
-        if room.get("seer_checked"):
-            yield event.plain_result("❌ 你今晚已经验过人了！")
+        # 先校验身份和阶段，再解析目标
+        try:
+            self.engine.check_actor(room, player_id, "seer")
+        except RuleViolation as e:
+            yield event.plain_result(str(e))
             return
 
         # 获取目标（支持@、编号、QQ号）
-        target_str = self._get_target_user(event)
-        if not target_str:
-            yield event.plain_result("❌ 请指定验证目标！\n使用：/验人 编号\n示例：/验人 3")
-            return
-
-        # 解析目标（编号或QQ号）
-        target_id = self._parse_target(target_str, room)
-        if not target_id:
-            yield event.plain_result(f"❌ 无效的目标：{target_str}\n请使用玩家编号（1-9）")
+        target_id, error = self._get_target_player(event, room, "❌ 请指定验证目标！\n使用：/验人 编号\n示例：/验人 3")
+        if error:
+            yield event.plain_result(error)
             return
 
-        # 不能验自己
-        if target_id == player_id:
-            yield event.plain_result("❌ 不能验证自己！")
+        try:
+            effects = self.engine.seer_check(room, player_id, target_id)
+        except RuleViolation as e:
+            yield event.plain_result(str(e))
             return
 
-        # 获取目标身份
-        target_role = room["roles"].get(target_id)
-        is_werewolf = (target_role == "werewolf")
-
-        # 标记已验人
-        room["seer_checked"] = True
-
-        # 取消预言家定时器
-        await self._cancel_timer(room)
-
-        # 返回验人结果
+        # 返回验人结果（第一个效果总是 SeerResult），随后进入女巫阶段
         target_name = self._format_player_name(target_id, room)
-        seer_name = self._format_player_name(player_id, room)
-        if is_werewolf:
-            result_msg = f"🔮 验人结果：\n\n玩家 {target_name} 是 🐺 狼人！"
-            # 记录日志
-            room["game_log"].append(f"🔮 {seer_name}（预言家）验 {target_name}：狼人")
+        if effects[0].is_werewolf:
+            yield event.plain_result(f"🔮 验人结果：\n\n玩家 {target_name} 是 🐺 狼人！")
         else:
-            result_msg = f"🔮 验人结果：\n\n玩家 {target_name} 是 ✅ 好人！"
-            # 记录日志
-            room["game_log"].append(f"🔮 {seer_name}（预言家）验 {target_name}：好人")
-
-        yield event.plain_result(result_msg)
-
-        # 验人完成后进入女巫阶段
-        # 找到女巫（不管是否存活都要通知）
-        witch_id = None
-        for pid, r in room["roles"].items():
-            if r == "witch":
-                witch_id = pid
-                break
-
-        if witch_id:
-            # 进入女巫行动阶段
-            room["phase"] = GamePhase.NIGHT_WITCH
-            room["witch_acted"] = False
-            room["witch_saved"] = None
-            room["witch_poisoned"] = None
-
-            # 在群里发送女巫行动提示（不透露女巫是否存活）
-            if room.get("msg_origin"):
-                witch_msg = MessageChain().message("💊 预言家验人完成！\n女巫请私聊机器人行动\n⏰ 剩余时间：2分钟")
-                await self.context.send_message(room["msg_origin"], witch_msg)
-
-            # 给女巫发私聊，告知谁被杀（即使女巫已死也发送，让她知道自己被杀可以救自己）
-            await self._notify_witch(group_id, witch_id, room)
-
-            # 启动女巫定时器
-            # 如果女巫被杀了，给足够时间让她救自己
-            # 如果女巫没被杀但已死（前几晚死的），用随机短时间
-            witch_alive = witch_id in room["alive"]
-            witch_is_killed_tonight = (room.get("last_killed") == witch_id)
-
-            if witch_alive or witch_is_killed_tonight:
-                # 女巫存活，或者女巫今晚被杀（可以救自己）
-                wait_time = self.timeout_witch
-            else:
-                # 女巫早已死亡（前几晚死的），随机等待
-                wait_time = random.uniform(self.timeout_dead_min, self.timeout_dead_max)
-
-            room["timer_task"] = asyncio.create_task(self._witch_timeout(group_id, wait_time))
+            yield event.plain_result(f"🔮 验人结果：\n\n玩家 {target_name} 是 ✅ 好人！")
 
-            yield event.plain_result("✅ 预言家验人完成！现在进入女巫行动阶段。")
-        else:
-            # 不应该发生（游戏配置错误）
-            logger.error(f"[狼人杀] 游戏配置错误：找不到女巫角色")
-            yield event.plain_result("❌ 游戏配置错误！")
+        await self._apply_effects(group_id, room, effects)
 
     @filter.command("救人")
+    @instrumented_command
     async def witch_save(self, event: AstrMessageEvent):
         """女巫使用解药救人（私聊）"""
         player_id = event.get_sender_id()
@@ -818,59 +774,20 @@ class WerewolfPlugin(Star):
             yield event.plain_result("❌ 你没有参与任何游戏！")
             return
 
-        # 验证阶段
-        if room["phase"] != GamePhase.NIGHT_WITCH:
-            yield event.plain_result("⚠️ 现在不是女巫行动阶段！")
-            return
-
-        # 验证身份
-        if room["roles"].get(player_id) != "witch":
-            yield event.plain_result("❌ 你不是女巫！")
-            return
-
-        # 检查女巫是否被杀（如果被杀了，只能救自己）
-        witch_killed = (player_id == room.get("last_killed"))
-
-        # 检查是否已经行动
-        if room.get("witch_acted"):
-            yield event.plain_result("❌ 你今晚已经行动过了！")
-            return
-
-        # 检查解药是否已使用
-        if room.get("witch_antidote_used"):
-            yield event.plain_result("❌ 解药已经用过了！")
-            return
-
-        # 检查是否有被杀的人
-        if not room.get("last_killed"):
-            yield event.plain_result("❌ 今晚没有人被杀，无法使用解药！")
-            return
-
-        # 如果女巫被杀了，检查她是否在救自己
-        if witch_killed and room.get("last_killed") != player_id:
-            yield event.plain_result("❌ 你已经出局了！只有被杀的人才能在死后救自己！")
+        killed = room.last_killed
+        try:
+            effects = self.engine.witch_save(room, player_id)
+        except RuleViolation as e:
+            yield event.plain_result(str(e))
             return
 
-        # 使用解药救人
-        room["witch_saved"] = room["last_killed"]
-        room["witch_antidote_used"] = True
-        room["witch_acted"] = True
+        yield event.plain_result(f"✅ 你使用解药救了 {self._format_player_name(killed, room)}！")
 
-        # 取消定时器
-        await self._cancel_timer(room)
-
-        saved_name = self._format_player_name(room["last_killed"], room)
-        witch_name = self._format_player_name(player_id, room)
-
-        # 记录日志
-        room["game_log"].append(f"💊 {witch_name}（女巫）使用解药救了 {saved_name}")
-
-        yield event.plain_result(f"✅ 你使用解药救了 {saved_name}！")
-
-        # 女巫行动完成，准备天亮
-        await self._witch_finish(group_id)
+        # 女巫行动完成，天亮
+        await self._apply_effects(group_id, room, effects)
 
     @filter.command("毒人")
+    @instrumented_command
     async def witch_poison(self, event: AstrMessageEvent):
         """女巫使用毒药毒人（私聊）"""
         player_id = event.get_sender_id()
@@ -882,68 +799,32 @@ class WerewolfPlugin(Star):
             yield event.plain_result("❌ 你没有参与任何游戏！")
             return
 
-        # 验证阶段
-        if room["phase"] != GamePhase.NIGHT_WITCH:
-            yield event.plain_result("⚠️ 现在不是女巫行动阶段！")
-            return
-
-        # 验证身份
-        if room["roles"].get(player_id) != "witch":
-            yield event.plain_result("❌ 你不是女巫！")
-            return
-
-        # 检查是否已经行动
-        if room.get("witch_acted"):
-            yield event.plain_result("❌ 你今晚已经行动过了！")
-            return
-
-        # 检查毒药是否已使用
-        if room.get("witch_poison_used"):
-            yield event.plain_result("❌ 毒药已经用过了！")
+        # 先校验身份和阶段，再解析目标
+        try:
+            self.engine.check_actor(room, player_id, "witch")
+        except RuleViolation as e:
+            yield event.plain_result(str(e))
             return
 
         # 获取目标（支持@、编号、QQ号）
-        target_str = self._get_target_user(event)
-        if not target_str:
-            yield event.plain_result("❌ 请指定毒人目标！\n使用：/毒人 编号\n示例：/毒人 5")
-            return
-
-        # 解析目标（编号或QQ号）
-        target_id = self._parse_target(target_str, room)
-        if not target_id:
-            yield event.plain_result(f"❌ 无效的目标：{target_str}\n请使用玩家编号（1-9）")
-            return
-
-        # 验证目标存活
-        if target_id not in room["alive"]:
-            yield event.plain_result("❌ 目标玩家已经出局！")
+        target_id, error = self._get_target_player(event, room, "❌ 请指定毒人目标！\n使用：/毒人 编号\n示例：/毒人 5")
+        if error:
+            yield event.plain_result(error)
             return
 
-        # 不能毒自己
-        if target_id == player_id:
-            yield event.plain_result("❌ 不能毒自己！")
+        try:
+            effects = self.engine.witch_poison(room, player_id, target_id)
+        except RuleViolation as e:
+            yield event.plain_result(str(e))
             return
 
-        # 使用毒药毒人
-        room["witch_poisoned"] = target_id
-        room["witch_poison_used"] = True
-        room["witch_acted"] = True
-
-        # 取消定时器
-        await self._cancel_timer(room)
-
-        poisoned_name = self._format_player_name(target_id, room)
-        witch_name = self._format_player_name(player_id, room)
+        yield event.plain_result(f"✅ 你使用毒药毒了 {self._format_player_name(target_id, room)}！")
 
-        # 记录日志
-        room["game_log"].append(f"💊 {witch_name}（女巫）使用毒药毒了 {poisoned_name}")
-
-        yield event.plain_result(f"✅ 你使用毒药毒了 {poisoned_name}！")
-
-        # 女巫行动完成，准备天亮
-        await self._witch_finish(group_id)
+        # 女巫行动完成，天亮
+        await self._apply_effects(group_id, room, effects)
 
     @filter.command("不操作")
+    @instrumented_command
     async def witch_pass(self, event: AstrMessageEvent):
         """女巫选择不操作（私聊）"""
         player_id = event.get_sender_id()
@@ -955,38 +836,19 @@ class WerewolfPlugin(Star):
             yield event.plain_result("❌ 你没有参与任何游戏！")
             return
 
-        # 验证阶段
-        if room["phase"] != GamePhase.NIGHT_WITCH:
-            yield event.plain_result("⚠️ 现在不是女巫行动阶段！")
-            return
-
-        # 验证身份
-        if room["roles"].get(player_id) != "witch":
-            yield event.plain_result("❌ 你不是女巫！")
-            return
-
-        # 检查是否已经行动
-        if room.get("witch_acted"):
-            yield event.plain_result("❌ 你今晚已经行动过了！")
+        try:
+            effects = self.engine.witch_pass(room, player_id)
+        except RuleViolation as e:
+            yield event.plain_result(str(e))
             return
 
-        # 标记已行动
-        room["witch_acted"] = True
-
-        # 取消定时器
-        await self._cancel_timer(room)
-
-        # 记录日志
-        witch_name = self._format_player_name(player_id, room)
-        room["game_log"].append(f"💊 {witch_name}（女巫）选择不操作")
-
         yield event.plain_result("✅ 你选择不操作！")
 
-        # 女巫行动完成，准备天亮
-        await self._witch_finish(group_id)
-
+        # 女巫行动完成，天亮
+        await self._apply_effects(group_id, room, effects)
 
     @filter.command("遗言完毕")
+    @instrumented_command
     async def finish_last_words(self, event: AstrMessageEvent):
         """被杀玩家遗言完毕"""
         group_id = event.get_group_id()
@@ -995,86 +857,19 @@ class WerewolfPlugin(Star):
             return
 
         room = self.game_rooms[group_id]
-        player_id = event.get_sender_id()
-
-        # 验证阶段
-        if room["phase"] != GamePhase.LAST_WORDS:
-            yield event.plain_result("⚠️ 现在不是遗言阶段！")
-            return
-
-        # 验证是否是被杀的玩家
-        if room.get("last_killed") != player_id:
-            yield event.plain_result("⚠️ 只有被杀的玩家才能使用此命令！")
+        try:
+            effects = self.engine.finish_last_words(room, event.get_sender_id())
+        except RuleViolation as e:
+            yield event.plain_result(str(e))
             return
 
-        # 取消定时器
-        await self._cancel_timer(room)
-
-        # 记录遗言内容到游戏日志
-        player_name = self._format_player_name(player_id, room)
-        if room["current_speech"]:
-            # 合并多条发言
-            full_speech = " ".join(room["current_speech"])
-            # 限制长度，避免过长
-            if len(full_speech) > 200:
-                full_speech = full_speech[:200] + "..."
-
-            room["game_log"].append(f"💀遗言：{player_name} - {full_speech}")
-            logger.info(f"[狼人杀] 记录遗言: {player_name}: {full_speech[:50]}")
-        else:
-            # 如果没有捕获到遗言内容
-            room["game_log"].append(f"💀遗言：{player_name} - [未捕获到文字内容]")
-
-        # 清空当前发言缓存
-        room["current_speech"] = []
-
-        # 取消临时管理员
-        await self._remove_temp_admin(group_id, player_id, room)
-
-        # 禁言被杀玩家（确保遗言者无法再说话）
-        await self._ban_player(group_id, player_id, room)
-
-        # 确保全员禁言状态（遗言阶段已经开启，这里再次确认）
-        await self._set_group_whole_ban(group_id, room, True)
-
         yield event.plain_result("✅ 遗言完毕！")
 
-        # 检查遗言是否来自投票放逐
-        if room.get("last_words_from_vote"):
-            # 来自投票放逐，进入夜晚
-            room["phase"] = GamePhase.NIGHT_WOLF
-            room["seer_checked"] = False  # 重置预言家验人标记
-            room["is_first_night"] = False  # 第一晚结束
-            room["last_words_from_vote"] = False  # 重置标记
-            room["current_round"] += 1  # 回合数+1
-
-            # 记录日志
-            room["game_log"].append(LOG_SEPARATOR)
-            room["game_log"].append(f"第{room['current_round']}晚")
-            room["game_log"].append(LOG_SEPARATOR)
-            # 启动狼人定时器
-            room["timer_task"] = asyncio.create_task(self._wolf_kill_timeout(group_id))
-
-            # 发送夜晚消息
-            if room.get("msg_origin"):
-                night_msg = MessageChain().message(
-                    "🌙 夜晚降临，天黑请闭眼...\n\n"
-                    "🐺 狼人请私聊使用：/办掉 编号\n"
-                    "🔮 预言家请等待狼人行动完成\n"
-                    "⏰ 剩余时间：2分钟"
-                )
-                await self.context.send_message(room["msg_origin"], night_msg)
-        else:
-            # 来自夜晚被杀，进入发言阶段
-            # 清空遗言相关状态
-            room["last_killed"] = None
-            # 第一晚结束
-            room["is_first_night"] = False
-
-            room["phase"] = GamePhase.DAY_SPEAKING
-            await self._start_speaking_phase(group_id)
+        # 投票放逐的遗言之后入夜，夜晚死亡的遗言之后开始发言
+        await self._apply_effects(group_id, room, effects)
 
     @filter.command("发言完毕")
+    @instrumented_command
     async def finish_speaking(self, event: AstrMessageEvent):
         """当前发言者/PK发言者发言完毕"""
         group_id = event.get_group_id()
@@ -1083,57 +878,19 @@ class WerewolfPlugin(Star):
             return
 
         room = self.game_rooms[group_id]
-        player_id = event.get_sender_id()
-
-        # 验证阶段（支持发言阶段和PK阶段）
-        if room["phase"] not in [GamePhase.DAY_SPEAKING, GamePhase.DAY_PK]:
-            yield event.plain_result("⚠️ 现在不是发言阶段！")
-            return
-
-        # 验证是否是当前发言者
-        if room.get("current_speaker") != player_id:
-            yield event.plain_result("⚠️ 现在不是你的发言时间！")
+        try:
+            effects = self.engine.finish_speech(room, event.get_sender_id())
+        except RuleViolation as e:
+            yield event.plain_result(str(e))
             return
 
-        # 取消定时器
-        await self._cancel_timer(room)
-
-        # 记录发言内容到游戏日志
-        player_name = self._format_player_name(player_id, room)
-        if room["current_speech"]:
-            # 合并多条发言
-            full_speech = " ".join(room["current_speech"])
-            # 限制长度，避免过长
-            if len(full_speech) > 200:
-                full_speech = full_speech[:200] + "..."
-
-            phase_tag = "💬PK发言" if room["phase"] == GamePhase.DAY_PK else "💬发言"
-            room["game_log"].append(f"{phase_tag}：{player_name} - {full_speech}")
-            logger.info(f"[狼人杀] 记录发言: {player_name}: {full_speech[:50]}")
-        else:
-            # 如果没有捕获到发言内容，也记录一下（可能是纯表情等）
-            phase_tag = "💬PK发言" if room["phase"] == GamePhase.DAY_PK else "💬发言"
-            room["game_log"].append(f"{phase_tag}：{player_name} - [未捕获到文字内容]")
-
-        # 清空当前发言缓存
-        room["current_speech"] = []
-
-        # 取消当前发言者的临时管理员
-        await self._remove_temp_admin(group_id, player_id, room)
-
         yield event.plain_result("✅ 发言完毕！")
 
-        # 根据阶段决定下一步
-        if room["phase"] == GamePhase.DAY_PK:
-            # PK发言，切换到下一个PK发言者
-            room["current_speaker_index"] += 1
-            await self._next_pk_speaker(group_id)
-        else:
-            # 正常发言，切换到下一个发言者
-            room["current_speaker_index"] += 1
-            await self._next_speaker(group_id)
+        # 切换到下一个发言者（全部发言完毕后进入投票）
+        await self._apply_effects(group_id, room, effects)
 
     @filter.command("开始投票")
+    @instrumented_command
     async def start_vote(self, event: AstrMessageEvent):
         """跳过发言直接进入投票阶段（房主专用）"""
         group_id = event.get_group_id()
@@ -1144,33 +901,22 @@ class WerewolfPlugin(Star):
         room = self.game_rooms[group_id]
 
         # 验证房主权限
-        if event.get_sender_id() != room["creator"]:
+        if event.get_sender_id() != room.creator:
             yield event.plain_result("⚠️ 只有房主才能跳过发言环节！")
             return
 
-        # 验证阶段（支持普通发言和PK发言）
-        if room["phase"] not in [GamePhase.DAY_SPEAKING, GamePhase.DAY_PK]:
-            yield event.plain_result("⚠️ 现在不是发言阶段！")
+        # 普通发言阶段进入普通投票，PK发言阶段进入PK投票（只能投平票玩家）
+        try:
+            effects = self.engine.skip_to_vote(room)
+        except RuleViolation as e:
+            yield event.plain_result(str(e))
             return
 
-        # 取消定时器
-        await self._cancel_timer(room)
-
-        # 取消当前发言者的临时管理员
-        if room.get("current_speaker"):
-            await self._remove_temp_admin(group_id, room["current_speaker"], room)
-
         yield event.plain_result("✅ 房主跳过发言环节，直接进入投票！")
-
-        # 根据阶段决定投票类型
-        if room["phase"] == GamePhase.DAY_PK:
-            # PK发言阶段 → PK投票（只能投平票玩家）
-            await self._start_pk_vote(group_id)
-        else:
-            # 普通发言阶段 → 普通投票
-            await self._auto_start_vote(group_id)
+        await self._apply_effects(group_id, room, effects)
 
     @filter.command("投票")
+    @instrumented_command
     async def day_vote(self, event: AstrMessageEvent):
         """白天投票放逐"""
         group_id = event.get_group_id()
@@ -1181,80 +927,38 @@ class WerewolfPlugin(Star):
         room = self.game_rooms[group_id]
         player_id = event.get_sender_id()
 
-        # 验证阶段
-        if room["phase"] != GamePhase.DAY_VOTE:
-            yield event.plain_result("⚠️ 现在不是投票阶段！使用 /开始投票 进入投票")
-            return
-
-        # 验证玩家在游戏中且存活
-        if player_id not in room["players"]:
-            yield event.plain_result("❌ 你不在游戏中！")
-            return
-
-        if player_id not in room["alive"]:
-            yield event.plain_result("❌ 你已经出局了！")
-            return
-
         # 获取目标（支持@、编号、QQ号）
         target_str = self._get_target_user(event)
         if not target_str:
             yield event.plain_result("❌ 请指定投票目标！\n使用：/投票 编号 (输入 0 弃票)\n示例：/投票 2")
             return
 
-        # === 核心修改：识别 0 为弃票 ===
-        if target_str == "0":
-            target_id = "ABSTAIN"
-        else:
-            # 解析目标（编号或QQ号）
+        # 0 表示弃票
+        target_id = None
+        if target_str != "0":
             target_id = self._parse_target(target_str, room)
-
-        # 验证逻辑
-        if target_id != "ABSTAIN":
             if not target_id:
                 yield event.plain_result(f"❌ 无效的目标：{target_str}\n请使用玩家编号（1-9），或输入 0 弃票")
                 return
-            elif target_id not in room["alive"]:
-                yield event.plain_result("❌ 目标玩家已经出局！")
-                return
-            elif room.get("is_pk_vote"):
-                # 如果是PK投票，验证目标必须在PK玩家列表中
-                if target_id not in room.get("pk_players", []):
-                    pk_names = [self._format_player_name(pid, room) for pid in room["pk_players"]]
-                    yield event.plain_result(
-                        f"❌ PK投票只能投给平票玩家！(或输入 0 弃票)\n\n"
-                        f"可投票对象：\n" + "\n".join([f"  • {name}" for name in pk_names])
-                    )
-                    return
-
-        # 记录投票
-        room["day_votes"][player_id] = target_id
-
-        # 记录日志与反馈
-        voter_name = self._format_player_name(player_id, room)
-        
-        if target_id == "ABSTAIN":
-            log_msg = f"🗳️ {voter_name} 弃票"
-            if room.get("is_pk_vote"):
-                 log_msg = f"🗳️ PK投票：{voter_name} 弃票"
-            room["game_log"].append(log_msg)
-            yield event.plain_result(f"✅ 你选择了弃票！当前已投票 {len(room['day_votes'])}/{len(room['alive'])} 人")
+
+        alive_count = len(room.alive)
+        try:
+            effects = self.engine.day_vote(room, player_id, target_id)
+        except RuleViolation as e:
+            yield event.plain_result(str(e))
+            return
+
+        voted = alive_count if effects else len(room.day_votes)
+        if target_id is None:
+            yield event.plain_result(f"✅ 你选择了弃票！当前已投票 {voted}/{alive_count} 人")
         else:
-            target_name = self._format_player_name(target_id, room)
-            log_msg = f"🗳️ {voter_name} 投票给 {target_name}"
-            if room.get("is_pk_vote"):
-                log_msg = f"🗳️ PK投票：{voter_name} 投给 {target_name}"
-            room["game_log"].append(log_msg)
-            yield event.plain_result(f"✅ 投票成功！当前已投票 {len(room['day_votes'])}/{len(room['alive'])} 人")
-
-        # 检查是否所有人都投票了
-        if len(room["day_votes"]) >= len(room["alive"]):
-            # 取消投票定时器
-            await self._cancel_timer(room)
+            yield event.plain_result(f"✅ 投票成功！当前已投票 {voted}/{alive_count} 人")
+
+        # 所有人都投票了：公布结果
+        await self._apply_effects(group_id, room, effects)
 
-            result = await self._process_day_vote(group_id)
-            if result:
-                yield event.plain_result(result)
     @filter.command("开枪")
+    @instrumented_command
     async def hunter_shoot(self, event: AstrMessageEvent):
         """猎人开枪（私聊）"""
         player_id = event.get_sender_id()
@@ -1265,135 +969,36 @@ class WerewolfPlugin(Star):
             return
 
         # 查找玩家所在的游戏房间
-        room = None
-        group_id = None
-        for gid, r in self.game_rooms.items():
-            if player_id in r["players"]:
-                room = r
-                group_id = gid
-                break
+        group_id, room = self._get_player_room(player_id)
 
         if not room:
             yield event.plain_result("❌ 你没有参与任何游戏！")
             return
 
-        # 验证身份
-        if room["roles"].get(player_id) != "hunter":
-            yield event.plain_result("❌ 你不是猎人！")
-            return
-
-        # 验证是否在待开枪状态
-        if room.get("pending_hunter_shot") != player_id:
-            yield event.plain_result("❌ 当前不能开枪！")
-            return
-
-        # 验证死亡方式（被毒不能开枪）
-        if room.get("hunter_death_type") == "poison":
-            yield event.plain_result("❌ 你被女巫毒死，不能开枪！")
+        # 先校验身份和阶段，再解析目标
+        try:
+            self.engine.check_actor(room, player_id, "hunter")
+        except RuleViolation as e:
+            yield event.plain_result(str(e))
             return
 
         # 获取目标（支持@、编号、QQ号）
-        target_str = self._get_target_user(event)
-        if not target_str:
-            yield event.plain_result("❌ 请指定目标！\n使用：/开枪 编号\n示例：/开枪 1")
-            return
-
-        # 解析目标（编号或QQ号）
-        target_id = self._parse_target(target_str, room)
-        if not target_id:
-            yield event.plain_result(f"❌ 无效的目标：{target_str}\n请使用玩家编号（1-9）")
-            return
-
-        # 验证目标
-        if target_id not in room["alive"]:
-            yield event.plain_result(f"❌ {self._format_player_name(target_id, room)} 已经出局！")
+        target_id, error = self._get_target_player(event, room, "❌ 请指定目标！\n使用：/开枪 编号\n示例：/开枪 1")
+        if error:
+            yield event.plain_result(error)
             return
 
-        if target_id == player_id:
-            yield event.plain_result("❌ 不能开枪带走自己！")
+        try:
+            effects = self.engine.hunter_shoot(room, player_id, target_id)
+        except RuleViolation as e:
+            yield event.plain_result(str(e))
             return
 
-        # 执行开枪
-        room["alive"].discard(target_id)
-        room["hunter_shot"] = True
-        room["pending_hunter_shot"] = None
-
-        target_name = self._format_player_name(target_id, room)
-        hunter_name = self._format_player_name(player_id, room)
-
-        # 记录日志
-        room["game_log"].append(f"🔫 {hunter_name}（猎人）开枪带走 {target_name}")
-
-        yield event.plain_result(f"💥 你开枪带走了 {target_name}！")
-
-        # 禁言被带走的玩家
-        await self._ban_player(group_id, target_id, room)
-
-        # 通知群聊
-        if room.get("msg_origin"):
-            shot_msg = MessageChain().message(
-                f"💥 猎人开枪带走了 {target_name}！\n\n"
-                f"剩余存活玩家：{len(room['alive'])} 人"
-            )
-            await self.context.send_message(room["msg_origin"], shot_msg)
-
-        # 取消定时器
-        await self._cancel_timer(room)
-
-        # 检查游戏是否结束
-        victory_msg, winning_faction = self._check_victory_condition(room)
-        if victory_msg:
-            result_text = f"🎉 {victory_msg}\n游戏结束！\n\n"
-            result_text += self._get_all_players_roles(room)
-            room["phase"] = GamePhase.FINISHED
-
-            # 发送结果
-            if room.get("msg_origin"):
-                result_msg = MessageChain().message(result_text)
-                await self.context.send_message(room["msg_origin"], result_msg)
-
-                # 生成AI复盘（异步，不阻塞）
-                try:
-                    ai_review = await self._generate_ai_review(room, winning_faction)
-                    if ai_review:
-                        review_msg = MessageChain().message(ai_review)
-                        await self.context.send_message(room["msg_origin"], review_msg)
-                except Exception as e:
-                    logger.error(f"[狼人杀] AI复盘发送失败: {e}")
-
-            # 清理房间
-            await self._cleanup_room(group_id)
-            return
-
-        # 游戏继续，根据猎人死亡方式决定下一阶段
-        hunter_id = player_id
-        death_type = room.get("hunter_death_type")
-
-        if death_type == "vote":
-            # 猎人被投票放逐，进入遗言阶段
-            room["phase"] = GamePhase.LAST_WORDS
-            room["last_killed"] = hunter_id
-            room["last_words_from_vote"] = True
-            await self._start_last_words(group_id)
-        elif death_type == "wolf":
-            # 猎人被狼杀，根据是否第一晚决定
-            if room.get("is_first_night") and (room.get("last_killed") or room.get("witch_poisoned")):
-                # 第一晚有遗言
-                room["phase"] = GamePhase.LAST_WORDS
-                if room.get("last_killed"):
-                    await self._start_last_words(group_id)
-                elif room.get("witch_poisoned"):
-                    room["last_killed"] = room["witch_poisoned"]
-                    await self._start_last_words(group_id)
-            else:
-                # 其他夜晚没有遗言，直接进入发言阶段
-                if room.get("last_killed"):
-                    await self._ban_player(group_id, room["last_killed"], room)
-
-                room["phase"] = GamePhase.DAY_SPEAKING
-                await self._start_speaking_phase(group_id)
+        yield event.plain_result(f"💥 你开枪带走了 {self._format_player_name(target_id, room)}！")
+        await self._apply_effects(group_id, room, effects)
 
     @filter.command("狼人杀帮助")
+    @instrumented_command
     async def show_help(self, event: AstrMessageEvent):
         """显示帮助信息"""
         group_id = event.get_group_id()
@@ -1403,17 +1008,17 @@ class WerewolfPlugin(Star):
         room_config = None
         
         if group_id in self.game_rooms:
-            cfg = self.game_rooms[group_id]["config"]
+            cfg = self.game_rooms[group_id].config
             room_config = cfg # 保存下来后面用
-            god_num = cfg['seer'] + cfg['witch'] + cfg['hunter']
+            god_num = cfg.seer + cfg.witch + cfg.hunter
             current_room_info = (
                 f"\n📊 当前房间配置：\n"
-                f"• 总人数：{cfg['total']}人\n"
-                f"• 配置：{cfg['werewolf']}狼 + {god_num}神 + {cfg['villager']}民\n"
-                f"  (预言家{cfg['seer']}, 女巫{cfg['witch']}, 猎人{cfg['hunter']})"
+                f"• 总人数：{cfg.total}人\n"
+                f"• 配置：{cfg.werewolf}狼 + {god_num}神 + {cfg.villager}民\n"
+                f"  (预言家{cfg.seer}, 女巫{cfg.witch}, 猎人{cfg.hunter})"
             )
             # 如果在房间里，最大编号就是房间总人数
-            max_number = cfg['total']
+            max_number = cfg.total
         else:
             # 如果不在房间里，使用默认或提示查看创建命令
             max_number = "N" 
@@ -1434,7 +1039,8 @@ class WerewolfPlugin(Star):
             "  /开始游戏 - 开始游戏（房主）\n"
             "  /查角色 - 查看角色（私聊）\n"
             "  /游戏状态 - 查看游戏状态\n"
-            "  /结束游戏 - 结束游戏（房主）\n\n"
+            "  /结束游戏 - 结束游戏（房主）\n"
+            "  /重新复盘 - 重新发送上一局的AI复盘（房主）\n\n"
             f"游戏命令（使用编号 1-{max_number}）：\n"
             "  /办掉 编号 - 狼人夜晚办掉（如：/办掉 1）\n"
             "  /密谋 消息 - 狼人与队友交流\n"
@@ -1464,79 +1070,111 @@ class WerewolfPlugin(Star):
 
         返回：(group_id, room) 或 (None, None)
         """
-        for group_id, room in self.game_rooms.items():
-            if player_id in room["players"]:
-                return group_id, room
-        return None, None
+        group_id = self.player_rooms.get(player_id)
+        room = self.game_rooms.get(group_id) if group_id else None
+        if not room:
+            return None, None
+        return group_id, room
 
-    def _format_player_name(self, player_id: str, room: Dict) -> str:
+    def _format_player_name(self, player_id: str, room: Room) -> str:
         """格式化玩家显示名称：编号.昵称"""
-        name = room["player_names"].get(player_id, "未知")
-        number = room["player_numbers"].get(player_id, "?")
-        return f"{number}号.{name}"
+        return room.display_name(player_id)
 
-    def _parse_target(self, target_str: str, room: Dict) -> str:
+    def _parse_target(self, target_str: str, room: Room) -> str:
         """解析目标玩家（支持编号或QQ号）
         返回玩家ID，如果解析失败返回None
         """
         # 尝试作为编号解析（1-9的数字）
         try:
             number = int(target_str)
-            if number in room["number_to_player"]:
-                return room["number_to_player"][number]
+            if number in room.number_to_player:
+                return room.number_to_player[number]
         except ValueError:
             pass
 
         # 尝试作为QQ号解析
-        if target_str in room["players"]:
+        if target_str in room.players:
             return target_str
 
         return None
 
-    async def _set_group_cards_to_numbers(self, group_id: str, room: Dict):
+    async def _run_bulk(self, calls: Iterable[Awaitable], limit: Optional[int] = None) -> list:
+        """以有限并发执行一批群管理调用
+
+        每个调用自行捕获并记录异常；整体耗时取决于最慢的调用而不是所有调用之和
+        limit：最大并发数，默认使用 GameConfig.BULK_CONCURRENCY
+        """
+        semaphore = asyncio.Semaphore(limit or GameConfig.BULK_CONCURRENCY)
+
+        async def limited(call: Awaitable):
+            async with semaphore:
+                return await call
+
+        return await asyncio.gather(*(limited(call) for call in calls), return_exceptions=True)
+
+    async def _set_group_cards_to_numbers(self, group_id: str, room: Room):
         """将玩家群昵称改为编号"""
-        for player_id, number in room["player_numbers"].items():
+        async def set_card(player_id: str, number: int):
             try:
                 # 获取当前群昵称（保存以便恢复）
-                if player_id not in room["original_group_cards"]:
-                    # 使用player_names作为原始昵称
-                    room["original_group_cards"][player_id] = room["player_names"].get(player_id, "")
+                if player_id not in room.original_group_cards:
+                    # 使用玩家昵称作为原始昵称
+                    room.original_group_cards[player_id] = room.name_of(player_id, "")
 
                 # 设置新昵称为"编号号"
                 new_card = f"{number}号"
-                await room["bot"].set_group_card(group_id=int(group_id), user_id=int(player_id), card=new_card)
-                logger.info(f"[狼人杀] 已将玩家 {player_id} 群昵称改为 {new_card}")
+                await room.bot.set_group_card(group_id=int(group_id), user_id=int(player_id), card=new_card)
+                self._record_effect(group_id, CARD, player_id, room.original_group_cards[player_id])
+                self.glog.info("修改群昵称", group_id, player=player_id, card=new_card)
             except Exception as e:
                 logger.error(f"[狼人杀] 修改玩家 {player_id} 群昵称失败: {e}")
 
-    async def _restore_group_cards(self, group_id: str, room: Dict):
+        await self._run_bulk(
+            set_card(player.id, player.number) for player in room.players.values()
+        )
+
+    async def _restore_group_cards(self, group_id: str, room: Room):
         """恢复玩家原始群昵称"""
-        for player_id, original_card in room.get("original_group_cards", {}).items():
+        async def restore_card(player_id: str, original_card: str):
             try:
-                await room["bot"].set_group_card(group_id=int(group_id), user_id=int(player_id), card=original_card)
-                logger.info(f"[狼人杀] 已恢复玩家 {player_id} 群昵称为 {original_card}")
+                await room.bot.set_group_card(group_id=int(group_id), user_id=int(player_id), card=original_card)
+                self._resolve_effect(group_id, CARD, player_id)
+                self.glog.info("恢复群昵称", group_id, player=player_id, card=original_card)
             except Exception as e:
                 logger.error(f"[狼人杀] 恢复玩家 {player_id} 群昵称失败: {e}")
 
+        await self._run_bulk(
+            restore_card(player_id, original_card)
+            for player_id, original_card in room.original_group_cards.items()
+        )
+
     async def _cleanup_room(self, group_id: str):
         """清理游戏房间"""
-        if group_id in self.game_rooms:
-            room = self.game_rooms[group_id]
-            # 恢复群昵称
-            await self._restore_group_cards(group_id, room)
+        # 先移出房间表再恢复群状态：清理期间到期的定时器或并发的命令都看不到这个房间，重复清理也是安全的
+        room = self.game_rooms.pop(group_id, None)
+        self.speaking_groups.pop(group_id, None)
+        if room:
+            self._delete_saved_room(group_id)
             # 取消定时器
             await self._cancel_timer(room)
-            # 解除所有禁言
-            await self._unban_all_players(group_id, room)
-            # 解除全员禁言
-            await self._set_group_whole_ban(group_id, room, False)
-            # 取消所有临时管理员
-            await self._clear_temp_admins(group_id, room)
-            # 删除房间
-            del self.game_rooms[group_id]
-            logger.info(f"[狼人杀] 群 {group_id} 房间已清理")
-
-    def _get_all_players_roles(self, room: Dict) -> str:
+            # 停止还没改完的群昵称，之后按 original_group_cards 统一恢复（开始修改前就已记下原昵称）
+            if room.card_task and not room.card_task.done():
+                room.card_task.cancel()
+                await asyncio.gather(room.card_task, return_exceptions=True)
+            # 移除反向索引
+            for player_id in room.players:
+                if self.player_rooms.get(player_id) == group_id:
+                    del self.player_rooms[player_id]
+            # 恢复群昵称、解除所有禁言、解除全员禁言、取消所有临时管理员（互不依赖，同时进行）
+            await asyncio.gather(
+                self._restore_group_cards(group_id, room),
+                self._unban_all_players(group_id, room),
+                self._set_group_whole_ban(group_id, room, False),
+                self._clear_temp_admins(group_id, room),
+            )
+            self.glog.info("房间已清理", group_id)
+
+    def _get_all_players_roles(self, room: Room) -> str:
         """获取所有玩家的身份列表"""
         result = "📜 身份公布：\n\n"
 
@@ -1547,8 +1185,8 @@ class WerewolfPlugin(Star):
         hunters = []
         villagers = []
 
-        for player_id in room["players"]:
-            role = room["roles"].get(player_id)
+        for player_id in room.players:
+            role = room.role_of(player_id)
             player_name = self._format_player_name(player_id, room)
 
             if role == "werewolf":
@@ -1594,506 +1232,421 @@ class WerewolfPlugin(Star):
 
         return result
 
-    async def _ban_player(self, group_id: str, player_id: str, room: Dict):
+    async def _ban_player(self, group_id: str, player_id: str, room: Room):
         """禁言玩家"""
         try:
-            await room["bot"].set_group_ban(
+            await room.bot.set_group_ban(
                 group_id=int(group_id),
                 user_id=int(player_id),
                 duration=86400 * GameConfig.BAN_DURATION_DAYS  # 游戏结束后会解除
             )
-            room["banned_players"].add(player_id)
-            logger.info(f"[狼人杀] 已禁言玩家 {player_id}")
+            room.banned_players.add(player_id)
+            self._record_effect(group_id, BAN, player_id)
+            self.glog.info("禁言", group_id, player=player_id)
         except Exception as e:
             logger.error(f"[狼人杀] 禁言玩家 {player_id} 失败: {e}")
 
-    async def _unban_all_players(self, group_id: str, room: Dict):
+    async def _unban_all_players(self, group_id: str, room: Room):
         """解除所有被禁言玩家"""
-        for player_id in room["banned_players"]:
+        async def unban(player_id: str):
             try:
-                await room["bot"].set_group_ban(
+                await room.bot.set_group_ban(
                     group_id=int(group_id),
                     user_id=int(player_id),
                     duration=0  # 0表示解除禁言
                 )
-                logger.info(f"[狼人杀] 已解除禁言 {player_id}")
+                self._resolve_effect(group_id, BAN, player_id)
+                self.glog.info("解除禁言", group_id, player=player_id)
             except Exception as e:
                 logger.error(f"[狼人杀] 解除禁言 {player_id} 失败: {e}")
-        room["banned_players"].clear()
 
-    async def _set_group_whole_ban(self, group_id: str, room: Dict, enable: bool):
+        await self._run_bulk(unban(player_id) for player_id in list(room.banned_players))
+        room.banned_players.clear()
+
+    async def _set_group_whole_ban(self, group_id: str, room: Room, enable: bool):
         """设置全员禁言"""
         try:
-            await room["bot"].set_group_whole_ban(
+            await room.bot.set_group_whole_ban(
                 group_id=int(group_id),
                 enable=enable
             )
-            logger.info(f"[狼人杀] 全员禁言状态: {enable}")
+            if enable:
+                self._record_effect(group_id, WHOLE_BAN)
+            else:
+                self._resolve_effect(group_id, WHOLE_BAN)
+            self.glog.info("全员禁言", group_id, enable=enable)
         except Exception as e:
             logger.error(f"[狼人杀] 设置全员禁言失败: {e}")
 
-    async def _set_temp_admin(self, group_id: str, player_id: str, room: Dict):
+    async def _set_temp_admin(self, group_id: str, player_id: str, room: Room):
         """设置临时管理员（用于发言）"""
         try:
-            await room["bot"].set_group_admin(
+            await room.bot.set_group_admin(
                 group_id=int(group_id),
                 user_id=int(player_id),
                 enable=True
             )
-            room["temp_admins"].add(player_id)
-            logger.info(f"[狼人杀] 已设置临时管理员 {player_id}")
+            room.temp_admins.add(player_id)
+            self._record_effect(group_id, ADMIN, player_id)
+            self.glog.info("设置临时管理员", group_id, player=player_id)
         except Exception as e:
             logger.error(f"[狼人杀] 设置临时管理员 {player_id} 失败: {e}")
 
-    async def _remove_temp_admin(self, group_id: str, player_id: str, room: Dict):
+    async def _remove_temp_admin(self, group_id: str, player_id: str, room: Room):
         """取消临时管理员"""
         try:
-            await room["bot"].set_group_admin(
+            await room.bot.set_group_admin(
                 group_id=int(group_id),
                 user_id=int(player_id),
                 enable=False
             )
-            room["temp_admins"].discard(player_id)
-            logger.info(f"[狼人杀] 已取消临时管理员 {player_id}")
+            room.temp_admins.discard(player_id)
+            self._resolve_effect(group_id, ADMIN, player_id)
+            self.glog.info("取消临时管理员", group_id, player=player_id)
         except Exception as e:
             logger.error(f"[狼人杀] 取消临时管理员 {player_id} 失败: {e}")
 
-    async def _clear_temp_admins(self, group_id: str, room: Dict):
+    async def _clear_temp_admins(self, group_id: str, room: Room):
         """清除所有临时管理员"""
-        for player_id in list(room["temp_admins"]):
-            await self._remove_temp_admin(group_id, player_id, room)
-        room["temp_admins"].clear()
-
-    async def _send_roles_to_players(self, group_id: str, room: Dict):
-        """主动私聊告知所有玩家的身份"""
-        for player_id in room["players"]:
-            try:
-                role = room["roles"].get(player_id)
-                if not role:
-                    continue
-
-                # 生成角色信息
-                if role == "werewolf":
-                    # 找到其他狼人
-                    werewolves = [pid for pid, r in room["roles"].items() if r == "werewolf"]
-                    teammates = [pid for pid in werewolves if pid != player_id]
-
-                    # 狼人队友信息
-                    teammate_info = ""
-                    if teammates:
-                        teammate_names = ", ".join([self._format_player_name(pid, room) for pid in teammates])
-                        teammate_info = f"\n\n🤝 你的队友：{teammate_names}"
-
-                    # 列出所有其他玩家（除了狼人自己）
-                    other_players = [pid for pid in room["players"] if pid not in werewolves]
-                    players_list = "\n".join([f"  • {self._format_player_name(pid, room)}" for pid in other_players])
-
-                    role_text = (
-                        f"🎭 游戏开始！你的角色是：\n\n"
-                        f"🐺 狼人\n\n"
-                        f"你的目标：消灭所有平民！{teammate_info}\n\n"
-                        f"📋 可选目标列表：\n{players_list}\n\n"
-                        f"💡 夜晚私聊使用命令：\n"
-                        f"  /办掉 编号 - 投票办掉目标\n"
-                        f"  /密谋 消息 - 与队友交流\n"
-                        f"示例：/办掉 {list(room['player_numbers'].values())[0] if room.get('player_numbers') else '1'}"
-                    )
-                elif role == "seer":
-                    # 列出所有其他玩家（预言家可以验所有人）
-                    other_players = [pid for pid in room["players"] if pid != player_id]
-                    players_list = "\n".join([f"  • {self._format_player_name(pid, room)}" for pid in other_players])
-
-                    role_text = (
-                        f"🎭 游戏开始！你的角色是：\n\n"
-                        f"🔮 预言家\n\n"
-                        f"你的目标：找出狼人，帮助平民获胜！\n\n"
-                        f"📋 可验证玩家列表：\n{players_list}\n\n"
-                        f"💡 夜晚私聊使用命令：\n"
-                        f"/验人 编号\n"
-                        f"示例：/验人 {room['player_numbers'][other_players[0]] if other_players else '3'}\n\n"
-                        f"⚠️ 注意：每晚只能验证一个人！"
-                    )
-                elif role == "witch":
-                    # 列出所有其他玩家
-                    other_players = [pid for pid in room["players"] if pid != player_id]
-                    players_list = "\n".join([f"  • {self._format_player_name(pid, room)}" for pid in other_players])
-
-                    role_text = (
-                        f"🎭 游戏开始！你的角色是：\n\n"
-                        f"💊 女巫\n\n"
-                        f"你的目标：帮助平民获胜！\n\n"
-                        f"你拥有两种药：\n"
-                        f"💉 解药：可以救活当晚被杀的人（只能用一次）\n"
-                        f"💊 毒药：可以毒杀任何人（只能用一次）\n\n"
-                        f"⚠️ 注意：\n"
-                        f"• 同一晚不能同时使用两种药\n"
-                        f"• 解药只能救当晚被杀的人\n"
-                        f"• 每晚女巫行动时会告知谁被杀\n\n"
-                        f"💡 夜晚私聊使用命令：\n"
-                        f"  /救人 - 救活被杀的人\n"
-                        f"  /毒人 编号 - 毒杀某人\n"
-                        f"  /不操作 - 不使用任何药"
-                    )
-                elif role == "hunter":
-                    # 列出所有其他玩家
-                    other_players = [pid for pid in room["players"] if pid != player_id]
-                    players_list = "\n".join([f"  • {self._format_player_name(pid, room)}" for pid in other_players])
-
-                    role_text = (
-                        f"🎭 游戏开始！你的角色是：\n\n"
-                        f"🔫 猎人\n\n"
-                        f"你的目标：帮助好人获胜！\n\n"
-                        f"你的技能：\n"
-                        f"• 被狼人办掉时可以开枪带走一人\n"
-                        f"• 被投票放逐时可以开枪带走一人\n"
-                        f"• 被女巫毒死时不能开枪（死的太突然）\n\n"
-                        f"📋 可选目标列表：\n{players_list}\n\n"
-                        f"💡 当你死亡时（非毒死），私聊使用命令：\n"
-                        f"  /开枪 编号 - 带走一个人\n"
-                        f"示例：/开枪 1"
-                    )
-                else:  # villager
-                    role_text = (
-                        f"🎭 游戏开始！你的角色是：\n\n"
-                        f"👤 平民\n\n"
-                        f"你的目标：找出并放逐所有狼人！\n"
-                        f"白天投票时使用 /投票 编号 放逐可疑玩家。"
-                    )
-
-                # 尝试发送私聊消息
-                await room["bot"].send_private_msg(
-                    user_id=int(player_id),
-                    message=role_text
-                )
-                logger.info(f"[狼人杀] 已私聊告知玩家 {player_id} 的身份：{role}")
-
-            except Exception as e:
-                logger.warning(f"[狼人杀] 私聊告知玩家 {player_id} 失败: {e}")
-                # 失败不影响游戏继续，玩家可以手动查看角色
-
-    async def _start_last_words(self, group_id: str):
-        """开始遗言阶段"""
-        if group_id not in self.game_rooms:
-            return
-
-        room = self.game_rooms[group_id]
-
-        # 检查是否有被杀的玩家
-        if not room.get("last_killed"):
-            # 没有被杀的玩家，直接进入发言阶段
-            room["phase"] = GamePhase.DAY_SPEAKING
-            await self._start_speaking_phase(group_id)
-            return
+        await self._run_bulk(
+            self._remove_temp_admin(group_id, player_id, room) for player_id in list(room.temp_admins)
+        )
+        room.temp_admins.clear()
 
-        killed_player = room["last_killed"]
+    def _build_role_text(self, player_id: str, room: Room) -> str:
+        """生成玩家的身份说明（私聊发送和 /查角色 共用）"""
+        role = room.role_of(player_id)
 
-        # 清空发言缓存，准备记录遗言
-        room["current_speech"] = []
+        if role == "werewolf":
+            # 找到其他狼人
+            werewolves = room.members("werewolf")
+            teammates = [pid for pid in werewolves if pid != player_id]
 
-        # 开启全群禁言
-        await self._set_group_whole_ban(group_id, room, True)
+            # 狼人队友信息
+            teammate_info = ""
+            if teammates:
+                teammate_names = ", ".join([self._format_player_name(pid, room) for pid in teammates])
+                teammate_info = f"\n\n🤝 你的队友：{teammate_names}"
 
-        # 设置被杀玩家为临时管理员（可以在全群禁言状态下说话）
-        await self._set_temp_admin(group_id, killed_player, room)
+            # 列出所有其他玩家（除了狼人自己）
+            other_players = [pid for pid in room.players if pid not in werewolves]
+            players_list = "\n".join([f"  • {self._format_player_name(pid, room)}" for pid in other_players])
 
-        # 发送遗言提示消息
-        if room.get("msg_origin"):
-            killed_name = self._format_player_name(killed_player, room)
-            msg = MessageChain().at(killed_name, killed_player).message(
-                f" 现在请你留遗言\n\n"
-                f"⏰ 遗言时间：2分钟\n"
-                f"💡 遗言完毕后请使用：/遗言完毕"
+            return (
+                f"🐺 狼人\n\n"
+                f"你的目标：消灭所有平民！{teammate_info}\n\n"
+                f"📋 可选目标列表：\n{players_list}\n\n"
+                f"💡 夜晚私聊使用命令：\n"
+                f"  /办掉 编号 - 投票办掉目标\n"
+                f"  /密谋 消息 - 与队友交流\n"
+                f"示例：/办掉 {next(iter(room.number_to_player), 1)}"
             )
-            await self.context.send_message(room["msg_origin"], msg)
-
-        # 启动遗言定时器
-        room["timer_task"] = asyncio.create_task(self._last_words_timeout(group_id))
-
-    async def _last_words_timeout(self, group_id: str):
-        """遗言超时处理"""
-        try:
-            await asyncio.sleep(self.timeout_speaking)
-
-            if group_id not in self.game_rooms:
-                return
-
-            room = self.game_rooms[group_id]
+        elif role == "seer":
+            # 列出所有其他玩家（预言家可以验所有人）
+            other_players = [pid for pid in room.players if pid != player_id]
+            players_list = "\n".join([f"  • {self._format_player_name(pid, room)}" for pid in other_players])
 
-            # 检查阶段是否还是遗言阶段
-            if room["phase"] != GamePhase.LAST_WORDS:
-                return
+            return (
+                f"🔮 预言家\n\n"
+                f"你的目标：找出狼人，帮助平民获胜！\n\n"
+                f"📋 可验证玩家列表：\n{players_list}\n\n"
+                f"💡 夜晚私聊使用命令：\n"
+                f"/验人 编号\n"
+                f"示例：/验人 {room.number_of(other_players[0]) if other_players else '3'}\n\n"
+                f"⚠️ 注意：每晚只能验证一个人！"
+            )
+        elif role == "witch":
+            return (
+                f"💊 女巫\n\n"
+                f"你的目标：帮助平民获胜！\n\n"
+                f"你拥有两种药：\n"
+                f"💉 解药：可以救活当晚被杀的人（只能用一次）\n"
+                f"💊 毒药：可以毒杀任何人（只能用一次）\n\n"
+                f"⚠️ 注意：\n"
+                f"• 同一晚不能同时使用两种药\n"
+                f"• 解药只能救当晚被杀的人\n"
+                f"• 每晚女巫行动时会告知谁被杀\n\n"
+                f"💡 夜晚私聊使用命令：\n"
+                f"  /救人 - 救活被杀的人\n"
+                f"  /毒人 编号 - 毒杀某人\n"
+                f"  /不操作 - 不使用任何药"
+            )
+        elif role == "hunter":
+            # 列出所有其他玩家
+            other_players = [pid for pid in room.players if pid != player_id]
+            players_list = "\n".join([f"  • {self._format_player_name(pid, room)}" for pid in other_players])
 
-            logger.info(f"[狼人杀] 群 {group_id} 遗言阶段超时")
+            return (
+                f"🔫 猎人\n\n"
+                f"你的目标：帮助好人获胜！\n\n"
+                f"你的技能：\n"
+                f"• 被狼人办掉时可以开枪带走一人\n"
+                f"• 被投票放逐时可以开枪带走一人\n"
+                f"• 被女巫毒死时不能开枪（死的太突然）\n\n"
+                f"📋 可选目标列表：\n{players_list}\n\n"
+                f"💡 当你死亡时（非毒死），私聊使用命令：\n"
+                f"  /开枪 编号 - 带走一个人\n"
+                f"示例：/开枪 1"
+            )
+        else:  # villager
+            return (
+                f"👤 平民\n\n"
+                f"你的目标：找出并放逐所有狼人！\n"
+                f"白天投票时使用 /投票 编号 放逐可疑玩家。"
+            )
 
-            # 取消被杀者的临时管理员
-            if room.get("last_killed"):
-                await self._remove_temp_admin(group_id, room["last_killed"], room)
-                # 禁言被杀玩家
-                await self._ban_player(group_id, room["last_killed"], room)
+    async def _send_roles_to_players(self, group_id: str, room: Room) -> List[str]:
+        """主动私聊告知所有玩家的身份
 
-            # 确保全员禁言状态
-            await self._set_group_whole_ban(group_id, room, True)
+        先生成全部消息再有限并发发送，每人的发送耗时和结果记录在 room.role_delivery，
+        失败的玩家会自动重发。返回重发后仍未送达的玩家ID列表
+        """
+        messages = {
+            player_id: f"🎭 游戏开始！你的角色是：\n\n{self._build_role_text(player_id, room)}"
+            for player_id in room.players
+            if room.role_of(player_id)
+        }
+        delivery = room.role_delivery
 
-            # 发送超时提醒
-            if room.get("msg_origin"):
-                timeout_msg = MessageChain().message("⏰ 遗言超时！自动进入下一阶段。")
-                await self.context.send_message(room["msg_origin"], timeout_msg)
-
-            # 检查遗言是否来自投票放逐
-            if room.get("last_words_from_vote"):
-                # 来自投票放逐，进入夜晚
-                room["phase"] = GamePhase.NIGHT_WOLF
-                room["seer_checked"] = False
-                room["is_first_night"] = False  # 第一晚结束
-                room["last_words_from_vote"] = False
-
-                # 开启全员禁言
-                await self._set_group_whole_ban(group_id, room, True)
-                # 启动狼人定时器
-                room["timer_task"] = asyncio.create_task(self._wolf_kill_timeout(group_id))
-
-                # 发送夜晚消息
-                if room.get("msg_origin"):
-                    night_msg = MessageChain().message(
-                        "🌙 夜晚降临，天黑请闭眼...\n\n"
-                        "🐺 狼人请私聊使用：/狼人杀 办掉 编号\n"
-                        "🔮 预言家请等待狼人行动完成\n"
-                        "⏰ 剩余时间：2分钟"
-                    )
-                    await self.context.send_message(room["msg_origin"], night_msg)
-            else:
-                # 来自夜晚被杀，进入发言阶段
-                # 清空遗言相关状态
-                room["last_killed"] = None
-                # 第一晚结束
-                room["is_first_night"] = False
+        async def deliver(player_id: str):
+            started = time.monotonic()
+            try:
+                await room.bot.send_private_msg(
+                    user_id=int(player_id),
+                    message=messages[player_id]
+                )
+                delivery[player_id] = RoleDelivery(True, time.monotonic() - started)
+                self.glog.info(
+                    "身份私聊", group_id, player=player_id, role=lambda: room.role_of(player_id),
+                    latency_ms=lambda: round(delivery[player_id].latency * 1000),
+                )
+            except Exception as e:
+                delivery[player_id] = RoleDelivery(False, time.monotonic() - started)
+                logger.warning(f"[狼人杀] 私聊告知玩家 {player_id} 失败: {e}")
 
-                room["phase"] = GamePhase.DAY_SPEAKING
-                await self._start_speaking_phase(group_id)
+        await self._run_bulk((deliver(player_id) for player_id in messages), limit=self.role_dm_concurrency)
 
-        except asyncio.CancelledError:
-            logger.info(f"[狼人杀] 群 {group_id} 遗言定时器已取消")
-        except Exception as e:
-            logger.error(f"[狼人杀] 遗言超时处理失败: {e}")
+        # 重发失败的玩家（所有人都重发，避免只重发狼人泄露身份）
+        for attempt in range(ROLE_DM_RETRIES):
+            failed = [pid for pid in messages if not delivery[pid].ok]
+            if not failed:
+                break
+            await asyncio.sleep(attempt + 1)
+            await self._run_bulk((deliver(player_id) for player_id in failed), limit=self.role_dm_concurrency)
+
+        # 失败不影响游戏继续，玩家可以手动查看角色
+        undelivered = [pid for pid in messages if not delivery[pid].ok]
+        if undelivered:
+            logger.warning(f"[狼人杀] 群 {group_id} - {len(undelivered)} 名玩家未收到身份私聊: {undelivered}")
+        return sorted(undelivered, key=lambda pid: room.number_of(pid, 999))
+
+    # ========== 规则引擎效果 ==========
+
+    async def _apply_effects(self, group_id: str, room: Room, effects: list):
+        """把规则引擎返回的效果依次翻译成群消息、禁言和定时器"""
+        self._sync_speaking(group_id, room)
+        for effect in effects:
+            if self.game_rooms.get(group_id) is not room:
+                return  # 房间已被清理（游戏结束或被解散）
+            handler = self._effect_handlers.get(type(effect))
+            if handler:
+                with TRACER.span(f"effect.{type(effect).__name__}", room=group_id,
+                                 phase=room.phase.name, round=room.current_round):
+                    await handler(group_id, room, effect)
+
+    def _sync_speaking(self, group_id: str, room: Room):
+        """按房间当前的阶段和发言人更新发言预筛表
+
+        阶段和发言人只在规则引擎里变化，之后都会经过 _apply_effects；
+        新发言人要等 SpeakerTurn 设为临时管理员后才能说话，所以在执行效果之前同步即可
+        """
+        if room.phase == GamePhase.LAST_WORDS:
+            speaker = room.last_killed
+        elif room.phase in (GamePhase.DAY_SPEAKING, GamePhase.DAY_PK):
+            speaker = room.current_speaker
+        else:
+            speaker = None
+        if speaker and self.game_rooms.get(group_id) is room:
+            self.speaking_groups[group_id] = speaker
+        else:
+            self.speaking_groups.pop(group_id, None)
 
-    async def _start_speaking_phase(self, group_id: str):
-        """开始发言阶段"""
-        room = self.game_rooms[group_id]
+    def _post(self, room: Room, text: str):
+        """发群消息（经出站队列合并）"""
+        if room.msg_origin:
+            self.outbox.post(room.msg_origin, MessageChain().message(text))
 
-        # 设置发言顺序（按编号1-9排序）
-        alive_players = list(room["alive"])
-        # 按玩家编号排序
-        alive_players.sort(key=lambda pid: room["player_numbers"].get(pid, 999))
-        room["speaking_order"] = alive_players
-        room["current_speaker_index"] = 0
+    def _dead_role_wait(self) -> float:
+        """已出局的神职也要走一遍流程（避免泄露身份），随机等待一段时间"""
+        return random.uniform(self.timeout_dead_min, self.timeout_dead_max)
 
-        # 确保全群禁言开启
+    async def _on_night_fell(self, group_id: str, room: Room, effect: NightFell):
         await self._set_group_whole_ban(group_id, room, True)
+        prefix = f"📊 {effect.reason}，本轮无人出局！\n\n" if effect.reason else ""
+        self._post(room, prefix + (
+            "🌙 夜晚降临，天黑请闭眼...\n\n"
+            "🐺 狼人请私聊使用：/办掉 编号\n"
+            "🔮 预言家请等待狼人行动完成\n"
+            "⏰ 剩余时间：2分钟"
+        ))
+        self._start_timer(group_id, room, self.timeout_wolf, "狼人办掉", self._wolf_kill_timeout)
+
+    async def _on_wolves_done(self, group_id: str, room: Room, effect: WolvesDone):
+        if effect.timed_out:
+            self._post(room, "⏰ 狼人行动超时！自动进入下一阶段。")
+        head = "🔮 狼人行动完成！" if effect.acted else "🔮 狼人未行动！"
+        self._post(room, f"{head}\n预言家请私聊机器人验人：/验人 编号\n⏰ 剩余时间：2分钟")
+        wait_time = self.timeout_seer if effect.seer_alive else self._dead_role_wait()
+        self._start_timer(group_id, room, wait_time, "预言家验人", self._seer_check_timeout)
+
+    async def _on_seer_timed_out(self, group_id: str, room: Room, effect: SeerTimedOut):
+        # 只有预言家存活时才提示超时
+        if effect.seer_alive:
+            self._post(room, "⏰ 预言家验人超时！")
+
+    async def _on_witch_turn(self, group_id: str, room: Room, effect: WitchTurn):
+        # 在群里发送女巫行动提示（不透露女巫是否存活）
+        self._post(room, "💊 预言家验人完成！\n女巫请私聊机器人行动\n⏰ 剩余时间：2分钟")
+        # 给女巫发私聊告知谁被杀（即使女巫已死也发送，今晚被杀的女巫可以救自己）
+        await self._notify_witch(group_id, effect.witch, room)
+        wait_time = self.timeout_witch if effect.active else self._dead_role_wait()
+        self._start_timer(group_id, room, wait_time, "女巫", self._witch_timeout)
+
+    async def _on_witch_timed_out(self, group_id: str, room: Room, effect: WitchTimedOut):
+        if effect.witch_alive:
+            self._post(room, "⏰ 女巫行动超时！视为不操作。")
+
+    async def _on_dawn(self, group_id: str, room: Room, effect: Dawn):
+        dead = list(dict.fromkeys(pid for pid in (effect.killed, effect.poisoned) if pid))
+        if dead:
+            names = "、".join(self._format_player_name(pid, room) for pid in dead)
+            text = f"☀️ 天亮了！\n\n昨晚，玩家 {names} 死了！\n\n"
+        else:
+            text = "☀️ 天亮了！\n\n昨晚是平安夜，没有人死亡！\n\n"
+        text += f"存活玩家：{len(room.alive)}/{len(room.players)}\n\n"
+        if effect.last_words:
+            text += f"💬 请 {self._format_player_name(effect.last_words, room)} 留遗言...\n"
+        self._post(room, text)
 
-        # 开始第一个人发言
-        await self._next_speaker(group_id)
-
-    async def _next_speaker(self, group_id: str):
-        """切换到下一个发言者"""
-        if group_id not in self.game_rooms:
-            return
-
-        room = self.game_rooms[group_id]
-
-        # 检查是否所有人都发言完毕
-        if room["current_speaker_index"] >= len(room["speaking_order"]):
-            # 所有人发言完毕，进入投票阶段
-            await self._auto_start_vote(group_id)
-            return
-
-        # 获取当前发言者
-        current_speaker = room["speaking_order"][room["current_speaker_index"]]
-        room["current_speaker"] = current_speaker
-
-        # 清空上一个发言者的发言缓存
-        room["current_speech"] = []
-
-        # 设置为临时管理员
-        await self._set_temp_admin(group_id, current_speaker, room)
-
-        # 发送提示消息
-        if room.get("msg_origin"):
-            speaker_name = self._format_player_name(current_speaker, room)
-            msg = MessageChain().at(speaker_name, current_speaker).message(
-                f" 现在轮到你发言\n\n"
-                f"⏰ 发言时间：2分钟\n"
-                f"💡 发言完毕后请使用：/发言完毕\n\n"
-                f"进度：{room['current_speaker_index'] + 1}/{len(room['speaking_order'])}"
-            )
-            await self.context.send_message(room["msg_origin"], msg)
-
-        # 启动发言定时器
-        room["timer_task"] = asyncio.create_task(self._speaking_timeout(group_id))
+    async def _on_silenced(self, group_id: str, room: Room, effect: Silenced):
+        await self._ban_player(group_id, effect.player, room)
 
-    async def _next_pk_speaker(self, group_id: str):
-        """切换到下一个PK发言者"""
-        if group_id not in self.game_rooms:
+    async def _on_hunter_turn(self, group_id: str, room: Room, effect: HunterTurn):
+        by_vote = effect.cause == "vote"
+        try:
+            await room.bot.send_private_msg(user_id=int(effect.hunter), message=(
+                f"💀 {'你被投票放逐了！' if by_vote else '你被狼人办掉了！'}\n\n"
+                f"🔫 你可以选择开枪带走一个人！\n\n"
+                f"请私聊使用命令：\n"
+                f"  /开枪 编号\n"
+                f"示例：/开枪 1\n\n"
+                f"⏰ 限时2分钟"
+            ))
+        except Exception as e:
+            # 猎人收不到提示就无法开枪，视为放弃，继续游戏流程
+            logger.error(f"[狼人杀] 通知猎人 {effect.hunter} 开枪失败: {e}")
+            await self._apply_effects(group_id, room, self.engine.hunter_timeout(room))
             return
 
-        room = self.game_rooms[group_id]
-
-        # 检查是否所有PK玩家都发言完毕
-        if room["current_speaker_index"] >= len(room["pk_players"]):
-            # 所有PK玩家发言完毕，进入二次投票
-            await self._start_pk_vote(group_id)
-            return
+        hunter_name = self._format_player_name(effect.hunter, room)
+        if by_vote:
+            self._post(room, f"⚠️ {hunter_name} 是猎人，可以选择开枪带走一个人...")
+            self._start_timer(group_id, room, self.timeout_hunter, "投票后猎人开枪", self._hunter_shot_timeout_for_vote)
+        else:
+            self._post(room, f"⚠️ {hunter_name} 可以选择开枪带走一个人...")
+            self._start_timer(group_id, room, self.timeout_hunter, "猎人开枪", self._hunter_shot_timeout)
 
-        # 获取当前PK发言者
-        current_speaker = room["pk_players"][room["current_speaker_index"]]
-        room["current_speaker"] = current_speaker
+    async def _on_hunter_shot(self, group_id: str, room: Room, effect: HunterShot):
+        self._post(room, (
+            f"💥 猎人开枪带走了 {self._format_player_name(effect.target, room)}！\n\n"
+            f"剩余存活玩家：{len(room.alive)} 人"
+        ))
 
-        # 清空上一个发言者的发言缓存
-        room["current_speech"] = []
+    async def _on_hunter_timed_out(self, group_id: str, room: Room, effect: HunterTimedOut):
+        self._post(room, f"⏰ {self._format_player_name(effect.hunter, room)} 开枪超时！放弃开枪机会。")
 
-        # 设置为临时管理员
-        await self._set_temp_admin(group_id, current_speaker, room)
+    async def _on_speaker_turn(self, group_id: str, room: Room, effect: SpeakerTurn):
+        # 全员禁言下把发言者设为临时管理员，只有他能说话
+        if effect.index == 0:
+            await self._set_group_whole_ban(group_id, room, True)
+        await self._set_temp_admin(group_id, effect.player, room)
 
-        # 发送提示消息
-        if room.get("msg_origin"):
-            speaker_name = self._format_player_name(current_speaker, room)
-            msg = MessageChain().at(speaker_name, current_speaker).message(
-                f" PK发言：现在轮到你发言\n\n"
+        if effect.phase == GamePhase.LAST_WORDS:
+            prompt = " 现在请你留遗言\n\n⏰ 遗言时间：2分钟\n💡 遗言完毕后请使用：/遗言完毕"
+            label, callback = "遗言", self._last_words_timeout
+        else:
+            pk = effect.phase == GamePhase.DAY_PK
+            prompt = (
+                f" {'PK发言：' if pk else ''}现在轮到你发言\n\n"
                 f"⏰ 发言时间：2分钟\n"
                 f"💡 发言完毕后请使用：/发言完毕\n\n"
-                f"进度：{room['current_speaker_index'] + 1}/{len(room['pk_players'])}"
+                f"进度：{effect.index + 1}/{effect.total}"
             )
-            await self.context.send_message(room["msg_origin"], msg)
-
-        # 启动PK发言定时器
-        room["timer_task"] = asyncio.create_task(self._pk_speaking_timeout(group_id))
-
-    async def _pk_speaking_timeout(self, group_id: str):
-        """PK发言超时处理"""
-        try:
-            await asyncio.sleep(self.timeout_speaking)
-
-            if group_id not in self.game_rooms:
-                return
-
-            room = self.game_rooms[group_id]
-
-            # 检查阶段是否还是PK阶段
-            if room["phase"] != GamePhase.DAY_PK:
-                return
-
-            logger.info(f"[狼人杀] 群 {group_id} PK发言超时")
-
-            # 取消当前发言者的管理员
-            if room.get("current_speaker"):
-                await self._remove_temp_admin(group_id, room["current_speaker"], room)
-
-            # 发送超时提醒
-            if room.get("msg_origin"):
-                speaker_name = self._format_player_name(room["current_speaker"], room)
-                timeout_msg = MessageChain().message(f"⏰ {speaker_name} PK发言超时！自动进入下一位。")
-                await self.context.send_message(room["msg_origin"], timeout_msg)
+            label, callback = ("PK发言", self._pk_speaking_timeout) if pk else ("发言", self._speaking_timeout)
 
-            # 切换到下一个PK发言者
-            room["current_speaker_index"] += 1
-            await self._next_pk_speaker(group_id)
+        if room.msg_origin:
+            speaker_name = self._format_player_name(effect.player, room)
+            self.outbox.post(room.msg_origin, MessageChain().at(speaker_name, effect.player).message(prompt))
+        self._start_timer(group_id, room, self.timeout_speaking, label, callback)
 
-        except asyncio.CancelledError:
-            logger.info(f"[狼人杀] 群 {group_id} PK发言定时器已取消")
-        except Exception as e:
-            logger.error(f"[狼人杀] PK发言超时处理失败: {e}")
-
-    async def _start_pk_vote(self, group_id: str):
-        """启动PK二次投票"""
-        if group_id not in self.game_rooms:
+    async def _on_speaker_done(self, group_id: str, room: Room, effect: SpeakerDone):
+        await self._remove_temp_admin(group_id, effect.player, room)
+        if not effect.timed_out:
             return
-
-        room = self.game_rooms[group_id]
-
-        # 进入投票阶段
-        room["phase"] = GamePhase.DAY_VOTE
-        room["is_pk_vote"] = True  # 标记为PK投票
-        room["day_votes"] = {}
-
-        # 发送投票提示
-        if room.get("msg_origin"):
-            pk_names = [self._format_player_name(pid, room) for pid in room["pk_players"]]
-            msg = MessageChain().message(
+        if effect.phase == GamePhase.LAST_WORDS:
+            self._post(room, "⏰ 遗言超时！自动进入下一阶段。")
+        else:
+            pk = "PK" if effect.phase == GamePhase.DAY_PK else ""
+            self._post(room, f"⏰ {self._format_player_name(effect.player, room)} {pk}发言超时！自动进入下一位。")
+
+    async def _on_tie_break(self, group_id: str, room: Room, effect: TieBreak):
+        self._post(room, (
+            "\n📊 投票结果公布！\n\n"
+            "⚠️ 出现平票！以下玩家票数相同：\n"
+            + "\n".join(f"  • {self._format_player_name(pid, room)}" for pid in effect.players)
+            + "\n\n进入PK环节！\n平票玩家将依次发言（每人2分钟），然后进行二次投票。\n"
+        ))
+
+    async def _on_vote_opened(self, group_id: str, room: Room, effect: VoteOpened):
+        if effect.candidates:
+            self._post(room, (
                 "📢 PK发言完毕！现在开始二次投票\n\n"
                 "⚠️ 只能投给以下平票玩家：\n"
-                + "\n".join([f"  • {name}" for name in pk_names])
+                + "\n".join(f"  • {self._format_player_name(pid, room)}" for pid in effect.candidates)
                 + "\n\n⏰ 投票时间：2分钟\n"
                 + "💡 使用 /投票 编号"
-            )
-            await self.context.send_message(room["msg_origin"], msg)
-
-        # 解除全群禁言（允许投票）
-        await self._set_group_whole_ban(group_id, room, False)
-
-        # 启动投票定时器
-        room["timer_task"] = asyncio.create_task(self._day_vote_timeout(group_id))
-
-    async def _speaking_timeout(self, group_id: str):
-        """发言超时处理"""
-        try:
-            await asyncio.sleep(self.timeout_speaking)
-
-            if group_id not in self.game_rooms:
-                return
-
-            room = self.game_rooms[group_id]
-
-            # 检查阶段是否还是发言阶段
-            if room["phase"] != GamePhase.DAY_SPEAKING:
-                return
-
-            logger.info(f"[狼人杀] 群 {group_id} 发言超时")
-
-            # 取消当前发言者的管理员
-            if room.get("current_speaker"):
-                await self._remove_temp_admin(group_id, room["current_speaker"], room)
-
-            # 发送超时提醒
-            if room.get("msg_origin"):
-                speaker_name = self._format_player_name(room["current_speaker"], room)
-                timeout_msg = MessageChain().message(f"⏰ {speaker_name} 发言超时！自动进入下一位。")
-                await self.context.send_message(room["msg_origin"], timeout_msg)
-
-            # 切换到下一个发言者
-            room["current_speaker_index"] += 1
-            await self._next_speaker(group_id)
-
-        except asyncio.CancelledError:
-            logger.info(f"[狼人杀] 群 {group_id} 发言定时器已取消")
-        except Exception as e:
-            logger.error(f"[狼人杀] 发言超时处理失败: {e}")
-
-    async def _auto_start_vote(self, group_id: str):
-        """自动开始投票阶段"""
-        if group_id not in self.game_rooms:
-            return
-
-        room = self.game_rooms[group_id]
-
-        # 进入投票阶段
-        room["phase"] = GamePhase.DAY_VOTE
-        room["day_votes"] = {}
-
-        # 发送投票开始消息
-        if room.get("msg_origin"):
-            vote_msg = MessageChain().message(
+            ))
+        else:
+            self._post(room, (
                 "📊 发言环节结束！现在进入投票阶段！\n\n"
                 "请所有存活玩家使用命令：\n"
                 "/投票 编号\n\n"
-                f"当前存活人数：{len(room['alive'])}\n"
+                f"当前存活人数：{len(room.alive)}\n"
                 "⏰ 剩余时间：2分钟"
-            )
-            await self.context.send_message(room["msg_origin"], vote_msg)
+            ))
 
-        # 解除全群禁言
+        # 解除全群禁言（允许投票）
         await self._set_group_whole_ban(group_id, room, False)
-
-        # 启动投票定时器
-        room["timer_task"] = asyncio.create_task(self._day_vote_timeout(group_id))
+        self._start_day_vote_timer(group_id, room)
+
+    async def _on_vote_timed_out(self, group_id: str, room: Room, effect: VoteTimedOut):
+        self._post(room, f"⏰ 投票超时！已有 {effect.voted}/{effect.alive} 人投票，自动结算。")
+
+    async def _on_exiled(self, group_id: str, room: Room, effect: Exiled):
+        self._post(room, (
+            f"\n📊 {'PK' if effect.pk else ''}投票结果公布！\n\n"
+            f"玩家 {self._format_player_name(effect.player, room)} 被放逐了！\n\n"
+            f"存活玩家：{len(room.alive)}/{len(room.players)}\n\n"
+        ))
+
+    async def _on_game_over(self, group_id: str, room: Room, effect: GameOver):
+        GAMES_FINISHED.inc(faction=effect.winning_faction)
+        result_text = f"🎉 {effect.message}\n游戏结束！\n\n" + self._get_all_players_roles(room)
+        if room.msg_origin:
+            self.outbox.post(room.msg_origin, MessageChain().message(result_text))
+            # AI复盘交给后台生成，不等它完成就清理房间（解除禁言、恢复群昵称）
+            self._submit_ai_review(group_id, room, effect.winning_faction)
+        await self._cleanup_room(group_id)
 
     def _get_at_user(self, event: AstrMessageEvent) -> str:
         """获取消息中@的第一个用户ID"""
@@ -2119,888 +1672,406 @@ class WerewolfPlugin(Star):
 
         return ""
 
-    async def _process_night_kill(self, group_id: str):
-        """处理夜晚办掉结果（存储到房间，不直接发送）"""
-        room = self.game_rooms[group_id]
-
-        # 统计票数
-        vote_counts = {}
-        for voter, target in room["night_votes"].items():
-            vote_counts[target] = vote_counts.get(target, 0) + 1
+    def _get_target_player(self, event: AstrMessageEvent, room: Room, usage: str) -> tuple:
+        """解析命令中的目标玩家
 
-        # 获取票数最多的目标
-        if not vote_counts:
-            return
-
-        max_votes = max(vote_counts.values())
-        targets = [pid for pid, count in vote_counts.items() if count == max_votes]
-
-        # 如果有平票，随机选择一个
-        killed_player = random.choice(targets)
-
-        # 清空投票记录
-        room["night_votes"] = {}
-
-        # 记录被杀的玩家（注意：不立即移除 alive，等女巫行动后再确定生死）
-        room["last_killed"] = killed_player
-
-        # 记录日志
-        if room.get("last_killed"):
-            killed_name = self._format_player_name(killed_player, room)
-            room["game_log"].append(f"🌙 狼人最终决定刀 {killed_name}")
-        else:
-            room["game_log"].append(f"🌙 狼人未采取行动")
-        # 禁言被杀玩家（暂时不禁言，等遗言完毕后再禁言）
-        # await self._ban_player(group_id, killed_player, room)
-
-        # 进入预言家验人阶段
-        room["phase"] = GamePhase.NIGHT_SEER
-
-        # 注意：全员禁言在女巫行动完成后才解除，确保夜晚行动全程处于禁言状态
-
-        # 构造结果消息并存储（用于女巫查看和最后天亮）
-        if room.get("last_killed"):
-            killed_name = self._format_player_name(killed_player, room)
-            result_text = (
-                f"☀️ 天亮了！\n\n"
-                f"昨晚，玩家 {killed_name} 死了！\n\n"
-                f"存活玩家：{len(room['alive'])}/{len(room['players'])}\n\n"
-            )
-        else:
-            result_text = (
-                f"☀️ 天亮了！\n\n"
-                f"昨晚没有人被杀！\n\n"
-                f"存活玩家：{len(room['alive'])}/{len(room['players'])}\n\n"
-            )
+        返回：(玩家ID, None) 或 (None, 错误提示)
+        """
+        target_str = self._get_target_user(event)
+        if not target_str:
+            return None, usage
+        target_id = self._parse_target(target_str, room)
+        if not target_id:
+            return None, f"❌ 无效的目标：{target_str}\n请使用玩家编号（1-9）"
+        return target_id, None
 
-        # 检查胜利条件
-        victory_msg, winning_faction = self._check_victory_condition(room)
-        if victory_msg:
-            result_text += f"🎉 {victory_msg}\n游戏结束！\n\n"
-            # 公布所有玩家身份
-            result_text += self._get_all_players_roles(room)
-            room["phase"] = GamePhase.FINISHED
-
-            # 立即发送游戏结束消息（不能只存储，因为后续会清理房间）
-            if room.get("msg_origin"):
-                result_message = MessageChain().message(result_text)
-                await self.context.send_message(room["msg_origin"], result_message)
-
-                # 生成AI复盘
-                try:
-                    ai_review = await self._generate_ai_review(room, winning_faction)
-                    if ai_review:
-                        review_msg = MessageChain().message(ai_review)
-                        await self.context.send_message(room["msg_origin"], review_msg)
-                except Exception as e:
-                    logger.error(f"[狼人杀] AI复盘发送失败: {e}")
-
-            # 清理房间
-            await self._cleanup_room(group_id)
-        else:
-            # 存储结果到房间（不包含遗言提示，由后续逻辑决定）
-            room["night_result"] = result_text
+    def _get_role_name(self, role: str) -> str:
+        """获取角色中文名"""
+        role_names = {
+            "werewolf": "狼人 🐺",
+            "seer": "预言家 🔮",
+            "witch": "女巫 💊",
+            "villager": "平民 👤"
+        }
+        return role_names.get(role, "未知")
 
-    async def _process_day_vote(self, group_id: str) -> str:
-        """处理白天投票结果"""
-        room = self.game_rooms[group_id]
+    # ========== 定时器相关函数 ==========
 
-        # === 核心修改：统计票数时排除弃票 ===
-        valid_votes = [t for t in room["day_votes"].values() if t != "ABSTAIN"]
-        abstain_count = len(room["day_votes"]) - len(valid_votes)
+    def _start_timer(self, group_id: str, room: Room, delay: float, label: str,
+                     callback: Callable[[str], Awaitable]):
+        """在共享调度器上登记本房间当前阶段的截止时间（替换之前的定时器）
 
-        # 情况1：如果没有有效票（全员弃票），直接调用辅助函数
-        if not valid_votes:
-            await self._enter_night_without_death(group_id, f"{abstain_count}人弃票")
-            return None
+        到期时执行 await callback(group_id)，异常统一记录为「{label}超时处理失败」
+        """
+        if self.game_rooms.get(group_id) is not room:
+            # 等待消息发送期间房间已被清理（例如另一条命令结束了游戏），不再登记定时器和存档
+            return
+        if room.timer:
+            room.timer.cancel()
+        room.timer = self.timers.schedule(
+            delay, callback, group_id,
+            label=label,
+            on_cancel=lambda: self.glog.info("定时器已取消", group_id, timer=label),
+        )
+        # 每次登记定时器都意味着进入了新阶段（或新的发言人），顺便写入存档
+        self._save_room(group_id, room)
 
-        # 统计有效票数
-        vote_counts = {}
-        for target in valid_votes:
-            vote_counts[target] = vote_counts.get(target, 0) + 1
-
-        # 获取票数最多的目标
-        max_votes = max(vote_counts.values())
-        targets = [pid for pid, count in vote_counts.items() if count == max_votes]
-        # 检查是否平票
-        if len(targets) > 1 and not room.get("is_pk_vote"):
-            # 第一次投票平票，进入PK环节
-            # 按编号排序PK玩家
-            targets.sort(key=lambda pid: room["player_numbers"].get(pid, 999))
-            room["pk_players"] = targets
-            room["phase"] = GamePhase.DAY_PK
-            room["day_votes"] = {}  # 清空投票
-            room["current_speaker_index"] = 0
-
-            # 构造PK提示
-            pk_names = [self._format_player_name(pid, room) for pid in targets]
-            result_text = (
-                f"\n📊 投票结果公布！\n\n"
-                f"⚠️ 出现平票！以下玩家票数相同：\n"
-                + "\n".join([f"  • {name}" for name in pk_names])
-                + f"\n\n进入PK环节！\n平票玩家将依次发言（每人2分钟），然后进行二次投票。\n"
-            )
+    async def _cancel_timer(self, room: Room):
+        """取消当前定时器"""
+        if room.timer:
+            room.timer.cancel()
+        room.timer = None
 
-            # 发送PK提示消息
-            if room.get("msg_origin"):
-                result_message = MessageChain().message(result_text)
-                await self.context.send_message(room["msg_origin"], result_message)
+    # ========== 房间存档相关函数 ==========
 
-            # 开启全群禁言
-            await self._set_group_whole_ban(group_id, room, True)
+    def _save_room(self, group_id: str, room: Room):
+        """写入房间存档（连同当前定时器的回调名和截止时间）
 
-            # 启动第一个PK发言者
-            await self._next_pk_speaker(group_id)
+        已有存档时只写变化的字段和新增的事件，不重复写整个事件日志
+        """
+        data = room.to_dict(events=False)
+        data["timer"] = {
+            "callback": room.timer.callback.__name__,
+            "label": room.timer.label,
+            "deadline": time.time() + room.timer.remaining(),  # 墙上时间，重启后仍有效
+        } if room.timer and room.timer.active else None
+        try:
+            saved = self.journal.get(group_id)
+            saved_events = saved and EventLog.mark_of(saved["events"])
+            if saved_events is None or saved_events > room.events.mark():
+                # 新房间（或同一群的旧存档残留）：写完整记录
+                data["events"] = room.events.to_dict()
+                self.journal.put(group_id, data)
+            else:
+                changes = {name: value for name, value in data.items() if saved.get(name) != value}
+                self.journal.update(group_id, changes, extend={"events": room.events.to_dict(since=saved_events)})
+        except OSError as e:
+            logger.warning(f"[狼人杀] 群 {group_id} 房间存档写入失败: {e}")
 
-            # 返回None，避免调用者重复发送消息
+    def _delete_saved_room(self, group_id: str):
+        """删除房间存档"""
+        try:
+            self.journal.delete(group_id)
+        except OSError as e:
+            logger.warning(f"[狼人杀] 群 {group_id} 房间存档删除失败: {e}")
+
+    def _wrap_bot(self, bot):
+        """平台客户端统一经过限速器，并记录每次调用的耗时和失败"""
+        return RateLimitedBot(bot, self.limiter, on_call=self._observe_adapter_call)
+
+    @staticmethod
+    def _observe_adapter_call(method: str, seconds: float, error: Optional[Exception]):
+        ADAPTER_SECONDS.observe(seconds, method=method)
+        TRACER.record_adapter(seconds)
+        if error is not None:
+            ADAPTER_FAILURES.inc(method=method)
+
+    def _collect_metrics(self):
+        """抓取指标前按当前房间重新统计各阶段的房间数"""
+        ROOMS_BY_PHASE.clear()
+        for phase in GamePhase:
+            ROOMS_BY_PHASE.set(0, phase=phase.name)
+        for room in self.game_rooms.values():
+            ROOMS_BY_PHASE.inc(phase=room.phase.name)
+
+    def _get_platform_bot(self):
+        """重启后没有消息事件可用，从 aiocqhttp 平台适配器获取 bot 客户端（经过限速包装）"""
+        try:
+            platform = self.context.get_platform("aiocqhttp")
+            return self._wrap_bot(platform.get_client()) if platform else None
+        except Exception as e:
+            logger.warning(f"[狼人杀] 获取 aiocqhttp 客户端失败: {e}")
             return None
 
-        # 如果是二次投票仍然平票，本轮无人出局
-        if len(targets) > 1 and room.get("is_pk_vote"):
-            await self._enter_night_without_death(group_id, "PK再次平票")
-            return None
-        # 只有一个人得票最多
-        if len(targets) == 1:
-            exiled_player = targets[0]
-            if room.get("is_pk_vote"):
-                result_text_prefix = "\n📊 PK投票结果公布！\n\n"
+    async def _recover_rooms(self, saved: Dict[str, dict]):
+        """恢复重启前的房间：能继续的按剩余时间重新登记定时器，否则回滚群状态；最后撤销其余群的遗留副作用"""
+        bot = self._get_platform_bot()
+        if bot is None:
+            # 存档保留到下次加载，届时再尝试回滚；这些群不再阻止创建新房间
+            logger.warning(f"[狼人杀] 无法获取 bot 客户端，{len(saved)} 个房间存档和遗留的群管理操作暂不处理")
+            self.pending_recovery.clear()
+            return
+
+        for group_id, data in saved.items():
+            self.pending_recovery.discard(group_id)
+            if group_id in self.game_rooms:
+                # 不应发生（恢复前不能在这些群建房），保险起见不用存档顶替进行中的房间
+                logger.warning(f"[狼人杀] 群 {group_id} 已有进行中的房间，跳过存档恢复")
+                continue
+            try:
+                room = Room.from_dict(data, bot)
+            except (KeyError, TypeError, ValueError) as e:
+                logger.error(f"[狼人杀] 群 {group_id} 房间存档损坏，已丢弃: {e}")
+                self._delete_saved_room(group_id)
+                continue
+
+            self.game_rooms[group_id] = room
+            for player_id in room.players:
+                self.player_rooms[player_id] = group_id
+
+            timer = data.get("timer")
+            if room.phase == GamePhase.WAITING:
+                logger.info(f"[狼人杀] 群 {group_id} 房间已恢复（等待中，{len(room.players)} 人）")
+                self.outbox.post(room.msg_origin, MessageChain().message(
+                    f"♻️ 插件已重启，房间已恢复（{len(room.players)}/{room.config.total}）"
+                ))
+            elif self.resume_games and timer and timer["callback"] in RESUMABLE_TIMEOUTS:
+                remaining = max(1.0, timer["deadline"] - time.time())
+                self._sync_speaking(group_id, room)
+                self._start_timer(group_id, room, remaining, timer["label"], getattr(self, timer["callback"]))
+                logger.info(f"[狼人杀] 群 {group_id} 游戏已恢复：{room.phase.value}，剩余 {remaining:.0f} 秒")
+                self.outbox.post(room.msg_origin, MessageChain().message(
+                    f"♻️ 插件已重启，游戏继续！\n当前阶段：{room.phase.value}\n⏰ 剩余时间：{remaining:.0f}秒"
+                ))
             else:
-                result_text_prefix = "\n📊 投票结果公布！\n\n"
-        else:
-            # 第一次投票平票但不应该走到这里（应该已经在上面进入PK了）
-            # 这是一个异常情况，记录日志
-            logger.error(f"[狼人杀] 异常：非PK投票出现平票，targets={targets}")
-            return ""
-
-        # 重置PK标记
-        room["is_pk_vote"] = False
-        room["pk_players"] = []
-
-        # 移除存活列表
-        room["alive"].discard(exiled_player)
-        room["day_votes"] = {}
-
-        # 记录被放逐的玩家（用于遗言）
-        room["last_killed"] = exiled_player
-
-        exiled_name = self._format_player_name(exiled_player, room)
+                # 已结束、没有进行中的定时器或关闭了恢复：恢复禁言、群昵称等并删除存档
+                await self._cleanup_room(group_id)
+                logger.info(f"[狼人杀] 群 {group_id} 游戏无法继续，已回滚群状态")
+                self.outbox.post(room.msg_origin, MessageChain().message("♻️ 插件已重启，上一局游戏无法继续，已解除禁言并恢复群昵称。"))
 
-        # 记录日志
-        if room.get("is_pk_vote"):
-            room["game_log"].append(f"📊 PK投票结果：{exiled_name} 被放逐")
-        else:
-            room["game_log"].append(f"📊 投票结果：{exiled_name} 被放逐")
+        # 继续进行的游戏保留自己的禁言和群昵称，其余群的遗留操作全部撤销
+        await self._reconcile_side_effects(bot, exclude_groups=self.game_rooms)
 
-        result_text = (
-            result_text_prefix
-            + f"玩家 {exiled_name} 被放逐了！\n\n"
-            + f"存活玩家：{len(room['alive'])}/{len(room['players'])}\n\n"
-        )
+    def _record_effect(self, group_id: str, kind: str, target: str = "", undo: Optional[str] = None):
+        """在台账中登记一项已生效的群管理操作"""
+        try:
+            self.ledger.record(group_id, kind, target, undo)
+        except OSError as e:
+            logger.warning(f"[狼人杀] 群 {group_id} 群管理台账写入失败: {e}")
 
-        # 检查被放逐的是否是猎人
-        if room["roles"].get(exiled_player) == "hunter":
-            # 猎人被放逐，可以开枪
-            room["pending_hunter_shot"] = exiled_player
-            room["hunter_death_type"] = "vote"
+    def _resolve_effect(self, group_id: str, kind: str, target: str = ""):
+        """群管理操作已撤销，从台账中注销"""
+        try:
+            self.ledger.resolve(group_id, kind, target)
+        except OSError as e:
+            logger.warning(f"[狼人杀] 群 {group_id} 群管理台账写入失败: {e}")
 
-            # 发送投票结果消息
-            if room.get("msg_origin"):
-                result_message = MessageChain().message(result_text)
-                await self.context.send_message(room["msg_origin"], result_message)
+    async def _reconcile_side_effects(self, bot, exclude_groups: Iterable[str] = ()):
+        """按台账批量撤销遗留的禁言、全员禁言、临时管理员和群昵称（限制并发）"""
+        effects = self.ledger.outstanding(exclude_groups)
+        if not effects:
+            return
 
-            # 通知猎人开枪
+        async def undo(effect: SideEffect) -> bool:
+            group_id, user_id = int(effect.group_id), int(effect.target or 0)
             try:
-                msg = (
-                    f"💀 你被投票放逐了！\n\n"
-                    f"🔫 你可以选择开枪带走一个人！\n\n"
-                    f"请私聊使用命令：\n"
-                    f"  /开枪 编号\n"
-                    f"示例：/开枪 1\n\n"
-                    f"⏰ 限时2分钟"
-                )
-                await room["bot"].send_private_msg(user_id=int(exiled_player), message=msg)
-
-                # 通知群里猎人可以开枪
-                group_msg = f"⚠️ {exiled_name} 是猎人，可以选择开枪带走一个人..."
-                await self.context.send_message(room["msg_origin"], MessageChain().message(group_msg))
-
-                # 启动猎人开枪定时器（2分钟）
-                room["timer_task"] = asyncio.create_task(self._hunter_shot_timeout_for_vote(group_id, self.timeout_hunter))
-                return None  # 等待猎人开枪
+                if effect.kind == BAN:
+                    await bot.set_group_ban(group_id=group_id, user_id=user_id, duration=0)
+                elif effect.kind == WHOLE_BAN:
+                    await bot.set_group_whole_ban(group_id=group_id, enable=False)
+                elif effect.kind == ADMIN:
+                    await bot.set_group_admin(group_id=group_id, user_id=user_id, enable=False)
+                elif effect.kind == CARD:
+                    await bot.set_group_card(group_id=group_id, user_id=user_id, card=effect.undo or "")
             except Exception as e:
-                logger.error(f"[狼人杀] 通知猎人 {exiled_player} 开枪失败: {e}")
-
-        # 检查胜利条件
-        victory_msg, winning_faction = self._check_victory_condition(room)
-        if victory_msg:
-            result_text += f"🎉 {victory_msg}\n游戏结束！\n\n"
-            # 公布所有玩家身份
-            result_text += self._get_all_players_roles(room)
-            room["phase"] = GamePhase.FINISHED
-
-            # 发送结果消息
-            if room.get("msg_origin"):
-                result_message = MessageChain().message(result_text)
-                await self.context.send_message(room["msg_origin"], result_message)
-
-                # 生成AI复盘
-                try:
-                    ai_review = await self._generate_ai_review(room, winning_faction)
-                    if ai_review:
-                        review_msg = MessageChain().message(ai_review)
-                        await self.context.send_message(room["msg_origin"], review_msg)
-                except Exception as e:
-                    logger.error(f"[狼人杀] AI复盘发送失败: {e}")
-
-            # 清理房间
-            await self._cleanup_room(group_id)
-            return None
-        else:
-            # 被放逐的人留遗言
-            # 进入遗言阶段
-            room["phase"] = GamePhase.LAST_WORDS
-            room["last_words_from_vote"] = True  # 标记遗言来自投票放逐
+                logger.error(f"[狼人杀] 撤销群 {effect.group_id} 遗留操作 {effect.kind} {effect.target} 失败: {e}")
+                return False
+            self._resolve_effect(effect.group_id, effect.kind, effect.target)
+            return True
 
-            # 发送投票结果消息
-            if room.get("msg_origin"):
-                result_message = MessageChain().message(result_text)
-                await self.context.send_message(room["msg_origin"], result_message)
+        results = await self._run_bulk(undo(effect) for effect in effects)
+        undone = sum(1 for ok in results if ok is True)
+        logger.info(f"[狼人杀] 遗留群管理操作对账完成：已撤销 {undone}/{len(effects)} 项")
 
-            # 启动遗言流程
-            await self._start_last_words(group_id)
+    # ========== 出站消息相关函数 ==========
 
-            # 返回None，避免调用者重复发送消息
-            return None
-
-    def _check_victory_condition(self, room: Dict) -> tuple:
-        """检查胜利条件，返回(胜利消息, 胜利阵营)"""
-        # 统计存活的狼人和好人数量
-        alive_werewolves = sum(1 for pid in room["alive"] if room["roles"][pid] == "werewolf")
-        alive_goods = len(room["alive"]) - alive_werewolves
-
-        # 检查神职（预言家、女巫、猎人）是否都死了
-        alive_gods = [pid for pid in room["alive"] if room["roles"][pid] in ["seer", "witch", "hunter"]]
-
-        if alive_werewolves == 0:
-            return ("好人胜利！所有狼人已被放逐！", "villager")
-        elif alive_goods <= alive_werewolves:
-            return ("狼人胜利！好人数量不足！", "werewolf")
-        elif len(alive_gods) == 0 and alive_werewolves > 0:
-            return ("狼人胜利！所有神职人员已出局！", "werewolf")
+    async def _send_merged(self, origin: str, chains: List[MessageChain]):
+        """把同一批的多条群消息合并成一条发送（空行分隔）"""
+        if len(chains) == 1:
+            merged = chains[0]
         else:
-            return ("", None)
-
-
-    def _get_role_name(self, role: str) -> str:
-        """获取角色中文名"""
-        role_names = {
-            "werewolf": "狼人 🐺",
-            "seer": "预言家 🔮",
-            "witch": "女巫 💊",
-            "villager": "平民 👤"
-        }
-        return role_names.get(role, "未知")
-
-    # ========== 定时器相关函数 ==========
-
-    async def _cancel_timer(self, room: Dict):
-        """取消当前定时器"""
-        if room.get("timer_task") and not room["timer_task"].done():
-            room["timer_task"].cancel()
-        room["timer_task"] = None
+            merged = MessageChain()
+            for i, chain in enumerate(chains):
+                if i:
+                    merged.message("\n\n")
+                merged.chain.extend(chain.chain)
+        # 会话标识形如「平台:GroupMessage:群号」，与 bot 调用共用同一个群的令牌桶
+        await self.limiter.acquire(group=origin.rsplit(":", 1)[-1], priority=NORMAL)
+        started = time.perf_counter()
+        try:
+            await self.context.send_message(origin, merged)
+        except Exception as e:
+            self._observe_adapter_call("send_message", time.perf_counter() - started, e)
+            raise
+        self._observe_adapter_call("send_message", time.perf_counter() - started, None)
 
-    async def _enter_night_without_death(self, group_id: str, reason: str):
-        """辅助：无人出局，直接入夜（简化代码用）"""
-        room = self.game_rooms[group_id]
-        
-        # 1. 记录日志与重置状态
-        room["game_log"].append(f"📊 结果：{reason}，本轮无人出局")
-        room["is_pk_vote"] = False
-        room["pk_players"] = []
-        room["day_votes"] = {}
-        
-        # 2. 状态流转到下一夜
-        room["phase"] = GamePhase.NIGHT_WOLF
-        room["seer_checked"] = False
-        room["is_first_night"] = False
-        room["current_round"] += 1
-        
-        # 3. 记录分段日志
-        room["game_log"].extend([LOG_SEPARATOR, f"第{room['current_round']}晚", LOG_SEPARATOR])
-        
-        # 4. 禁言并发送通知
-        await self._set_group_whole_ban(group_id, room, True)
-        if room.get("msg_origin"):
-            msg = MessageChain().message(
-                f"📊 {reason}，本轮无人出局！\n\n"
-                "🌙 夜晚降临，天黑请闭眼...\n"
-                "🐺 狼人请私聊 /办掉 编号\n"
-                "🔮 预言家请等待\n"
-                "⏰ 剩余时间：2分钟"
-            )
-            await self.context.send_message(room["msg_origin"], msg)
-            
-        # 5. 启动定时器
-        room["timer_task"] = asyncio.create_task(self._wolf_kill_timeout(group_id))
-    async def _notify_witch(self, group_id: str, witch_id: str, room: Dict):
+    async def _notify_witch(self, group_id: str, witch_id: str, room: Room):
         """给女巫发私聊告知谁被杀"""
         try:
-            if not room.get("last_killed"):
+            if not room.last_killed:
                 msg = (
                     "💊 女巫行动阶段\n\n"
                     "今晚没有人被杀！\n\n"
-                    f"💊 毒药状态：{'已使用' if room.get('witch_poison_used') else '可用'}\n"
-                    f"💉 解药状态：{'已使用' if room.get('witch_antidote_used') else '可用'}\n\n"
+                    f"💊 毒药状态：{'已使用' if room.witch_poison_used else '可用'}\n"
+                    f"💉 解药状态：{'已使用' if room.witch_antidote_used else '可用'}\n\n"
                     "命令：\n"
                     "  /毒人 编号 - 使用毒药\n"
                     "  /不操作 - 不使用道具"
                 )
             else:
-                killed_name = self._format_player_name(room["last_killed"], room)
+                killed_name = self._format_player_name(room.last_killed, room)
                 msg = (
                     "💊 女巫行动阶段\n\n"
                     f"今晚被杀的是：{killed_name}\n\n"
-                    f"💊 毒药状态：{'已使用' if room.get('witch_poison_used') else '可用'}\n"
-                    f"💉 解药状态：{'已使用' if room.get('witch_antidote_used') else '可用'}\n\n"
+                    f"💊 毒药状态：{'已使用' if room.witch_poison_used else '可用'}\n"
+                    f"💉 解药状态：{'已使用' if room.witch_antidote_used else '可用'}\n\n"
                     "命令：\n"
                     "  /救人 - 使用解药救此人\n"
                     "  /毒人 编号 - 使用毒药\n"
                     "  /不操作 - 不使用道具"
                 )
 
-            await room["bot"].send_private_msg(
+            await room.bot.send_private_msg(
                 user_id=int(witch_id),
                 message=msg
             )
-            logger.info(f"[狼人杀] 已告知女巫 {witch_id} 夜晚信息")
+            self.glog.info("告知女巫夜晚信息", group_id, player=witch_id)
 
         except Exception as e:
             logger.error(f"[狼人杀] 告知女巫 {witch_id} 失败: {e}")
 
-    async def _witch_finish(self, group_id: str):
-        """女巫行动完成，准备天亮"""
-        if group_id not in self.game_rooms:
+    async def _run_timeout(self, group_id: str, step: Callable[[Room], list]):
+        """阶段超时：交给规则引擎结算（阶段已经变化时引擎返回空列表，什么都不做）"""
+        room = self.game_rooms.get(group_id)
+        if not room:
             return
-
-        room = self.game_rooms[group_id]
-
-        # 处理女巫的行动结果
-        # 1. 如果女巫救人，清空被杀记录（被救者本来就还在 alive 中）
-        if room.get("witch_saved"):
-            room["last_killed"] = None  # 清空被杀记录
-        # 2. 如果女巫没救人，被狼杀的人确定死亡
-        elif room.get("last_killed"):
-            room["alive"].discard(room["last_killed"])  # 确定死亡，移除 alive
-
-        # 3. 如果女巫毒人，则被毒的人死亡
-        if room.get("witch_poisoned"):
-            room["alive"].discard(room["witch_poisoned"])
-            # 被毒的人也要禁言
-            await self._ban_player(group_id, room["witch_poisoned"], room)
-
-            # 检查被毒的是否是猎人（被毒不能开枪）
-            if room["roles"].get(room["witch_poisoned"]) == "hunter":
-                room["hunter_death_type"] = "poison"
-
-        # 检查被狼杀的是否是猎人（未被救的情况下）
-        if room.get("last_killed") and not room.get("witch_saved"):
-            if room["roles"].get(room["last_killed"]) == "hunter":
-                room["pending_hunter_shot"] = room["last_killed"]
-                room["hunter_death_type"] = "wolf"
-
-        # 3. 构造天亮消息
-        if room.get("night_result") and room.get("msg_origin"):
-            # 修改原有的天亮消息，加入女巫毒人信息
-
-            if room.get("last_killed"):
-                # 使用原有的被杀消息
-                result_text = room["night_result"]
-
-                # 如果是第一晚且有人死亡，添加遗言提示
-                if room.get("is_first_night") and room.get("last_killed"):
-                    killed_name = self._format_player_name(room["last_killed"], room)
-                    result_text += f"💬 请 {killed_name} 留遗言...\n"
-
-            # 添加毒人信息
-            if room.get("witch_poisoned"):
-                poisoned_name = self._format_player_name(room["witch_poisoned"], room)
-                result_text += (f"\n同时，玩家 {poisoned_name} 死了！\n"
-                                f"存活玩家：{len(room['alive'])}/{len(room['players'])}\n\n")
-                # 注意：被毒者没有遗言
-            
-            # <修改bug>如果没人死(使用解药或者狼人没行动) 并且 没有使用毒药的话 就是平安夜
-            if (not room.get("last_killed") and not room.get("witch_poisoned")):
-                result_text = (
-                    f"☀️ 天亮了！\n\n"
-                    f"昨晚是平安夜，没有人死亡！\n\n"
-                    f"存活玩家：{len(room['alive'])}/{len(room['players'])}\n\n"
-                )
-            
-            # <修改bug>狼人没行动 但是 女巫使用了毒药
-            if (not room.get("last_killed") and room.get("witch_poisoned")):
-                poisoned_name = self._format_player_name(room["witch_poisoned"], room)
-                result_text = (
-                    f"☀️ 天亮了！\n\n"
-                    f"昨晚，玩家 {poisoned_name} 死了！\n\n"
-                    f"存活玩家：{len(room['alive'])}/{len(room['players'])}\n\n"
-                )
-            # 重新检查胜利条件
-            victory_msg, winning_faction = self._check_victory_condition(room)
-            if victory_msg:
-                result_text += f"\n🎉 {victory_msg}\n游戏结束！\n\n"
-                result_text += self._get_all_players_roles(room)
-                room["phase"] = GamePhase.FINISHED
-
-                # 发送结果
-                result_message = MessageChain().message(result_text)
-                await self.context.send_message(room["msg_origin"], result_message)
-
-                # 清理房间
-                await self._cleanup_room(group_id)
-            else:
-                # 游戏继续
-                # 发送天亮消息
-                result_message = MessageChain().message(result_text)
-                await self.context.send_message(room["msg_origin"], result_message)
-
-                # 检查是否有猎人待开枪（被狼杀）
-                if room.get("pending_hunter_shot") and room.get("hunter_death_type") == "wolf":
-                    hunter_id = room["pending_hunter_shot"]
-                    hunter_name = self._format_player_name(hunter_id, room)
-                    try:
-                        msg = (
-                            f"💀 你被狼人办掉了！\n\n"
-                            f"🔫 你可以选择开枪带走一个人！\n\n"
-                            f"请私聊使用命令：\n"
-                            f"  /开枪 编号\n"
-                            f"示例：/开枪 1\n\n"
-                            f"⏰ 限时2分钟"
-                        )
-                        await room["bot"].send_private_msg(user_id=int(hunter_id), message=msg)
-
-                        # 通知群里猎人可以开枪
-                        group_msg = f"⚠️ {hunter_name} 可以选择开枪带走一个人..."
-                        await self.context.send_message(room["msg_origin"], MessageChain().message(group_msg))
-
-                        # 启动猎人开枪定时器（2分钟）
-                        room["timer_task"] = asyncio.create_task(self._hunter_shot_timeout(group_id, self.timeout_hunter))
-                        return  # 等待猎人开枪，暂不继续游戏流程
-                    except Exception as e:
-                        logger.error(f"[狼人杀] 通知猎人 {hunter_id} 开枪失败: {e}")
-
-                # 检查是否第一晚且有人被狼杀（被毒者没有遗言）
-                if room.get("is_first_night") and room.get("last_killed"):
-                    # 第一晚被狼杀有遗言
-                    room["phase"] = GamePhase.LAST_WORDS
-                    await self._start_last_words(group_id)
-                else:
-                    # 其他夜晚没有遗言，或被毒者，直接进入发言阶段
-                    # 禁言死亡的玩家
-                    if room.get("last_killed"):
-                        await self._ban_player(group_id, room["last_killed"], room)
-                    if room.get("witch_poisoned"):
-                        await self._ban_player(group_id, room["witch_poisoned"], room)
-
-                    # 如果是第一晚且没死人（跳过遗言），标记第一晚结束
-                    if room.get("is_first_night"):
-                        room["is_first_night"] = False
-                        room["last_killed"] = None  # 清空遗留的 last_killed
-                        room["witch_poisoned"] = None  # 清空遗留的 witch_poisoned
-
-                    room["phase"] = GamePhase.DAY_SPEAKING
-                    await self._start_speaking_phase(group_id)
-
-            room["night_result"] = None
-
-    async def _witch_timeout(self, group_id: str, wait_time: float = 120):
-        """女巫超时处理"""
-        try:
-            await asyncio.sleep(wait_time)
-
-            if group_id not in self.game_rooms:
-                return
-
-            room = self.game_rooms[group_id]
-
-            # 检查阶段是否还是女巫行动
-            if room["phase"] != GamePhase.NIGHT_WITCH:
-                return
-
-            logger.info(f"[狼人杀] 群 {group_id} 女巫行动阶段超时")
-
-            # 标记女巫已行动（视为不操作）
-            room["witch_acted"] = True
-
-            # 检查女巫是否存活，只有存活时才发送超时提示
-            witch_id = None
-            for pid, r in room["roles"].items():
-                if r == "witch":
-                    witch_id = pid
-                    break
-
-            witch_alive = witch_id and witch_id in room["alive"]
-            if witch_alive and room.get("msg_origin"):
-                # 女巫存活但超时未操作
-                timeout_msg = MessageChain().message("⏰ 女巫行动超时！视为不操作。")
-                await self.context.send_message(room["msg_origin"], timeout_msg)
-
-            # 女巫行动完成，准备天亮
-            await self._witch_finish(group_id)
-
-        except asyncio.CancelledError:
-            logger.info(f"[狼人杀] 群 {group_id} 女巫定时器已取消")
-        except Exception as e:
-            logger.error(f"[狼人杀] 女巫超时处理失败: {e}")
-
-    async def _hunter_shot_timeout(self, group_id: str, wait_time: float = 120):
-        """猎人开枪超时处理"""
-        try:
-            await asyncio.sleep(wait_time)
-
-            if group_id not in self.game_rooms:
-                return
-
-            room = self.game_rooms[group_id]
-
-            # 检查是否还有猎人待开枪
-            if not room.get("pending_hunter_shot"):
-                return
-
-            logger.info(f"[狼人杀] 群 {group_id} 猎人开枪超时")
-
-            # 清除待开枪状态
-            hunter_id = room["pending_hunter_shot"]
-            hunter_name = self._format_player_name(hunter_id, room)
-            room["pending_hunter_shot"] = None
-            room["hunter_shot"] = True  # 标记为已处理
-
-            # 记录日志
-            room["game_log"].append(f"🔫 {hunter_name}（猎人）超时未开枪")
-
-            # 通知群聊
-            if room.get("msg_origin"):
-                timeout_msg = MessageChain().message(f"⏰ {hunter_name} 开枪超时！放弃开枪机会。")
-                await self.context.send_message(room["msg_origin"], timeout_msg)
-
-            # 继续游戏流程
-            if room.get("is_first_night") and room.get("last_killed"):
-                # 第一晚被狼杀有遗言
-                room["phase"] = GamePhase.LAST_WORDS
-                await self._start_last_words(group_id)
-            else:
-                # 其他夜晚没有遗言，或被毒者，直接进入发言阶段
-                # 禁言死亡的玩家
-                if room.get("last_killed"):
-                    await self._ban_player(group_id, room["last_killed"], room)
-                if room.get("witch_poisoned"):
-                    await self._ban_player(group_id, room["witch_poisoned"], room)
-
-                room["phase"] = GamePhase.DAY_SPEAKING
-                await self._start_speaking_phase(group_id)
-
-        except asyncio.CancelledError:
-            logger.info(f"[狼人杀] 群 {group_id} 猎人开枪定时器已取消")
-        except Exception as e:
-            logger.error(f"[狼人杀] 猎人开枪超时处理失败: {e}")
-
-    async def _hunter_shot_timeout_for_vote(self, group_id: str, wait_time: float = 120):
-        """投票后猎人开枪超时处理"""
-        try:
-            await asyncio.sleep(wait_time)
-
-            if group_id not in self.game_rooms:
-                return
-
-            room = self.game_rooms[group_id]
-
-            # 检查是否还有猎人待开枪
-            if not room.get("pending_hunter_shot"):
-                return
-
-            logger.info(f"[狼人杀] 群 {group_id} 投票后猎人开枪超时")
-
-            # 清除待开枪状态
-            hunter_id = room["pending_hunter_shot"]
-            hunter_name = self._format_player_name(hunter_id, room)
-            room["pending_hunter_shot"] = None
-            room["hunter_shot"] = True
-
-            # 记录日志
-            room["game_log"].append(f"🔫 {hunter_name}（猎人）超时未开枪")
-
-            # 通知群聊
-            if room.get("msg_origin"):
-                timeout_msg = MessageChain().message(f"⏰ {hunter_name} 开枪超时！放弃开枪机会。")
-                await self.context.send_message(room["msg_origin"], timeout_msg)
-
-            # 检查胜利条件
-            victory_msg, winning_faction = self._check_victory_condition(room)
-            if victory_msg:
-                result_text = f"🎉 {victory_msg}\n游戏结束！\n\n"
-                result_text += self._get_all_players_roles(room)
-                room["phase"] = GamePhase.FINISHED
-
-                await self.context.send_message(room["msg_origin"], MessageChain().message(result_text))
-                await self._cleanup_room(group_id)
-                return
-
-            # 游戏继续，进入遗言阶段（被放逐的人）
-            room["phase"] = GamePhase.LAST_WORDS
-            room["last_words_from_vote"] = True
-            await self._start_last_words(group_id)
-
-        except asyncio.CancelledError:
-            logger.info(f"[狼人杀] 群 {group_id} 投票后猎人开枪定时器已取消")
-        except Exception as e:
-            logger.error(f"[狼人杀] 投票后猎人开枪超时处理失败: {e}")
+        phase = room.phase
+        with TRACER.span(f"timeout.{step.__name__}", root=True, room=group_id, phase=phase.name,
+                         round=room.current_round):
+            effects = step(room)
+            if effects:
+                self.glog.info("阶段超时", group_id, phase=phase.value)
+                await self._apply_effects(group_id, room, effects)
 
     async def _wolf_kill_timeout(self, group_id: str):
         """狼人办掉超时处理"""
-        try:
-            await asyncio.sleep(self.timeout_wolf)
-
-            if group_id not in self.game_rooms:
-                return
-
-            room = self.game_rooms[group_id]
-
-            # 检查阶段是否还是狼人行动
-            if room["phase"] != GamePhase.NIGHT_WOLF:
-                return
-
-            logger.info(f"[狼人杀] 群 {group_id} 狼人办掉阶段超时")
-
-            # 发送超时提醒
-            if room.get("msg_origin"):
-                timeout_msg = MessageChain().message(f"⏰ 狼人行动超时！自动进入下一阶段。")
-                await self.context.send_message(room["msg_origin"], timeout_msg)
-
-            # 处理投票结果（即使没有全部投票）
-            if room["night_votes"]:
-                # 有投票，处理办掉
-                await self._process_night_kill(group_id)
-
-                # 检查游戏是否结束（_process_night_kill可能会清理房间）
-                if group_id not in self.game_rooms:
-                    return  # 游戏已结束，退出
+        await self._run_timeout(group_id, self.engine.wolf_timeout)
 
-                # 游戏未结束，进入预言家验人阶段
-                room["phase"] = GamePhase.NIGHT_SEER
-                room["seer_checked"] = False
-
-                # 发送预言家验人提示
-                if room.get("msg_origin"):
-                    seer_msg = MessageChain().message("🔮 狼人行动完成！\n预言家请私聊机器人验人：/验人 编号\n⏰ 剩余时间：2分钟")
-                    await self.context.send_message(room["msg_origin"], seer_msg)
-
-                # 启动预言家定时器（如果预言家已死，等待随机时间后自动进入下一阶段）
-                seer_alive = any(r == "seer" and pid in room["alive"] for pid, r in room["roles"].items())
-                if seer_alive:
-                    wait_time = self.timeout_seer
-                else:
-                    wait_time = random.uniform(self.timeout_dead_min, self.timeout_dead_max)
-
-                room["timer_task"] = asyncio.create_task(self._seer_check_timeout(group_id, wait_time))
-            else:
-                # 没有任何投票，跳过狼人行动，直接进入预言家阶段
-                # 记录日志
-                room["game_log"].append("🐺 狼人超时：未投票，今晚无人被刀")
-
-                room["phase"] = GamePhase.NIGHT_SEER
-                room["seer_checked"] = False
-
-                # 发送预言家验人提示
-                if room.get("msg_origin"):
-                    seer_msg = MessageChain().message("🔮 狼人未行动！\n预言家请私聊机器人验人：/验人 编号\n⏰ 剩余时间：2分钟")
-                    await self.context.send_message(room["msg_origin"], seer_msg)
-
-                # 启动预言家定时器
-                seer_alive = any(r == "seer" and pid in room["alive"] for pid, r in room["roles"].items())
-                if seer_alive:
-                    wait_time = self.timeout_seer
-                else:
-                    wait_time = random.uniform(self.timeout_dead_min, self.timeout_dead_max)
-
-                room["timer_task"] = asyncio.create_task(self._seer_check_timeout(group_id, wait_time))
-
-        except asyncio.CancelledError:
-            logger.info(f"[狼人杀] 群 {group_id} 狼人办掉定时器已取消")
-        except Exception as e:
-            logger.error(f"[狼人杀] 狼人办掉超时处理失败: {e}")
-
-    async def _seer_check_timeout(self, group_id: str, wait_time: float = 120):
+    async def _seer_check_timeout(self, group_id: str):
         """预言家验人超时处理"""
-        try:
-            await asyncio.sleep(wait_time)
-
-            if group_id not in self.game_rooms:
-                return
-
-            room = self.game_rooms[group_id]
+        await self._run_timeout(group_id, self.engine.seer_timeout)
 
-            # 检查阶段是否还是预言家验人
-            if room["phase"] != GamePhase.NIGHT_SEER:
-                return
-
-            logger.info(f"[狼人杀] 群 {group_id} 预言家验人阶段超时")
-
-            # 标记预言家已验人（视为未验人，超时）
-            room["seer_checked"] = True
-
-            # 检查预言家是否存活，只有存活时才发送超时提示
-            seer_alive = any(r == "seer" and pid in room["alive"] for pid, r in room["roles"].items())
-            if seer_alive and room.get("msg_origin"):
-                # 预言家存活但超时未验人
-                timeout_msg = MessageChain().message("⏰ 预言家验人超时！")
-                await self.context.send_message(room["msg_origin"], timeout_msg)
-
-            # 进入女巫阶段
-            witch_id = None
-            for pid, r in room["roles"].items():
-                if r == "witch":
-                    witch_id = pid
-                    break
-
-            if witch_id:
-                # 进入女巫行动阶段
-                room["phase"] = GamePhase.NIGHT_WITCH
-                room["witch_acted"] = False
-                room["witch_saved"] = None
-                room["witch_poisoned"] = None
-
-                # 在群里发送女巫行动提示
-                if room.get("msg_origin"):
-                    witch_msg = MessageChain().message("💊 预言家验人完成！\n女巫请私聊机器人行动\n⏰ 剩余时间：2分钟")
-                    await self.context.send_message(room["msg_origin"], witch_msg)
-
-                # 给女巫发私聊
-                await self._notify_witch(group_id, witch_id, room)
-
-                # 启动女巫定时器
-                # 如果女巫被杀了，给足够时间让她救自己
-                # 如果女巫没被杀但已死（前几晚死的），用随机短时间
-                witch_alive = witch_id in room["alive"]
-                witch_is_killed_tonight = (room.get("last_killed") == witch_id)
-
-                if witch_alive or witch_is_killed_tonight:
-                    # 女巫存活，或者女巫今晚被杀（可以救自己）
-                    wait_time = self.timeout_witch
-                else:
-                    # 女巫早已死亡（前几晚死的），随机等待
-                    wait_time = random.uniform(self.timeout_dead_min, self.timeout_dead_max)
+    async def _witch_timeout(self, group_id: str):
+        """女巫超时处理（视为不操作）"""
+        await self._run_timeout(group_id, self.engine.witch_timeout)
 
-                room["timer_task"] = asyncio.create_task(self._witch_timeout(group_id, wait_time))
-        except asyncio.CancelledError:
-            logger.info(f"[狼人杀] 群 {group_id} 预言家验人定时器已取消")
-        except Exception as e:
-            logger.error(f"[狼人杀] 预言家验人超时处理失败: {e}")
+    async def _hunter_shot_timeout(self, group_id: str):
+        """猎人开枪超时处理"""
+        await self._run_timeout(group_id, self.engine.hunter_timeout)
 
-    async def _day_vote_timeout(self, group_id: str):
-        """白天投票超时处理（带30秒提醒）"""
-        try:
-            # 如果总时间超过30秒，先等待到剩余30秒时提醒
-            if self.timeout_vote > 30:
-                await asyncio.sleep(self.timeout_vote - 30)
+    async def _hunter_shot_timeout_for_vote(self, group_id: str):
+        """投票后猎人开枪超时处理"""
+        await self._run_timeout(group_id, self.engine.hunter_timeout)
 
-                if group_id not in self.game_rooms:
-                    return
+    async def _last_words_timeout(self, group_id: str):
+        """遗言超时处理"""
+        await self._run_timeout(group_id, self.engine.last_words_timeout)
 
-                room = self.game_rooms[group_id]
+    async def _speaking_timeout(self, group_id: str):
+        """发言超时处理"""
+        await self._run_timeout(group_id, self.engine.speech_timeout)
 
-                # 检查阶段是否还是投票阶段
-                if room["phase"] != GamePhase.DAY_VOTE:
-                    return
+    async def _pk_speaking_timeout(self, group_id: str):
+        """PK发言超时处理"""
+        await self._run_timeout(group_id, self.engine.speech_timeout)
 
-                # 发送30秒提醒
-                voted_count = len(room["day_votes"])
-                alive_count = len(room["alive"])
+    def _start_day_vote_timer(self, group_id: str, room: Room):
+        """登记白天投票截止时间（总时长超过30秒时先在剩余30秒时提醒）"""
+        if self.timeout_vote > 30:
+            self._start_timer(group_id, room, self.timeout_vote - 30, "白天投票", self._day_vote_reminder)
+        else:
+            self._start_timer(group_id, room, self.timeout_vote, "白天投票", self._day_vote_timeout)
 
-                if room.get("msg_origin"):
-                    reminder_msg = MessageChain().message(
-                        f"⏰ 投票倒计时：还有30秒！\n\n"
-                        f"当前投票进度：{voted_count}/{alive_count}\n"
-                        f"💡 请尚未投票的玩家抓紧时间：/投票 编号"
-                    )
-                    await self.context.send_message(room["msg_origin"], reminder_msg)
+    async def _day_vote_reminder(self, group_id: str):
+        """白天投票剩余30秒提醒"""
+        if group_id not in self.game_rooms:
+            return
 
-                # 继续等待剩余30秒
-                await asyncio.sleep(30)
-            else:
-                # 总时间不足30秒，直接等待全部时间
-                await asyncio.sleep(self.timeout_vote)
+        room = self.game_rooms[group_id]
 
-            if group_id not in self.game_rooms:
-                return
+        # 检查阶段是否还是投票阶段
+        if room.phase != GamePhase.DAY_VOTE:
+            return
 
-            room = self.game_rooms[group_id]
+        # 发送30秒提醒
+        voted_count = len(room.day_votes)
+        alive_count = len(room.alive)
 
-            # 检查阶段是否还是投票阶段
-            if room["phase"] != GamePhase.DAY_VOTE:
-                return
+        if room.msg_origin:
+            reminder_msg = MessageChain().message(
+                f"⏰ 投票倒计时：还有30秒！\n\n"
+                f"当前投票进度：{voted_count}/{alive_count}\n"
+                f"💡 请尚未投票的玩家抓紧时间：/投票 编号"
+            )
+            self.outbox.post(room.msg_origin, reminder_msg)
 
-            logger.info(f"[狼人杀] 群 {group_id} 白天投票阶段超时")
+        # 继续等待剩余30秒
+        self._start_timer(group_id, room, 30, "白天投票", self._day_vote_timeout)
 
-            # 统计投票情况
-            voted_count = len(room["day_votes"])
-            alive_count = len(room["alive"])
+    async def _day_vote_timeout(self, group_id: str):
+        """白天投票超时处理（按已有的票结算，没有人投票则直接入夜）"""
+        await self._run_timeout(group_id, self.engine.vote_timeout)
 
-            # 发送超时提醒
-            if room.get("msg_origin"):
-                timeout_msg = MessageChain().message(f"⏰ 投票超时！已有 {voted_count}/{alive_count} 人投票，自动结算。")
-                await self.context.send_message(room["msg_origin"], timeout_msg)
+    def _submit_ai_review(self, group_id: str, room: Room, winning_faction: str):
+        """把对局快照提交到后台复盘队列"""
+        if not self.enable_ai_review:
+            return
+        record = room.record(group_id, winning_faction)
+        self.last_records[group_id] = (record, room.creator)
+        if not self.review_jobs.submit(record):
+            logger.warning(f"[狼人杀] 群 {group_id} AI复盘队列已满，跳过本局复盘")
 
-            # 处理投票结果
-            if room["day_votes"]:
-                # 有投票，处理放逐
-                result = await self._process_day_vote(group_id)
-                if result and room.get("msg_origin"):
-                    result_message = MessageChain().message(result)
-                    await self.context.send_message(room["msg_origin"], result_message)
-            else:
-                # 没有任何投票，本轮无人出局
-                # 记录日志
-                room["game_log"].append("📊 投票超时：无人投票，本轮无人出局")
-
-                # 进入下一个夜晚
-                room["phase"] = GamePhase.NIGHT_WOLF
-                room["seer_checked"] = False
-                room["is_first_night"] = False  # 第一晚结束
-                room["current_round"] += 1  # 回合数+1
-
-                # 记录日志
-                room["game_log"].append(LOG_SEPARATOR)
-                room["game_log"].append(f"第{room['current_round']}晚")
-                room["game_log"].append(LOG_SEPARATOR)
-
-                # 先开启全员禁言
-                await self._set_group_whole_ban(group_id, room, True)
-
-                # 再发送消息
-                if room.get("msg_origin"):
-                    no_vote_msg = MessageChain().message(
-                        "📊 投票结果：无人投票\n\n"
-                        "本轮无人出局！\n\n"
-                        "🌙 夜晚降临，天黑请闭眼...\n\n"
-                        "🐺 狼人请私聊使用：/狼人杀 办掉 编号\n"
-                        "🔮 预言家请等待狼人行动完成\n"
-                        "⏰ 剩余时间：2分钟"
-                    )
-                    await self.context.send_message(room["msg_origin"], no_vote_msg)
-
-                # 启动狼人定时器
-                room["timer_task"] = asyncio.create_task(self._wolf_kill_timeout(group_id))
-        except asyncio.CancelledError:
-            logger.info(f"[狼人杀] 群 {group_id} 白天投票定时器已取消")
-        except Exception as e:
-            logger.error(f"[狼人杀] 白天投票超时处理失败: {e}")
+    async def _run_ai_review(self, record: GameRecord):
+        """后台 worker：生成复盘并发到原来的群（开启流式时按段落边生成边发送）
 
-    async def _generate_ai_review(self, room: Dict, winning_faction: str) -> str:
-        """生成AI复盘报告"""
+        同一模型、同一提示词、同一局游戏的复盘只生成一次，之后直接从缓存发送
+        """
+        request = self._build_ai_review_request(record)
+        if request is None or not record.msg_origin:
+            return
+        provider, system_prompt, user_prompt = request
+        key = cache_key(self._provider_model_id(provider), system_prompt, user_prompt)
+        cached = self.review_cache.get(key)
+        if cached:
+            logger.info(f"[狼人杀] 群 {record.group_id} AI复盘命中缓存")
+            self.outbox.post(record.msg_origin, MessageChain().message(
+                f"\n\n🤖 AI复盘\n{'='*30}\n{cached}\n{'='*30}"
+            ))
+            return
+
+        review_text = None
+        started = time.perf_counter()
+        mode = "stream"
+        if self.ai_review_stream:
+            review_text = await self._stream_ai_review(record, *request)
+        if review_text is None:
+            mode = "once"
+            review_text = await self._generate_ai_review(*request)
+            if review_text:
+                self.outbox.post(record.msg_origin, MessageChain().message(
+                    f"\n\n🤖 AI复盘\n{'='*30}\n{review_text}\n{'='*30}"
+                ))
+        AI_REVIEW_SECONDS.observe(time.perf_counter() - started, mode=mode)
+        if review_text:
+            try:
+                self.review_cache.put(key, review_text)
+            except OSError as e:
+                logger.error(f"[狼人杀] 写入AI复盘缓存失败: {e}")
+
+    @staticmethod
+    def _provider_model_id(provider) -> str:
+        """缓存键里的模型标识：provider ID + 模型名"""
+        provider_config = getattr(provider, "provider_config", None) or {}
+        get_model = getattr(provider, "get_model", None)
+        return f"{provider_config.get('id', '')}/{get_model() if get_model else ''}"
+
+    def _build_ai_review_request(self, record: GameRecord) -> Optional[tuple]:
+        """选择 provider 并构造提示词，返回 (provider, system_prompt, user_prompt)，无法生成时返回 None"""
         try:
             # 检查是否启用AI复盘
             if not self.enable_ai_review:
                 logger.info("[狼人杀] AI复盘已关闭，跳过生成")
-                return ""
+                return None
 
             # 获取LLM provider
             if self.ai_review_model:
@@ -3015,10 +2086,11 @@ class WerewolfPlugin(Star):
 
             if not provider:
                 logger.warning("[狼人杀] 无法获取LLM provider，跳过AI复盘")
-                return ""
+                return None
 
             # 整理游戏数据
-            game_data = self._format_game_data_for_ai(room, winning_faction)
+            winning_faction = record.winning_faction
+            game_data = self._format_game_data_for_ai(record)
 
             # 构造prompt
             if self.ai_review_prompt:
@@ -3048,6 +2120,15 @@ class WerewolfPlugin(Star):
                 )
                 user_prompt = f"请为以下狼人杀游戏生成复盘报告：\n\n{game_data}"
 
+            return provider, system_prompt, user_prompt
+
+        except Exception as e:
+            logger.error(f"[狼人杀] AI复盘生成失败: {e}")
+            return None
+
+    async def _generate_ai_review(self, provider, system_prompt: str, user_prompt: str) -> str:
+        """生成AI复盘报告（一次性返回正文，失败时返回空字符串）"""
+        try:
             # 调用AI
             response = await provider.text_chat(
                 prompt=user_prompt,
@@ -3055,8 +2136,7 @@ class WerewolfPlugin(Star):
             )
 
             if response.result_chain:
-                review_text = response.result_chain.get_plain_text()
-                return f"\n\n🤖 AI复盘\n{'='*30}\n{review_text}\n{'='*30}"
+                return response.result_chain.get_plain_text()
             else:
                 return ""
 
@@ -3064,13 +2144,65 @@ class WerewolfPlugin(Star):
             logger.error(f"[狼人杀] AI复盘生成失败: {e}")
             return ""
 
-    def _format_game_data_for_ai(self, room: Dict, winning_faction: str) -> str:
+    async def _stream_ai_review(self, record: GameRecord, provider, system_prompt: str,
+                                user_prompt: str) -> Optional[str]:
+        """流式生成复盘，每凑够一段就发到群里，返回完整正文（中途出错时返回空字符串）
+
+        provider 不支持流式（或还没收到任何内容就出错）时返回 None，由调用方改用一次性生成
+        """
+        stream = getattr(provider, "text_chat_stream", None)
+        if stream is None:
+            return None
+
+        chunker = ParagraphChunker()
+        received = False
+        failed = False
+        parts: List[str] = []
+        sent = 0
+
+        def post(text: str):
+            nonlocal sent
+            if sent == 0:
+                text = f"🤖 AI复盘\n{'='*30}\n{text}"
+            self.outbox.post(record.msg_origin, MessageChain().message(text))
+            sent += 1
+
+        try:
+            async for response in stream(prompt=user_prompt, system_prompt=system_prompt):
+                if response.is_chunk:
+                    received = True
+                    parts.append(response.completion_text or "")
+                    for chunk in chunker.feed(response.completion_text or ""):
+                        post(chunk)
+                elif not received:
+                    # 最后一条是完整结果；只返回完整结果的 provider 也按段落切开发送
+                    received = True
+                    parts.append(response.completion_text or "")
+                    for chunk in chunker.feed(response.completion_text or ""):
+                        post(chunk)
+        except NotImplementedError:
+            if not received:
+                return None
+            failed = True
+        except Exception as e:
+            logger.error(f"[狼人杀] AI复盘流式生成失败: {e}")
+            if not received:
+                return None
+            failed = True
+
+        rest = chunker.finish()
+        if rest or sent:
+            post(f"{rest}\n{'='*30}" if rest else "="*30)
+        # 中途出错的复盘不完整，不写入缓存
+        return "" if failed else "".join(parts).strip()
+
+    def _format_game_data_for_ai(self, record: GameRecord) -> str:
         """整理游戏数据为AI可读格式"""
         lines = []
 
         # 基本信息
         lines.append(f"【游戏结果】")
-        faction_name = "狼人" if winning_faction == "werewolf" else "好人"
+        faction_name = "狼人" if record.winning_faction == "werewolf" else "好人"
         lines.append(f"胜利方：{faction_name}")
         lines.append("")
 
@@ -3083,17 +2215,20 @@ class WerewolfPlugin(Star):
             "hunter": "猎人",
             "villager": "村民"
         }
-        for player_id, role in room["roles"].items():
-            player_name = self._format_player_name(player_id, room)
+        for number, name, role in record.players:
             role_name = role_names.get(role, role)
-            lines.append(f"{player_name} - {role_name}")
+            lines.append(f"{number}号.{name} - {role_name}")
         lines.append("")
 
         # 游戏日志
-        if room.get("game_log"):
+        if record.events:
             lines.append(f"【游戏进程】")
-            for log_entry in room["game_log"]:
-                lines.append(log_entry)
+            names = {number: f"{number}号.{name}" for number, name, _ in record.players}
+            # 进程部分的预算要扣掉前面结果和身份占用的 token
+            budget = self.ai_review_token_budget
+            if budget > 0:
+                budget = max(1, budget - estimate_tokens("\n".join(lines)))
+            lines.extend(compact_game_log(record.events, lambda number: names.get(number, "未知"), budget))
             lines.append("")
 
         return "\n".join(lines)
@@ -3101,26 +2236,33 @@ class WerewolfPlugin(Star):
     @filter.event_message_type(filter.EventMessageType.GROUP_MESSAGE)
     async def capture_speech(self, event: AstrMessageEvent):
         """捕获发言阶段和遗言阶段的玩家发言"""
+        # 预筛：所有群消息都会经过这里，不在发言阶段的群、不是当前发言人的消息直接返回
+        if not self.speaking_groups:
+            return
         group_id = event.get_group_id()
-
-        # 检查是否有进行中的游戏
-        if not group_id or group_id not in self.game_rooms:
+        speaker = self.speaking_groups.get(group_id)
+        if speaker is None:
             return
-
-        room = self.game_rooms[group_id]
         player_id = event.get_sender_id()
+        if player_id != speaker:
+            return
+
+        # 以房间的实时状态为准（预筛表在执行效果时才同步）
+        room = self.game_rooms.get(group_id)
+        if room is None:
+            return
 
         # 检查是否在发言阶段（白天发言、PK发言或遗言）
-        if room["phase"] not in [GamePhase.DAY_SPEAKING, GamePhase.DAY_PK, GamePhase.LAST_WORDS]:
+        if room.phase not in [GamePhase.DAY_SPEAKING, GamePhase.DAY_PK, GamePhase.LAST_WORDS]:
             return
 
         # 遗言阶段：检查是否是被杀的玩家
-        if room["phase"] == GamePhase.LAST_WORDS:
-            if room.get("last_killed") != player_id:
+        if room.phase == GamePhase.LAST_WORDS:
+            if room.last_killed != player_id:
                 return
         # 发言阶段：检查是否是当前发言者
         else:
-            if room.get("current_speaker") != player_id:
+            if room.current_speaker != player_id:
                 return
 
         # 获取消息内容
@@ -3130,11 +2272,33 @@ class WerewolfPlugin(Star):
         if message_text.startswith("/"):
             return
 
-        # 记录发言内容
-        if message_text.strip():
-            room["current_speech"].append(message_text)
-            logger.debug(f"[狼人杀] 捕获发言: {self._format_player_name(player_id, room)}: {message_text[:50]}")
+        # 记录发言内容（有条数和字数上限，重复的消息只计数）
+        if room.current_speech.append(message_text):
+            self.glog.debug(
+                "捕获发言", group_id, player=lambda: self._format_player_name(player_id, room),
+                text=lambda: message_text[:50],
+            )
 
     async def terminate(self):
         """插件终止时"""
+        await self.timers.close()
+        await self.review_jobs.close()
+        await self.outbox.close()
+        if not self.resume_games:
+            # 不恢复游戏：立即回滚所有进行中的房间
+            for group_id in list(self.game_rooms):
+                await self._cleanup_room(group_id)
+        # 进行中的游戏（开启恢复时）保留禁言和群昵称，重新加载后继续；其余遗留操作现在撤销
+        bot = self._get_platform_bot()
+        if bot is not None:
+            await self._reconcile_side_effects(bot, exclude_groups=self.game_rooms)
+        await self.limiter.close()
+        REGISTRY.remove_collector(self._collect_metrics)
+        if self.metrics_server:
+            await self.metrics_server.close()
+        if self.trace_exporter:
+            TRACER.configure(None)
+            self.trace_exporter.close()
+        self.journal.close()
+        self.ledger.close()
         logger.info("狼人杀插件已终止")
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# core 包不依赖 AstrBot，测试直接从插件目录导入
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,371 @@
+"""规则引擎单元测试（只用 core，不需要 AstrBot）"""
+import pytest
+
+from core.engine import (
+    Dawn, Exiled, GameEngine, GameOver, HunterShot, HunterTimedOut, HunterTurn, NightFell,
+    RuleViolation, SeerResult, Silenced, SpeakerTurn, TieBreak, VoteOpened, WitchTurn, WolvesDone,
+    check_victory,
+)
+from core.phases import GamePhase
+from core.room import PRESET_CONFIGS, Player, Room, RoomConfig
+
+
+class FirstChoiceRng:
+    """不洗牌、平票时选第一个，并记下每次平票的候选"""
+
+    def __init__(self):
+        self.choices = []
+
+    def shuffle(self, items):
+        pass
+
+    def choice(self, items):
+        self.choices.append(list(items))
+        return items[0]
+
+
+# 9 人标准局：p1-p3 狼人，p4 预言家，p5 女巫，p6 猎人，p7-p9 平民
+STANDARD = ["werewolf"] * 3 + ["seer", "witch", "hunter"] + ["villager"] * 3
+# 5 人局没有女巫：p1-p2 狼人，p3 预言家，p4 猎人，p5 平民
+NO_WITCH = ["werewolf"] * 2 + ["seer", "hunter", "villager"]
+
+
+def start_game(roles, rng=None):
+    """按给定顺序分配身份（p1 起）并进入第一晚"""
+    total = len(roles)
+    room = Room(RoomConfig.from_preset(total, PRESET_CONFIGS[total]), creator="p1", msg_origin=None, bot=None)
+    for index in range(1, total + 1):
+        room.players[f"p{index}"] = Player(f"p{index}", f"玩家{index}")
+    assert sorted(room.config.roles_pool()) == sorted(roles)
+    engine = GameEngine(rng or FirstChoiceRng())
+    engine.start(room)
+    for player, role in zip(room.players.values(), roles):
+        player.role = role
+    room.build_role_index()
+    return engine, room
+
+
+def wolves_kill(engine, room, target):
+    effects = []
+    for wolf in sorted(room.alive_members("werewolf")):
+        effects = engine.wolf_vote(room, wolf, target)
+    return effects
+
+
+def open_vote(engine, room):
+    """跳过白天发言直接进入投票"""
+    room.phase = GamePhase.DAY_SPEAKING
+    room.current_speaker = None
+    return engine.skip_to_vote(room)
+
+
+def vote(engine, room, ballots):
+    """ballots：{投票人: 目标}，目标为 None 表示弃票；返回最后一票的效果"""
+    effects = []
+    for voter, target in ballots.items():
+        effects = engine.day_vote(room, voter, target)
+    return effects
+
+
+def of_type(effects, kind):
+    return [effect for effect in effects if isinstance(effect, kind)]
+
+
+# ========== 狼人 ==========
+
+def test_wolves_resolve_after_every_wolf_voted():
+    engine, room = start_game(STANDARD)
+    assert engine.wolf_vote(room, "p1", "p7") == []
+    assert engine.wolf_vote(room, "p2", "p7") == []
+    effects = engine.wolf_vote(room, "p3", "p8")
+
+    assert effects == [WolvesDone(acted=True, timed_out=False, seer_alive=True)]
+    assert room.last_killed == "p7"
+    assert room.phase == GamePhase.NIGHT_SEER
+    assert room.night_votes == {}
+    assert "p7" in room.alive  # 女巫行动后才确定死亡
+
+
+def test_wolf_tie_is_broken_among_tied_targets():
+    rng = FirstChoiceRng()
+    engine, room = start_game(STANDARD, rng)
+    engine.wolf_vote(room, "p1", "p7")
+    engine.wolf_vote(room, "p2", "p8")
+    engine.wolf_vote(room, "p3", "p9")
+
+    assert sorted(rng.choices[-1]) == ["p7", "p8", "p9"]
+    assert room.last_killed == rng.choices[-1][0]
+
+
+def test_wolf_timeout_without_votes_kills_nobody():
+    engine, room = start_game(STANDARD)
+    effects = engine.wolf_timeout(room)
+
+    assert effects == [WolvesDone(acted=False, timed_out=True, seer_alive=True)]
+    assert room.last_killed is None
+    assert room.phase == GamePhase.NIGHT_SEER
+
+
+def test_only_alive_wolves_in_wolf_phase_may_vote():
+    engine, room = start_game(STANDARD)
+    with pytest.raises(RuleViolation, match="不是狼人"):
+        engine.wolf_vote(room, "p7", "p8")
+    with pytest.raises(RuleViolation, match="不是预言家验人阶段"):
+        engine.seer_check(room, "p4", "p1")
+    room.kill("p1")
+    with pytest.raises(RuleViolation, match="已经出局"):
+        engine.check_actor(room, "p1", "werewolf")
+
+
+# ========== 预言家与女巫 ==========
+
+def test_seer_result_then_witch_turn():
+    engine, room = start_game(STANDARD)
+    wolves_kill(engine, room, "p7")
+    effects = engine.seer_check(room, "p4", "p2")
+
+    assert effects == [SeerResult("p4", "p2", True), WitchTurn("p5", "p7", True)]
+    assert room.phase == GamePhase.NIGHT_WITCH
+    assert room.seer_checked
+
+
+def test_witch_save_means_peaceful_night():
+    engine, room = start_game(STANDARD)
+    wolves_kill(engine, room, "p7")
+    engine.seer_check(room, "p4", "p8")
+    effects = engine.witch_save(room, "p5")
+
+    assert effects[0] == Dawn(killed=None, poisoned=None, last_words=None)
+    assert "p7" in room.alive
+    assert room.witch_antidote_used
+    assert room.phase == GamePhase.DAY_SPEAKING
+    assert of_type(effects, SpeakerTurn)[0].player == "p1"
+
+
+def test_witch_poison_kills_both_and_victim_gets_last_words():
+    engine, room = start_game(STANDARD)
+    wolves_kill(engine, room, "p7")
+    engine.seer_check(room, "p4", "p8")
+    effects = engine.witch_poison(room, "p5", "p1")
+
+    assert effects[:2] == [Dawn(killed="p7", poisoned="p1", last_words="p7"), Silenced("p1")]
+    assert {"p1", "p7"}.isdisjoint(room.alive)
+    assert room.phase == GamePhase.LAST_WORDS
+    assert room.last_killed == "p7"
+
+
+def test_witch_cannot_poison_self_or_act_twice():
+    engine, room = start_game(STANDARD)
+    wolves_kill(engine, room, "p7")
+    engine.seer_check(room, "p4", "p8")
+    with pytest.raises(RuleViolation, match="不能毒自己"):
+        engine.witch_poison(room, "p5", "p5")
+    engine.witch_pass(room, "p5")
+    with pytest.raises(RuleViolation):
+        engine.witch_save(room, "p5")
+
+
+def test_poison_can_only_be_used_once():
+    engine, room = start_game(STANDARD)
+    wolves_kill(engine, room, "p7")
+    engine.seer_check(room, "p4", "p8")
+    engine.witch_poison(room, "p5", "p1")
+
+    # 遗言、跳过发言、投票超时，进入下一晚
+    engine.finish_last_words(room, "p7")
+    engine.skip_to_vote(room)
+    assert engine.vote_timeout(room)[-1] == NightFell("无人投票")
+    wolves_kill(engine, room, "p8")
+    engine.seer_check(room, "p4", "p9")
+    with pytest.raises(RuleViolation, match="毒药已经用过"):
+        engine.witch_poison(room, "p5", "p2")
+
+
+def test_preset_without_witch_goes_straight_to_dawn():
+    engine, room = start_game(NO_WITCH)
+    engine.wolf_timeout(room)
+    effects = engine.seer_check(room, "p3", "p1")
+
+    assert not of_type(effects, WitchTurn)
+    assert of_type(effects, Dawn) == [Dawn(killed=None, poisoned=None, last_words=None)]
+    assert room.phase == GamePhase.DAY_SPEAKING
+
+
+def test_preset_without_witch_first_kill_decides_the_game():
+    # 2 狼对 3 好人，第一晚没有女巫救人就只剩 2 对 2
+    engine, room = start_game(NO_WITCH)
+    wolves_kill(engine, room, "p5")
+    effects = engine.seer_check(room, "p3", "p1")
+
+    assert of_type(effects, Dawn) == [Dawn(killed="p5", poisoned=None, last_words="p5")]
+    assert effects[-1] == GameOver("werewolf", "狼人胜利！好人数量不足！")
+    assert room.phase == GamePhase.FINISHED
+
+
+# ========== 猎人 ==========
+
+def test_hunter_killed_at_night_shoots_then_gives_last_words():
+    engine, room = start_game(STANDARD)
+    wolves_kill(engine, room, "p6")
+    engine.seer_check(room, "p4", "p8")
+    effects = engine.witch_pass(room, "p5")
+
+    assert effects[-1] == HunterTurn("p6", "wolf")
+    assert room.phase == GamePhase.HUNTER_SHOT
+    with pytest.raises(RuleViolation, match="已经出局"):
+        engine.hunter_shoot(room, "p6", "p6")  # 猎人自己已出局
+
+    effects = engine.hunter_shoot(room, "p6", "p1")
+    assert effects[:2] == [HunterShot("p6", "p1"), Silenced("p1")]
+    assert "p1" not in room.alive
+    assert room.pending_hunter_shot is None
+    assert room.phase == GamePhase.LAST_WORDS
+    assert room.last_killed == "p6"
+
+
+def test_hunter_timeout_gives_up_the_shot():
+    engine, room = start_game(STANDARD)
+    wolves_kill(engine, room, "p6")
+    engine.seer_check(room, "p4", "p8")
+    engine.witch_pass(room, "p5")
+    alive = set(room.alive)
+    effects = engine.hunter_timeout(room)
+
+    assert effects[0] == HunterTimedOut("p6")
+    assert room.alive == alive
+    assert room.pending_hunter_shot is None
+    with pytest.raises(RuleViolation, match="当前不能开枪"):
+        engine.hunter_shoot(room, "p6", "p1")
+
+
+def test_poisoned_hunter_cannot_shoot():
+    engine, room = start_game(STANDARD)
+    wolves_kill(engine, room, "p7")
+    engine.seer_check(room, "p4", "p8")
+    effects = engine.witch_poison(room, "p5", "p6")
+
+    assert not of_type(effects, HunterTurn)
+    with pytest.raises(RuleViolation, match="被女巫毒死"):
+        engine.hunter_shoot(room, "p6", "p1")
+
+
+def test_exiled_hunter_shoots_then_gives_last_words():
+    engine, room = start_game(STANDARD)
+    open_vote(engine, room)
+    ballots = {pid: "p6" for pid in sorted(room.alive)}
+    ballots["p6"] = None
+    effects = vote(engine, room, ballots)
+
+    assert effects == [Exiled("p6", False), HunterTurn("p6", "vote")]
+    engine.hunter_shoot(room, "p6", "p2")
+    assert room.phase == GamePhase.LAST_WORDS
+    assert room.last_words_from_vote
+
+
+# ========== 白天投票 ==========
+
+def test_majority_exiles_and_leads_to_last_words():
+    engine, room = start_game(STANDARD)
+    assert open_vote(engine, room) == [VoteOpened(())]
+    effects = vote(engine, room, {pid: "p1" if pid != "p1" else "p7" for pid in sorted(room.alive)})
+
+    assert effects[0] == Exiled("p1", False)
+    assert "p1" not in room.alive
+    assert room.phase == GamePhase.LAST_WORDS
+    assert room.last_words_from_vote
+
+
+def test_tie_goes_to_pk_and_second_tie_exiles_nobody():
+    engine, room = start_game(STANDARD)
+    open_vote(engine, room)
+    ballots = {"p1": "p7", "p2": "p7", "p3": "p7", "p4": "p1", "p5": "p1", "p6": "p1",
+               "p7": None, "p8": None, "p9": None}
+    effects = vote(engine, room, ballots)
+
+    assert effects[0] == TieBreak(("p1", "p7"))
+    assert room.phase == GamePhase.DAY_PK
+    assert effects[1] == SpeakerTurn("p1", GamePhase.DAY_PK, 0, 2)
+
+    assert engine.skip_to_vote(room)[-1] == VoteOpened(("p1", "p7"))
+    with pytest.raises(RuleViolation, match="PK投票只能投给平票玩家"):
+        engine.day_vote(room, "p8", "p9")
+
+    alive = set(room.alive)
+    effects = vote(engine, room, ballots)
+    assert effects == [NightFell("PK再次平票")]
+    assert room.alive == alive
+    assert room.phase == GamePhase.NIGHT_WOLF
+    assert room.current_round == 2
+
+
+def test_pk_vote_exiles_the_leader():
+    engine, room = start_game(STANDARD)
+    open_vote(engine, room)
+    vote(engine, room, {"p1": "p7", "p2": "p7", "p4": "p1", "p5": "p1",
+                        "p3": None, "p6": None, "p7": None, "p8": None, "p9": None})
+    engine.skip_to_vote(room)
+    effects = vote(engine, room, {"p1": "p7", "p2": "p7", "p3": "p7", "p4": "p1",
+                                  "p5": None, "p6": None, "p7": None, "p8": None, "p9": None})
+
+    assert effects[0] == Exiled("p7", True)
+    assert not room.is_pk_vote and room.pk_players == []
+
+
+def test_all_abstain_exiles_nobody():
+    engine, room = start_game(STANDARD)
+    open_vote(engine, room)
+    effects = vote(engine, room, {pid: None for pid in sorted(room.alive)})
+
+    assert effects == [NightFell("9人弃票")]
+    assert len(room.alive) == 9
+
+
+def test_vote_timeout_without_votes_goes_to_night():
+    engine, room = start_game(STANDARD)
+    open_vote(engine, room)
+    effects = engine.vote_timeout(room)
+
+    assert effects[-1] == NightFell("无人投票")
+    assert room.phase == GamePhase.NIGHT_WOLF
+
+
+# ========== 胜负 ==========
+
+def test_no_winner_while_both_sides_stand():
+    _, room = start_game(STANDARD)
+    assert check_victory(room) == ("", None)
+
+
+def test_villagers_win_when_all_wolves_are_out():
+    _, room = start_game(STANDARD)
+    for wolf in ("p1", "p2", "p3"):
+        room.kill(wolf)
+    assert check_victory(room)[1] == "villager"
+
+
+def test_wolves_win_when_goods_are_not_outnumbering_them():
+    _, room = start_game(STANDARD)
+    for player in ("p7", "p8"):
+        room.kill(player)
+    assert check_victory(room) == ("", None)  # 3 狼对 4 好人
+    room.kill("p9")
+    assert check_victory(room) == ("狼人胜利！好人数量不足！", "werewolf")
+
+
+def test_wolves_win_when_all_gods_are_out():
+    _, room = start_game(STANDARD)
+    room.kill("p1")  # 2 狼对 3 平民，人数上好人仍占优
+    for god in ("p4", "p5", "p6"):
+        room.kill(god)
+    assert check_victory(room) == ("狼人胜利！所有神职人员已出局！", "werewolf")
+
+
+def test_exiling_the_last_wolf_ends_the_game():
+    engine, room = start_game(STANDARD)
+    room.kill("p1")
+    room.kill("p2")
+    open_vote(engine, room)
+    effects = vote(engine, room, {pid: "p3" for pid in sorted(room.alive)})
+
+    assert effects[-1] == GameOver("villager", "好人胜利！所有狼人已被放逐！")
+    assert room.phase == GamePhase.FINISHED